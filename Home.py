@@ -1,42 +1,55 @@
+import io
 import streamlit as st
-from openai import OpenAI
-import settings_helper
+import blocklist
+import chat_provider
 import password_manager as pm
 import content_filter as cf
-import time_manager as tm
-from streamlit_local_storage import LocalStorage
+import render_scheduler as rs
+import response_cache
+import chat_history
+import chat_session
+import limit_enforcer
+import metrics
 import uuid
 
-localS = LocalStorage()
-myUuid = localS.getItem('uuid')
+metrics.configure(st.secrets)
+rerun_timer = metrics.span("rerun")
 
+# Once the browser has returned the stored UUID it is kept for the session,
+# so later reruns skip the local-storage component (and its import).
+myUuid = st.session_state.get("household_uuid")
 if not myUuid:
-    myUuid = str(uuid.uuid4())
-    localS.setItem('uuid', myUuid)
+    from streamlit_local_storage import LocalStorage
+    localS = LocalStorage()
+    myUuid = localS.getItem('uuid')
+    if myUuid:
+        st.session_state.household_uuid = myUuid
+    else:
+        myUuid = str(uuid.uuid4())
+        localS.setItem('uuid', myUuid)
 
 # st.write(myUuid)
 
 # --- Load Initial Settings & OpenAI Client ---
-initial_settings = settings_helper.load_settings(myUuid)
-if "OPENAI_API_KEY" not in st.secrets:
+chat = chat_session.get_chat_session(st.session_state, myUuid, st.secrets, response_cache.get_cache())
+if "OPENAI_API_KEY" not in st.secrets and not st.secrets.get("CHAT_PROVIDERS"):
     st.error("OPENAI_API_KEY not found. Please add one to streamlit secrets at `.streamlit/secrets.toml`")
     st.stop()
-try:
-    client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
-except Exception as e:
-    st.error(f"Failed to initialize OpenAI client: {e}")
-    st.stop()
+# The router (and the OpenAI SDK) is only set up when the first prompt needs it.
+router = chat_provider.current_router()
+probe_results = router.probe_results if router is not None else None
+if probe_results and not any(ok for ok, _, _ in probe_results.values()):
+    st.warning("No chat provider responded at startup: " + "; ".join(f"{name}: {error}" for name, (_, _, error) in probe_results.items()))
 
-# --- Session State Initialization ---
-for key, value in initial_settings.items():
-    if key not in st.session_state:
-        st.session_state[key] = value
+def rerun():
+    """Flushes pending settings writes before handing control back to Streamlit."""
+    chat.flush()
+    rerun_timer.stop()
+    st.rerun()
 
 # Transient UI state variables
-if "openai_model" not in st.session_state:
-    st.session_state["openai_model"] = "gpt-3.5-turbo"
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+if "history_window" not in st.session_state:
+    st.session_state.history_window = st.secrets.get("HISTORY_WINDOW", chat_history.DEFAULT_WINDOW)
 if "password_change_mode" not in st.session_state:
     st.session_state.password_change_mode = False
 if "password_verified" not in st.session_state:
@@ -47,82 +60,63 @@ if "time_management_pwd_prompt" not in st.session_state:
     st.session_state.time_management_pwd_prompt = False
 
 # --- Time Management Logic (called on each rerun) ---
-time_state_updates = tm.manage_daily_reset_and_state(
-    st.session_state.time_limit_active,
-    st.session_state.time_used_today_seconds,
-    st.session_state.date_for_time_used,
-    st.session_state.active_session_start_time_iso
-)
-needs_save_after_reset_check = time_state_updates.pop("settings_were_updated_by_reset", False)
-for key, value in time_state_updates.items():
-    st.session_state[key] = value
-if needs_save_after_reset_check:
-    settings_helper.save_settings(st.session_state, myUuid)
-
-total_usage_seconds_today, current_limit_seconds, is_exceeded_now = \
-    tm.calculate_current_usage_and_limit_status(
-        st.session_state.time_limit_active,
-        st.session_state.time_used_today_seconds,
-        st.session_state.active_session_start_time_iso,
-        st.session_state.time_limit_minutes
-    )
+time_ledger = chat.ledger
+total_usage_seconds_today, current_limit_seconds, is_exceeded_now = chat.refresh_time()
 
-if is_exceeded_now != st.session_state.get("time_exceeded_flag", False):
-    st.session_state.time_exceeded_flag = is_exceeded_now
-    if st.session_state.get("time_limit_active") and st.session_state.get("active_session_start_time_iso"):
-        c_t, n_as = tm.commit_session_time(
-            st.session_state.time_used_today_seconds,
-            st.session_state.active_session_start_time_iso
-        )
-        st.session_state.time_used_today_seconds = c_t
-        st.session_state.active_session_start_time_iso = n_as
-    settings_helper.save_settings(st.session_state, myUuid)
+# Re-runs on its own exactly when the remaining time runs out, so an idle tab
+# flips to "limit reached" without polling or waiting for the next interaction.
+seconds_until_limit = current_limit_seconds - total_usage_seconds_today
+@st.fragment(run_every=max(1.0, seconds_until_limit) if st.session_state.time_limit_active and not is_exceeded_now else None)
+def time_limit_status():
+    if chat.check_time_limit():
+        rerun()  # Full rerun so the chat input is disabled
+    if st.session_state.time_exceeded_flag:
+        st.caption("Status: Time limit reached!")
+    else:
+        st.caption("Status: Active")
 
 # --- Sidebar UI ---
 with st.sidebar:
     st.title("🔒 Parental Controls")
-    has_parent_password = bool(st.session_state.get("parent_password_hash"))
+    has_parent_password = chat.has_password
 
     # --- Parent Password Management ---
     st.header("🔑 Parent Password")
+    if has_parent_password and pm.has_admin_session(st.session_state):
+        admin_minutes_left = int(pm.admin_session_remaining(st.session_state) // 60) + 1
+        st.caption(f"Parent session unlocked ({admin_minutes_left} min left).")
+        if st.button("Lock Parent Session", key="lock_admin_session_btn"):
+            pm.end_admin_session(st.session_state)
+            rerun()
     if not has_parent_password:
         new_password = st.text_input("Set initial parent password:", type="password", key="init_pwd_sidebar")
         if st.button("Set Password", key="set_pwd_btn_sidebar"):
-            if pm.set_initial_password(st.session_state, new_password):
-                if st.session_state.get("time_limit_active") and st.session_state.get("active_session_start_time_iso"):
-                    c_t, n_as = tm.commit_session_time(
-                        st.session_state.time_used_today_seconds,
-                        st.session_state.active_session_start_time_iso
-                    )
-                    st.session_state.time_used_today_seconds = c_t
-                    st.session_state.active_session_start_time_iso = n_as
-                settings_helper.save_settings(st.session_state, myUuid)
+            if chat.set_initial_password(new_password):
                 st.success("Password set!")
-                st.rerun()
+                rerun()
             else:
                 st.warning("Password cannot be empty.")
     else:
         if not st.session_state.password_change_mode:
             if st.button("Change Password", key="change_pwd_btn_sidebar"):
                 st.session_state.password_change_mode = True
-                st.session_state.password_verified = False
-                st.rerun()
+                st.session_state.password_verified = pm.has_admin_session(st.session_state)
+                rerun()
         else:
             st.subheader("Change Password")
             if not st.session_state.password_verified:
                 current_pwd = st.text_input("Current password:", type="password", key="verify_curr_pwd_sidebar")
                 vb, cb = st.columns(2)
                 if vb.button("Verify", key="verify_btn_sidebar", use_container_width=True):
-                    if pm.verify_password(st.session_state, current_pwd):
+                    if chat.authorize_admin(current_pwd):
                         st.session_state.password_verified = True
-                        st.session_state.stored_current_pwd = current_pwd  # Store the verified password
                         st.success("Verified!")
-                        st.rerun()
+                        rerun()
                     else:
                         st.error("Incorrect password.")
                 if cb.button("Cancel", key="cancel_verify_sidebar", use_container_width=True):
                     st.session_state.password_change_mode = False
-                    st.rerun()
+                    rerun()
             else:
                 new_pwd = st.text_input("New password:", type="password", key="new_pwd_sidebar")
                 conf_pwd = st.text_input("Confirm new password:", type="password", key="conf_pwd_sidebar")
@@ -131,21 +125,12 @@ with st.sidebar:
                     if not new_pwd:
                         st.warning("New password empty.")
                     elif new_pwd == conf_pwd:
-                        if st.session_state.get("time_limit_active") and st.session_state.get("active_session_start_time_iso"):
-                            c_t, n_as = tm.commit_session_time(
-                                st.session_state.time_used_today_seconds,
-                                st.session_state.active_session_start_time_iso
-                            )
-                            st.session_state.time_used_today_seconds = c_t
-                            st.session_state.active_session_start_time_iso = n_as
-                        # Use stored password from session_state
-                        if pm.change_password(st.session_state, st.session_state.get("stored_current_pwd", ""), new_pwd):
+                        # The admin session from the Verify step authorizes the change
+                        if chat.change_password(new_pwd):
                             st.session_state.password_change_mode = False
                             st.session_state.password_verified = False
-                            st.session_state.stored_current_pwd = None  # Clear stored password
-                            settings_helper.save_settings(st.session_state, myUuid)
                             st.success("Password updated!")
-                            st.rerun()
+                            rerun()
                         else:
                             st.error("Password change failed. Please verify again.")
                     else:
@@ -153,8 +138,7 @@ with st.sidebar:
                 if ucb.button("Cancel", key="cancel_update_sidebar", use_container_width=True):
                     st.session_state.password_change_mode = False
                     st.session_state.password_verified = False
-                    st.session_state.stored_current_pwd = None  # Clear stored password
-                    st.rerun()
+                    rerun()
     st.markdown("---")
 
     # --- Content Filtering Keywords ---
@@ -163,33 +147,56 @@ with st.sidebar:
     if not has_parent_password:
         st.info("Set parent password for keyword locking.")
     kw_display = cf.get_banned_keywords(st.session_state) if not is_keywords_area_disabled else "[Keywords hidden when locked]"
-    edited_kw = st.text_area("Banned Keywords (comma-separated):", value=kw_display, key="kw_ta_sidebar", disabled=is_keywords_area_disabled, help="Unlock to edit.")
+    edited_kw = st.text_area("Banned Keywords (comma-separated):", value=kw_display, key="kw_ta_sidebar", disabled=is_keywords_area_disabled, help="Unlock to edit. Quote a keyword (\"ass\") to match whole words only; * stands for any letters (porn*).")
     if not is_keywords_area_disabled and edited_kw != cf.get_banned_keywords(st.session_state):
-        cf.set_banned_keywords(st.session_state, edited_kw)
+        chat.set_banned_keywords(edited_kw)
+    blocklist_summary = blocklist.household_summary(st.session_state)
+    if blocklist_summary and blocklist_summary.get("missing"):
+        st.warning(f"Blocklist {blocklist_summary['version']} is missing on this server. Import it again.")
+    elif blocklist_summary:
+        st.caption(f"Blocklist: {blocklist_summary['terms']:,} terms in {len(blocklist_summary['categories'])} categories.")
+        categories = list(blocklist_summary["categories"])
+        enabled = st.multiselect("Blocklist categories:", categories, default=blocklist_summary["enabled"],
+                                 key="blocklist_categories_sidebar", disabled=is_keywords_area_disabled)
+        if not enabled:
+            st.caption("Select at least one category, or remove the blocklist.")
+        elif not is_keywords_area_disabled and sorted(enabled) != sorted(blocklist_summary["enabled"]):
+            # Every category selected is stored as "all"
+            chat.set_blocklist(blocklist_summary["version"], [] if len(enabled) == len(categories) else enabled)
+        if not is_keywords_area_disabled and st.button("Remove Blocklist", key="blocklist_remove_btn_sidebar"):
+            chat.set_blocklist(None)
+            rerun()
+    if not is_keywords_area_disabled:
+        uploaded = st.file_uploader("Import blocklist:", type=["txt", "csv", "tsv"], key="blocklist_upload_sidebar",
+                                    help="One or more comma-separated terms per line, in the keyword syntax. [category] lines start a category; '#' starts a comment.")
+        if uploaded is not None and uploaded.file_id != st.session_state.get("blocklist_upload_id"):
+            st.session_state.blocklist_upload_id = uploaded.file_id
+            try:
+                with st.spinner("Building the blocklist index..."):
+                    version, import_stats = blocklist.import_lines(io.TextIOWrapper(uploaded, encoding="utf-8-sig", errors="replace"))
+            except (blocklist.BlocklistError, OSError) as e:
+                st.error(f"Blocklist import failed: {e}")
+            else:
+                chat.set_blocklist(version)
+                st.success(f"Imported {import_stats['unique']:,} terms ({import_stats['duplicates']:,} duplicates skipped).")
+                rerun()
     if has_parent_password:
         if pm.is_keywords_locked(st.session_state):
-            pwd_kw_unlock = st.text_input("Password to edit keywords:", type="password", key="kw_unlock_pwd_sidebar")
+            pwd_kw_unlock = ""
+            if not pm.has_admin_session(st.session_state):
+                pwd_kw_unlock = st.text_input("Password to edit keywords:", type="password", key="kw_unlock_pwd_sidebar")
             if st.button("Unlock Keywords", key="kw_unlock_btn_sidebar"):
-                if pm.unlock_keywords(st.session_state, pwd_kw_unlock):
-                    settings_helper.save_settings(st.session_state, myUuid)
+                if chat.unlock_keywords(pwd_kw_unlock):
                     st.success("Keywords unlocked.")
-                    st.rerun()
+                    rerun()
                 else:
                     st.error("Incorrect password.")
         else:
             st.write("Keyword list is unlocked.")
             if st.button("Save and Lock Keywords", key="kw_lock_btn_sidebar"):
-                if st.session_state.get("time_limit_active") and st.session_state.get("active_session_start_time_iso"):
-                    c_t, n_as = tm.commit_session_time(
-                        st.session_state.time_used_today_seconds,
-                        st.session_state.active_session_start_time_iso
-                    )
-                    st.session_state.time_used_today_seconds = c_t
-                    st.session_state.active_session_start_time_iso = n_as
-                pm.lock_keywords(st.session_state)
-                settings_helper.save_settings(st.session_state, myUuid)
+                chat.lock_keywords()
                 st.success("Keywords saved and locked.")
-                st.rerun()
+                rerun()
     st.markdown("---")
 
     # --- Time Limiter Controls UI ---
@@ -197,13 +204,13 @@ with st.sidebar:
     if not st.session_state.in_time_management_mode and not st.session_state.time_management_pwd_prompt:
         if st.button("Manage Time Limit", key="enter_time_mgmt_btn", disabled=not has_parent_password):
             if has_parent_password:
-                st.session_state.time_management_pwd_prompt = True
-                st.rerun()
+                if pm.has_admin_session(st.session_state):
+                    st.session_state.in_time_management_mode = True
+                else:
+                    st.session_state.time_management_pwd_prompt = True
+                rerun()
         if st.session_state.time_limit_active:
-            if st.session_state.time_exceeded_flag:
-                st.caption("Status: Time limit reached!")
-            else:
-                st.caption("Status: Active")
+            time_limit_status()
         elif not has_parent_password:
             st.caption("Status: Inactive (Set parent password to enable)")
         else:
@@ -214,20 +221,19 @@ with st.sidebar:
         time_mgmt_pwd = st.text_input("Parent Password:", type="password", key="time_mgmt_pwd_input")
         tmpb, tmpcb = st.columns(2)
         if tmpb.button("Access", key="access_time_settings_btn", use_container_width=True):
-            if pm.verify_password(st.session_state, time_mgmt_pwd):
+            if chat.authorize_admin(time_mgmt_pwd):
                 st.session_state.in_time_management_mode = True
                 st.session_state.time_management_pwd_prompt = False
                 st.success("Access granted to time settings.")
-                st.rerun()
+                rerun()
             else:
                 st.error("Incorrect password.")
         if tmpcb.button("Cancel", key="cancel_time_mgmt_pwd_prompt", use_container_width=True):
             st.session_state.time_management_pwd_prompt = False
-            st.rerun()
+            rerun()
 
     if st.session_state.in_time_management_mode:
         st.subheader("Time Limit Settings")
-        prev_time_limit_active = st.session_state.time_limit_active
         new_time_limit_active_ui = st.checkbox("Enable Time Limit", value=st.session_state.time_limit_active, key="edit_timer_active_cb")
         new_time_limit_minutes_ui = st.number_input(
             "Set daily limit (minutes):",
@@ -236,139 +242,148 @@ with st.sidebar:
             step=5,
             key="edit_timer_limit_min_input"
         )
+        st.caption("Last 7 days: " + ", ".join(
+            f"{day.strftime('%a')} {int(seconds // 60)}m" for day, seconds in time_ledger.weekly_history()
+        ))
         if st.button("Reset Daily Timer Usage", key="edit_reset_timer_btn"):
-            st.session_state.time_limit_active = new_time_limit_active_ui
-            st.session_state.time_limit_minutes = new_time_limit_minutes_ui
-            if st.session_state.get("time_limit_active") and st.session_state.get("active_session_start_time_iso"):
-                c_t, n_as = tm.commit_session_time(
-                    st.session_state.time_used_today_seconds,
-                    st.session_state.active_session_start_time_iso
-                )
-                st.session_state.time_used_today_seconds = c_t
-                st.session_state.active_session_start_time_iso = n_as
-            reset_vals = tm.reset_timer_logic(st.session_state.time_limit_active)
-            for k, v in reset_vals.items():
-                st.session_state[k] = v
-            settings_helper.save_settings(st.session_state, myUuid)
+            chat.update_time_limit(new_time_limit_active_ui, new_time_limit_minutes_ui, reset=True)
             st.info("Timer usage reset. Click 'Save and Exit' to apply all changes.")
-            st.rerun()
+            rerun()
 
         st.markdown("---")
         if st.button("Save and Exit Time Management", key="save_exit_time_mgmt_btn"):
-            st.session_state.time_limit_active = new_time_limit_active_ui
-            st.session_state.time_limit_minutes = new_time_limit_minutes_ui
-            if prev_time_limit_active and not st.session_state.time_limit_active:
-                c_t, _ = tm.commit_session_time(
-                    st.session_state.time_used_today_seconds,
-                    st.session_state.active_session_start_time_iso
-                )
-                st.session_state.time_used_today_seconds = c_t
-            settings_helper.save_settings(st.session_state, myUuid)
+            chat.update_time_limit(new_time_limit_active_ui, new_time_limit_minutes_ui)
             st.session_state.in_time_management_mode = False
             st.success("Time settings updated.")
-            st.rerun()
+            rerun()
         if st.button("Cancel Changes", key="cancel_time_mgmt_changes_btn"):
             st.session_state.in_time_management_mode = False
             st.info("Changes discarded.")
-            st.rerun()
+            rerun()
+
+    if st.secrets.get("SHOW_DIAGNOSTICS", False):
+        st.markdown("---")
+        settings_stats = chat.settings.stats()
+        st.caption(f"Settings writes last rerun: {settings_stats['writes_last_run']} (total {settings_stats['total_writes']}, skipped {settings_stats['skipped_writes']}, conflicts {settings_stats['conflicts']}, reruns {settings_stats['runs']})")
+        reply_cache = response_cache.get_cache()
+        if reply_cache is not None:
+            cache_stats = reply_cache.stats()
+            st.caption(f"Response cache hit rate: {cache_stats['hit_rate']:.0%} ({cache_stats['memory_hits']} memory, {cache_stats['disk_hits']} disk, {cache_stats['misses']} misses, {cache_stats['memory_entries']} cached)")
+        session_stats = chat.stats()
+        latency = f", avg {session_stats['api_seconds_avg']:.2f}s, first token {session_stats['ttft_seconds_avg'] or 0:.2f}s" if session_stats["api_calls"] else ""
+        st.caption(f"This session: {session_stats['reruns']} reruns, {session_stats['replies']} replies ({session_stats['filtered_replies']} filtered), {session_stats['api_calls']} API calls ({session_stats['api_errors']} failed{latency})")
+        for name, provider_stats in (router.stats() if router is not None else {}).items():
+            if provider_stats["requests"]:
+                st.caption(f"Provider {name}: first token p50 {provider_stats['ttft_p50'] or 0:.2f}s, p99 {provider_stats['ttft_p99'] or 0:.2f}s ({provider_stats['requests']} requests, {provider_stats['errors']} errors, {provider_stats['timeouts']} timeouts, {provider_stats['hedges']} hedges)")
+        if chat.preflight:
+            preflight = chat_session.preflight_stats()
+            st.caption(f"Pre-flight filter: {chat.api_calls_avoided} API calls avoided this session ({preflight['api_calls_avoided']} of {preflight['prompts_checked']} prompts in this process, ~{preflight['prompt_tokens_avoided']} prompt tokens)")
 
 # --- Display Chat History ---
 num_messages = len(st.session_state.messages)
-for i, message in enumerate(st.session_state.messages):
-    with st.chat_message(message["role"]):
-        if message.get("is_filtered"):
-            if message.get("is_revealed"):
-                st.markdown(f"**Original Content (Revealed):**\n{message.get('original_content', '')}")
-            else:
-                st.markdown(message["content"])
-                if has_parent_password and i == num_messages - 1:
-                    st.markdown("---")
-                    pwd_rev = st.text_input("Parent Password to Reveal:", type="password", key=f"main_pwd_rev_{i}")
-                    if st.button("Reveal Original", key=f"main_btn_rev_{i}"):
-                        if pm.verify_password(st.session_state, pwd_rev):
-                            st.session_state.messages[i]["is_revealed"] = True
-                            st.success("Revealed.")
-                            st.rerun()
-                        else:
-                            st.error("Incorrect password.")
-        else:
-            st.markdown(message["content"])
+first_visible = chat_history.visible_start(num_messages, st.session_state.history_window)
+if first_visible:
+    if st.button(f"Load earlier messages ({first_visible} hidden)", key="load_earlier_history_btn"):
+        st.session_state.history_window += chat_history.PAGE_SIZE
+        rerun()
+history_timer = metrics.span("history_render")
+for i in range(first_visible, num_messages):
+    message = st.session_state.messages[i]
+    with st.chat_message(message.role):
+        st.markdown(chat_history.message_markdown(message))
+        # The latest turn's filtered reply, or its prompt if the pre-flight filter stopped it
+        if message.is_filtered and not message.is_revealed and \
+           has_parent_password and i >= num_messages - 2:
+            st.markdown("---")
+            pwd_rev = ""
+            if not pm.has_admin_session(st.session_state):
+                pwd_rev = st.text_input("Parent Password to Reveal:", type="password", key=f"main_pwd_rev_{i}")
+            if st.button("Reveal Original", key=f"main_btn_rev_{i}"):
+                if chat.reveal(i, pwd_rev):
+                    st.success("Revealed.")
+                    rerun()
+                else:
+                    st.error("Incorrect password.")
 
-        if message["role"] == "assistant" and i == num_messages - 1 and \
+        if message.role == "assistant" and i == num_messages - 1 and \
            st.session_state.time_limit_active and \
            not st.session_state.get("time_exceeded_flag", False) and \
-           not message["content"].startswith("Time limit reached"):
-            live_total_usage, _, _ = tm.calculate_current_usage_and_limit_status(
-                st.session_state.time_limit_active,
-                st.session_state.time_used_today_seconds,
-                st.session_state.active_session_start_time_iso,
-                st.session_state.time_limit_minutes
-            )
+           not message.content.startswith("Time limit reached"):
+            live_total_usage = time_ledger.used_today()
             used_m, used_s = divmod(int(live_total_usage), 60)
             limit_m = st.session_state.time_limit_minutes
             st.caption(f"⏱️ Time used: {used_m}m {used_s}s / {limit_m}m")
 
+history_timer.stop()
+
 # --- Handle New User Input & Assistant Response ---
-chat_input_disabled = st.session_state.get("time_exceeded_flag", False)
-if chat_input_disabled:
-    if not st.session_state.messages or not st.session_state.messages[-1]["content"].startswith("Time limit reached"):
-        st.session_state.messages.append({
-            "role": "assistant",
-            "content": "Time limit reached. Chat disabled.",
-            "is_filtered": False,
-            "original_content": None,
-            "is_revealed": False
-        })
-        st.rerun()
+chat_input_disabled = chat.time_limit_reached
+if chat.note_time_limit():
+    rerun()
 
 if prompt := st.chat_input("Ask the assistant...", disabled=chat_input_disabled, key="main_chat_input_area"):
-    st.session_state.messages.append({"role": "user", "content": prompt, "is_filtered": False, "original_content": None, "is_revealed": False})
+    turn = chat.start_reply(prompt)
+    if turn.blocked:
+        rerun()  # Refused before any API call; the history shows the filtered prompt and the refusal
     with st.chat_message("user"):
         st.markdown(prompt)
     with st.chat_message("assistant"):
         msg_placeholder = st.empty()
-        full_res = ""
+        renderer = rs.RenderScheduler(
+            msg_placeholder,
+            interval_ms=st.secrets.get("RENDER_INTERVAL_MS", rs.DEFAULT_INTERVAL_MS),
+            min_chars=st.secrets.get("RENDER_MIN_CHARS", rs.DEFAULT_MIN_CHARS)
+        )
         try:
-            api_msgs = []
-            for m_val in st.session_state.messages:
-                if m_val["role"] == "assistant" and m_val["content"].startswith("Time limit reached"):
-                    continue
-                role, content = m_val["role"], m_val.get("content", "")
-                if role == "assistant" and m_val.get("is_filtered") and m_val.get("is_revealed"):
-                    content = m_val.get("original_content") or content
-                elif role == "assistant" and m_val.get("is_filtered") and not m_val.get("is_revealed"):
-                    continue
-                if role and isinstance(content, str) and content:
-                    api_msgs.append({"role": role, "content": content})
-            if not api_msgs:
+            if not turn.api_messages:
                 msg_placeholder.markdown("No messages to send.")
             else:
-                stream = client.chat.completions.create(model=st.session_state.openai_model, messages=api_msgs, stream=True)
-                for chunk in stream:
-                    if chunk.choices[0].delta.content:
-                        full_res += chunk.choices[0].delta.content
-                        msg_placeholder.markdown(full_res + "▌")
-                f_res, was_f = cf.filter_content(full_res, cf.get_banned_keywords(st.session_state))
-                msg_placeholder.markdown(f_res)
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": f_res,
-                    "is_filtered": was_f,
-                    "original_content": full_res if was_f else None,
-                    "is_revealed": False
-                })
-                if was_f or (st.session_state.time_limit_active and not st.session_state.get("time_exceeded_flag", False)):
-                    st.rerun()
+                stream = None
+                if turn.cached_reply is not None:
+                    deltas = response_cache.replay_chunks(turn.cached_reply)
+                else:
+                    stream = deltas = chat_provider.stream_sync(chat_provider.get_router(), turn.api_messages, turn.model)
+                cutoff = None
+                if turn.seconds_left is not None:
+                    # Close the stream from the process-wide timer thread the moment the limit is crossed
+                    cutoff = limit_enforcer.get_scheduler().call_later(
+                        turn.seconds_left,
+                        stream.close if stream is not None else (lambda: None)
+                    )
+                try:
+                    for delta in deltas:
+                        if cutoff is not None and cutoff.fired:
+                            break
+                        released = turn.feed(delta)
+                        if turn.stopped:
+                            if stream is not None:
+                                stream.close()  # Stop paying for a reply that will be filtered anyway
+                            break
+                        renderer.append(released)
+                except Exception:
+                    if cutoff is None or not cutoff.fired:
+                        raise
+                finally:
+                    if cutoff is not None:
+                        cutoff.cancel()
+                    if stream is not None:
+                        # Also when Streamlit stops the script mid-reply (new input, closed tab), so the
+                        # background loop does not keep reading a reply nobody will see
+                        stream.close()
+                if cutoff is not None and cutoff.fired:
+                    turn.stop_for_time_limit()
+                f_res, was_f = turn.finish()
+                renderer.close(f_res)
+                if was_f or turn.cut_off or (st.session_state.time_limit_active and not chat.time_limit_reached):
+                    rerun()
         except Exception as e:
-            st.error(f"API error: {e}")
-            err_m = f"Error: {e}"
-            st.session_state.messages.append({
-                "role": "assistant",
-                "content": err_m,
-                "is_filtered": False,
-                "original_content": None,
-                "is_revealed": False
-            })
+            if st.secrets.get("SHOW_DIAGNOSTICS", False):
+                st.caption(f"Provider error: {e}")
+            err_m = turn.fail(e)
             msg_placeholder.error(err_m)
-            if st.session_state.time_limit_active and not st.session_state.get("time_exceeded_flag", False):
-                st.rerun()
\ No newline at end of file
+            if st.session_state.time_limit_active and not chat.time_limit_reached:
+                rerun()
+
+# --- Persist any settings changed during this run ---
+chat.flush()
+rerun_timer.stop()
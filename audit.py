@@ -0,0 +1,246 @@
+# audit.py
+"""
+Batch audit of stored transcripts and household settings.
+
+Re-runs banned keyword lists over past conversations and reports matches per
+keyword, per household and per day, plus which households have a time limit
+active or exceeded today. Transcripts are streamed line by line and the
+matching is spread over a process pool.
+
+    python audit.py                                # each household's own keywords and blocklist
+    python audit.py --keywords '"ass", porn*'      # one list for every household
+    python audit.py --workers 8 --since 2026-01-01 --json report.json
+"""
+import argparse
+import collections
+import datetime
+import glob
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+
+import blocklist
+import settings_helper
+import time_manager as tm
+import transcript
+
+SPLIT_BYTES = 8 * 1024 * 1024  # Transcripts larger than this are scanned in ranges by several workers
+TOP_HOUSEHOLDS = 20
+
+
+def _day(ts):
+    return datetime.date.fromtimestamp(ts).isoformat() if ts else "unknown"
+
+
+def scan_range(task):
+    """
+    Scans one byte range of a transcript file. Returns (uuid, messages,
+    matched messages, {keyword: messages}, {day: matched messages}).
+    """
+    uuid, path, start, end, (banned_keywords, blocklist_version, categories), since = task
+    # Blocklist indexes are memory-mapped, so every worker shares one copy of a large list.
+    matcher = blocklist.get_matcher(banned_keywords, blocklist_version, categories)
+    messages = matched = 0
+    per_keyword = collections.Counter()
+    per_day = collections.Counter()
+    with open(path, "rb") as f:
+        if start:
+            f.seek(start - 1)
+            f.readline()  # Finish the line that straddles the range start; its owner is the previous range
+        while f.tell() < end:
+            line = f.readline()
+            if not line.endswith(b"\n"):
+                break  # Torn final line from an interrupted write
+            if line.startswith(b'{"op":'):
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # A line an older version glued to a torn write; nothing to audit in it
+            day = _day(record.get("ts"))
+            if since and day < since:
+                continue
+            messages += 1
+            if not matcher:
+                continue
+            # A filtered reply is stored as the filter notice; audit what the model actually said.
+            text = record.get("original_content") or record.get("content") or ""
+            keywords = {kw for kw, _, _ in matcher.iter_matches(text)}
+            if keywords:
+                matched += 1
+                per_keyword.update(keywords)
+                per_day[day] += 1
+    return uuid, messages, matched, per_keyword, per_day
+
+
+def iter_settings(settings_path=None):
+    """Streams (uuid, settings) for every stored household from the SQLite database and/or JSON files."""
+    db_path = settings_path or settings_helper.SETTINGS_DB_PATH
+    seen = set()
+    if os.path.isfile(db_path):
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            current, settings = None, {}
+            for uuid, key, value in conn.execute("SELECT uuid, key, value FROM settings ORDER BY uuid"):
+                if uuid != current:
+                    if current is not None:
+                        seen.add(current)
+                        yield current, settings
+                    current, settings = uuid, {}
+                if key != settings_helper.VERSION_KEY:
+                    settings[key] = json.loads(value)
+            if current is not None:
+                seen.add(current)
+                yield current, settings
+        finally:
+            conn.close()
+    directory = os.path.dirname(db_path) or "."
+    for settings_file in glob.iglob(os.path.join(directory, "app_settings_*.json")):
+        uuid = os.path.basename(settings_file)[len("app_settings_"):-len(".json")]
+        if uuid in seen:
+            continue  # Already migrated to the database
+        try:
+            with open(settings_file, "r") as f:
+                settings = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Skipping unreadable {settings_file}: {e}", file=sys.stderr)
+            continue
+        settings.pop(settings_helper.VERSION_KEY, None)
+        yield uuid, settings
+
+
+def timer_status(uuid, settings):
+    """Returns the household's timer row, or None if no time limit is active."""
+    defaults = settings_helper.get_default_settings()
+    for key, value in defaults.items():
+        settings.setdefault(key, value)
+    if not settings.get("time_limit_active"):
+        return None
+    ledger = tm.TimeLedger.from_settings(settings)
+    used, limit_seconds, exceeded = ledger.limit_status(True, settings.get("time_limit_minutes") or 0)
+    return {"uuid": uuid, "used_seconds": int(used), "limit_seconds": int(limit_seconds), "exceeded": exceeded}
+
+
+def build_tasks(transcript_dir, keywords_for, since):
+    """Yields one scan task per transcript, or per SPLIT_BYTES range of a large one."""
+    for path in glob.iglob(os.path.join(transcript_dir, "*.jsonl")):
+        uuid = os.path.basename(path)[:-len(".jsonl")]
+        size = os.path.getsize(path)
+        keywords = keywords_for(uuid)
+        for start in range(0, max(size, 1), SPLIT_BYTES):
+            yield uuid, path, start, min(size, start + SPLIT_BYTES), keywords, since
+
+
+def run_audit(transcript_dir=None, settings_path=None, keywords=None, workers=None, since=None, chunksize=16):
+    """Runs the audit and returns the report dict."""
+    started = time.perf_counter()
+    household_keywords = {}
+    timers = []
+    households_with_settings = 0
+    for uuid, settings in iter_settings(settings_path):
+        households_with_settings += 1
+        household_keywords[uuid] = (
+            settings.get("banned_keywords") or "", settings.get("blocklist"), tuple(settings.get("blocklist_categories") or ())
+        )
+        row = timer_status(uuid, settings)
+        if row is not None:
+            timers.append(row)
+
+    # Per household: (typed keywords, blocklist version, enabled blocklist categories)
+    keywords_for = (lambda uuid: (keywords, None, ())) if keywords is not None else (lambda uuid: household_keywords.get(uuid, ("", None, ())))
+    tasks = build_tasks(transcript_dir or transcript.TRANSCRIPT_DIR, keywords_for, since)
+
+    per_keyword = collections.Counter()
+    keyword_households = collections.defaultdict(set)
+    per_day = collections.Counter()
+    per_household = collections.defaultdict(lambda: [0, 0])
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        results = map(scan_range, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap_unordered(scan_range, tasks, chunksize)
+    try:
+        for uuid, messages, matched, kw_counts, day_counts in results:
+            per_household[uuid][0] += messages
+            per_household[uuid][1] += matched
+            per_keyword.update(kw_counts)
+            for kw in kw_counts:
+                keyword_households[kw].add(uuid)
+            per_day.update(day_counts)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    elapsed = time.perf_counter() - started
+    total_messages = sum(m for m, _ in per_household.values())
+    return {
+        "elapsed_seconds": round(elapsed, 3),
+        "workers": workers,
+        "households": len(set(per_household) | set(household_keywords)),
+        "households_with_settings": households_with_settings,
+        "messages": total_messages,
+        "matched_messages": sum(m for _, m in per_household.values()),
+        "keywords": [
+            {"keyword": kw, "messages": count, "households": len(keyword_households[kw])}
+            for kw, count in per_keyword.most_common()
+        ],
+        "households_matched": [
+            {"uuid": uuid, "messages": messages, "matched": matched}
+            for uuid, (messages, matched) in sorted(per_household.items(), key=lambda item: -item[1][1])
+            if matched
+        ],
+        "days": [{"day": day, "matched": count} for day, count in sorted(per_day.items())],
+        "timers_active": len(timers),
+        "timers_exceeded": sum(1 for row in timers if row["exceeded"]),
+        "timers": sorted(timers, key=lambda row: -row["used_seconds"]),
+    }
+
+
+def print_report(report, out=sys.stdout):
+    rate = report["messages"] / report["elapsed_seconds"] if report["elapsed_seconds"] else 0
+    print(f"Audited {report['messages']} messages from {report['households']} households "
+          f"in {report['elapsed_seconds']:.2f}s ({rate:.0f} messages/s, {report['workers']} workers)", file=out)
+    print(f"{report['matched_messages']} messages matched a banned keyword.", file=out)
+    if report["keywords"]:
+        print("\nMatches per keyword:", file=out)
+        print(f"  {'keyword':<30} {'messages':>9} {'households':>11}", file=out)
+        for row in report["keywords"]:
+            print(f"  {row['keyword']:<30} {row['messages']:>9} {row['households']:>11}", file=out)
+    if report["households_matched"]:
+        print(f"\nHouseholds with matches (top {TOP_HOUSEHOLDS}):", file=out)
+        for row in report["households_matched"][:TOP_HOUSEHOLDS]:
+            print(f"  {row['uuid']:<38} {row['matched']:>6} of {row['messages']} messages", file=out)
+    if report["days"]:
+        print("\nMatches per day:", file=out)
+        for row in report["days"]:
+            print(f"  {row['day']:<12} {row['matched']:>6}", file=out)
+    print(f"\nTime limits: {report['timers_active']} active, {report['timers_exceeded']} over the limit today.", file=out)
+    for row in report["timers"]:
+        if row["exceeded"]:
+            print(f"  {row['uuid']:<38} {row['used_seconds'] // 60:>4}m used of {row['limit_seconds'] // 60}m", file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audit stored transcripts and household settings.")
+    parser.add_argument("--transcripts", default=transcript.TRANSCRIPT_DIR, help="Transcript directory (default: TRANSCRIPT_DIR)")
+    parser.add_argument("--settings", default=None, help="Settings database; JSON settings files next to it are read too")
+    parser.add_argument("--keywords", default=None, help="Comma-separated keywords to use for every household instead of their own lists")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--since", default=None, help="Only messages on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--json", default=None, help="Also write the full report as JSON to this path")
+    args = parser.parse_args()
+    report = run_audit(args.transcripts, args.settings, args.keywords, args.workers, args.since)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
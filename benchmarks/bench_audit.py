@@ -0,0 +1,96 @@
+"""
+Throughput of audit.py on a synthetic corpus: households with a transcript
+each and JSON settings files, some with a time limit active or exceeded.
+Runs the audit with 1, 2, 4, ... workers up to the CPU count and checks that
+every run produces the same report.
+
+Run from the repository root with `python benchmarks/bench_audit.py`
+(the defaults generate 100k messages; `--households`/`--messages` resize it).
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audit
+
+KEYWORDS = 'violence, "ass", porn*, gambling, drugs'
+MATCHING_WORDS = ["violence", "ass", "pornography", "gamb1ing", "DRUGS", "vіolence"]
+
+
+def generate(directory, households, messages, rng):
+    transcript_dir = os.path.join(directory, "transcripts")
+    os.makedirs(transcript_dir)
+    vocabulary = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 9))) for _ in range(5000)]
+    now = time.time()
+    today = datetime.date.today().isoformat()
+    for h in range(households):
+        uuid = f"household-{h:06d}"
+        with open(os.path.join(transcript_dir, f"{uuid}.jsonl"), "w") as f:
+            for m in range(messages):
+                words = rng.choices(vocabulary, k=rng.randint(10, 120))
+                if rng.random() < 0.02:
+                    words[rng.randrange(len(words))] = rng.choice(MATCHING_WORDS)
+                record = {
+                    "role": "user" if m % 2 == 0 else "assistant",
+                    "content": " ".join(words),
+                    "ts": round(now - rng.randint(0, 30 * 86400), 3),
+                }
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        active = rng.random() < 0.3
+        settings = {
+            "banned_keywords": KEYWORDS,
+            "time_limit_active": active,
+            "time_limit_minutes": 60,
+            "time_used_today_seconds": rng.randint(0, 5400) if active else 0,
+            "date_for_time_used": today,
+        }
+        with open(os.path.join(directory, f"app_settings_{uuid}.json"), "w") as f:
+            json.dump(settings, f)
+    return transcript_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="audit.py scaling benchmark.")
+    parser.add_argument("--households", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=50, help="Messages per household")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        transcript_dir = generate(directory, args.households, args.messages, random.Random(3))
+        total = args.households * args.messages
+        print(f"Generated {total} messages in {args.households} households in {time.perf_counter() - started:.1f}s")
+        settings_path = os.path.join(directory, "app_settings.sqlite3")  # Absent: only the JSON files are read
+
+        worker_counts = []
+        workers = 1
+        while workers <= args.max_workers:
+            worker_counts.append(workers)
+            workers *= 2
+        if worker_counts[-1] != args.max_workers:
+            worker_counts.append(args.max_workers)
+
+        print(f"{'workers':>7} {'seconds':>8} {'messages/s':>11} {'speedup':>8} {'matched':>8} {'over limit':>11}")
+        baseline = reference = None
+        for workers in worker_counts:
+            report = audit.run_audit(transcript_dir, settings_path, workers=workers)
+            seconds = report["elapsed_seconds"]
+            baseline = baseline or seconds
+            summary = (report["keywords"], report["days"], report["timers_exceeded"])
+            assert reference is None or summary == reference, "reports differ between worker counts"
+            reference = summary
+            print(f"{workers:>7} {seconds:>8.2f} {report['messages'] / seconds:>11.0f} {baseline / seconds:>7.2f}x "
+                  f"{report['matched_messages']:>8} {report['timers_exceeded']:>11}")
+
+
+if __name__ == "__main__":
+    main()
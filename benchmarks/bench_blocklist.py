@@ -0,0 +1,122 @@
+"""
+Cost of a large blocklist: importing and compiling it once, then, in a
+fresh process each, getting a usable matcher either by parsing the terms
+(content_filter.KeywordMatcher, what a typed keyword string costs) or by
+memory-mapping the compiled index (blocklist.open_index), with the memory
+each process gains and the time to scan a 4 KB reply.
+
+Run from the repository root with `python benchmarks/bench_blocklist.py`
+(`--terms 100000` for a bigger list).
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import string
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import blocklist
+import content_filter as cf
+
+CATEGORIES = ("violence", "drugs", "gambling", "adult", "slang")
+SCANS = 20
+
+
+def _term(rng):
+    word = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 12)))
+    roll = rng.random()
+    if roll < 0.02:
+        return f'"{word}"'
+    if roll < 0.04:
+        return word + "*"
+    return word
+
+
+def write_list(path, terms, seed=1):
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        for category in CATEGORIES:
+            f.write(f"[{category}]\n")
+            for _ in range(terms // len(CATEGORIES)):
+                f.write(_term(rng) + "\n")
+
+
+def reply_text(seed=2):
+    rng = random.Random(seed)
+    return " ".join("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 9))) for _ in range(700))[:4096]
+
+
+def rss_mb():
+    """Current resident memory (mapped index pages included) where /proc exists, else the peak."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(mode, list_path, directory, version):
+    """Runs in a fresh interpreter: builds or maps the matcher and reports time, memory and scan speed."""
+    before = rss_mb()
+    start = time.perf_counter()
+    if mode == "parse":
+        with open(list_path) as f:
+            terms = [line.strip() for line in f if line.strip() and not line.startswith("[")]
+        matcher = cf.KeywordMatcher(terms)
+    else:
+        matcher = blocklist.BlocklistMatcher(blocklist.open_index(version, directory))
+    ready = time.perf_counter() - start
+    text = reply_text()
+    start = time.perf_counter()
+    for _ in range(SCANS):
+        matcher.search(text)
+    scan = (time.perf_counter() - start) / SCANS
+    print(json.dumps({"ready_seconds": ready, "scan_seconds": scan, "rss_mb": rss_mb() - before}))
+
+
+def run_child(mode, list_path, directory, version):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", mode, list_path, directory, version],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--terms", type=int, default=50000)
+    parser.add_argument("--child", nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        list_path = os.path.join(directory, "list.txt")
+        write_list(list_path, args.terms)
+        blocklist_import = blocklist.BlocklistImport()
+        start = time.perf_counter()
+        blocklist_import.read_file(list_path)
+        read_seconds = time.perf_counter() - start
+        version = blocklist_import.build(directory)
+        build_seconds = time.perf_counter() - start - read_seconds
+        size = os.path.getsize(blocklist.index_path(version, directory))
+        stats = blocklist_import.stats()
+        print(f"{stats['unique']} unique terms ({stats['duplicates']} duplicates) in {len(CATEGORIES)} categories")
+        print(f"read {read_seconds:.2f}s  compile+write {build_seconds:.2f}s  index {size / 1e6:.1f} MB")
+        print(f"{'per process':<22} {'ready':>10} {'memory':>10} {'4KB scan':>10}")
+        for mode, label in (("parse", "parse terms"), ("mmap", "map compiled index")):
+            result = run_child(mode, list_path, directory, version)
+            print(f"{label:<22} {result['ready_seconds'] * 1000:>8.1f}ms {result['rss_mb']:>8.1f}MB "
+                  f"{result['scan_seconds'] * 1000:>8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Per-rerun time of Home.py with long chat histories, rendering the whole
+history (HISTORY_WINDOW = 0, the old behavior) versus the default window.
+
+Drives the app headlessly with streamlit's AppTest against the local stub
+server. Run from the repository root with
+`python benchmarks/bench_chat_history.py`.
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from streamlit.testing.v1 import AppTest
+
+import chat_history
+import transcript
+from stub_openai_server import StubServer
+
+HISTORY_SIZES = [50, 500, 5_000]
+RERUNS = 5
+
+
+def make_messages(count):
+    messages = []
+    for i in range(count):
+        role = "user" if i % 2 == 0 else "assistant"
+        content = f"Message {i}: " + "some *markdown* text with a [link](https://example.com) " * 4
+        messages.append(transcript.Message(role, content))
+    return messages
+
+
+def time_reruns(base_url, messages, window):
+    app = AppTest.from_file(os.path.join(REPO_DIR, "Home.py"), default_timeout=120)
+    app.secrets["OPENAI_API_KEY"] = "sk-stub"
+    app.secrets["OPENAI_BASE_URL"] = base_url
+    app.secrets["HISTORY_WINDOW"] = window
+    app.session_state["storage_init"] = {"uuid": "bench-chat-history"}  # Skip the browser local-storage round-trip
+    app.session_state["messages"] = messages
+    app.run()
+    samples = []
+    for _ in range(RERUNS):
+        start = time.perf_counter()
+        app.run()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    os.chdir(tempfile.mkdtemp(prefix="bench_chat_history_"))
+    with StubServer() as server:
+        print(f"{'messages':>9} {'full history ms':>16} {'windowed ms':>12}")
+        for count in HISTORY_SIZES:
+            messages = make_messages(count)
+            full = time_reruns(server.base_url, list(messages), 0)
+            windowed = time_reruns(server.base_url, list(messages), chat_history.DEFAULT_WINDOW)
+            print(f"{count:>9} {full:>16.1f} {windowed:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
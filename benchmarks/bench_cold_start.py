@@ -0,0 +1,120 @@
+"""
+Cold start of the Streamlit app: what importing Home.py's modules costs on
+top of streamlit itself (from `python -X importtime`), and the time to first
+paint, i.e. Home.py's first script run in a fresh process, for a new
+session and for a child whose time limit is already used up.
+
+Every measurement runs in its own interpreter, so nothing is warm. Run
+from the repository root with `python benchmarks/bench_cold_start.py`.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+# What Home.py imports; streamlit is loaded by the server before any script runs.
+APP_IMPORTS = ("import io, uuid, blocklist, chat_provider, password_manager, content_filter, render_scheduler, "
+               "response_cache, chat_history, chat_session, limit_enforcer, metrics")
+WATCHED = ("openai", "httpx", "werkzeug", "werkzeug.security", "streamlit_local_storage", "http.server",
+           "chat_provider", "chat_session", "password_manager", "settings_helper", "openai_client", "metrics")
+RUNS = 5
+
+# Stored in a separate process first, so the measured one has imported nothing of the app.
+LIMIT_REACHED_SCRIPT = """
+import settings_helper
+settings = settings_helper.get_default_settings()
+settings.update({"parent_password_hash": "x", "keywords_locked": True, "time_limit_active": True,
+                 "time_limit_minutes": 5, "time_used_today_seconds": 3600, "time_exceeded_flag": True})
+settings_helper.save_settings(settings, "limit-reached")
+"""
+
+PAINT_SCRIPT = """
+import json, sys, time
+sys.path.insert(0, {bench_dir!r})
+from stub_openai_server import StubConfig, StubServer
+household = {household!r}
+from streamlit.testing.v1 import AppTest
+with StubServer(StubConfig(tokens=5)) as server:
+    at = AppTest.from_file({home!r}, default_timeout=60)
+    at.secrets["OPENAI_API_KEY"] = "sk-bench"
+    at.secrets["OPENAI_BASE_URL"] = server.base_url
+    at.session_state["storage_init"] = {{"uuid": household}}
+    modules = set(sys.modules)
+    start = time.perf_counter()
+    at.run()
+    paint = time.perf_counter() - start
+    assert not at.exception, at.exception
+    loaded = sorted(m for m in {watched!r} if m in sys.modules and m not in modules)
+    print(json.dumps({{"paint_seconds": paint, "loaded": loaded}}))
+"""
+
+
+def import_profile():
+    """Cumulative import microseconds per watched module and in total, for Home.py's imports after streamlit."""
+    code = f"import streamlit, streamlit.components.v1; import sys; sys.stderr.write('--app--\\n'); {APP_IMPORTS}"
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=REPO_DIR,
+                            capture_output=True, text=True, check=True).stderr
+    app = stderr.split("--app--\n", 1)[1]
+    cumulative = {}
+    total = 0
+    for line in app.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        if not self_us.isdigit():
+            continue  # The header line
+        total += int(self_us)
+        if name in WATCHED:
+            cumulative[name] = int(cumulative_us)
+    return total, cumulative
+
+
+def first_paint(household):
+    with tempfile.TemporaryDirectory() as directory:
+        script = PAINT_SCRIPT.format(bench_dir=BENCH_DIR, household=household, home=os.path.join(REPO_DIR, "Home.py"),
+                                     watched=WATCHED)
+        env = dict(os.environ, PYTHONPATH=REPO_DIR)
+        if household == "limit-reached":
+            subprocess.run([sys.executable, "-c", LIMIT_REACHED_SCRIPT], cwd=directory, env=env, capture_output=True, check=True)
+        output = subprocess.run([sys.executable, "-c", script], cwd=directory, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=RUNS)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    totals, modules = [], {}
+    for _ in range(args.runs):
+        total, cumulative = import_profile()
+        totals.append(total)
+        for name, us in cumulative.items():
+            modules.setdefault(name, []).append(us)
+    results = {"app_import_ms": statistics.median(totals) / 1000,
+               "modules_ms": {name: statistics.median(us) / 1000 for name, us in modules.items()}}
+    print(f"Home.py imports after streamlit: {results['app_import_ms']:.1f} ms (median of {args.runs})")
+    for name, ms in sorted(results["modules_ms"].items(), key=lambda item: -item[1]):
+        print(f"  {name:<26} {ms:>7.1f} ms cumulative")
+
+    for household in ("new-session", "limit-reached"):
+        runs = [first_paint(household) for _ in range(args.runs)]
+        paint = statistics.median(run["paint_seconds"] for run in runs)
+        results[f"first_paint_ms[{household}]"] = paint * 1000
+        print(f"First paint, {household:<14} {paint * 1000:>7.0f} ms  loaded: {', '.join(runs[-1]['loaded']) or '-'}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
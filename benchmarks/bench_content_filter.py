@@ -0,0 +1,66 @@
+"""
+Throughput of content_filter.filter_content for growing keyword lists.
+
+Run from the repository root with `python benchmarks/bench_content_filter.py`.
+"""
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import content_filter as cf
+
+KEYWORD_COUNTS = [10, 1_000, 50_000]
+RESPONSE_CHARS = 4_000
+ROUNDS = 20
+
+
+def random_keywords(count, rng):
+    return ", ".join(
+        "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(8, 14)))
+        for _ in range(count)
+    )
+
+
+def random_response(rng):
+    words = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 9))) for _ in range(RESPONSE_CHARS // 5)]
+    return " ".join(words)[:RESPONSE_CHARS]
+
+
+def legacy_filter_content(content, banned_keywords):
+    banned_list = [kw.strip() for kw in banned_keywords.split(',') if kw.strip()]
+    for kw in banned_list:
+        if kw.lower() in content.lower():
+            return cf.FILTERED_MESSAGE, True
+    return content, False
+
+
+def measure(fn, text, keywords):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn(text, keywords)
+    elapsed = time.perf_counter() - start
+    return ROUNDS * len(text) / elapsed / 1e6
+
+
+def main():
+    rng = random.Random(42)
+    response = random_response(rng)
+    print(f"{'keywords':>10} {'build ms':>10} {'legacy MB/s':>12} {'compiled MB/s':>14} {'find_all MB/s':>14}")
+    for count in KEYWORD_COUNTS:
+        keywords = random_keywords(count, rng)
+        cf.invalidate_matcher(keywords)
+        start = time.perf_counter()
+        cf.get_matcher(keywords)
+        build_ms = (time.perf_counter() - start) * 1000
+        legacy = measure(legacy_filter_content, response, keywords)
+        compiled = measure(cf.filter_content, response, keywords)
+        find_all = measure(cf.find_banned_keywords, response, keywords)
+        print(f"{count:>10} {build_ms:>10.1f} {legacy:>12.2f} {compiled:>14.2f} {find_all:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
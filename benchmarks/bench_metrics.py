@@ -0,0 +1,57 @@
+"""
+Overhead of metrics spans and counters with metrics disabled (the no-op
+mode) and enabled, per call, next to an empty loop.
+
+Run from the repository root with `python benchmarks/bench_metrics.py`.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+
+CALLS = 1_000_000
+
+
+def ns_per_call(fn):
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) / CALLS * 1e9
+
+
+def empty_loop():
+    for _ in range(CALLS):
+        pass
+
+
+def spans():
+    span = metrics.span
+    for _ in range(CALLS):
+        with span("bench"):
+            pass
+
+
+def counters():
+    inc = metrics.inc
+    for _ in range(CALLS):
+        inc("bench_total")
+
+
+def main():
+    baseline = ns_per_call(empty_loop)
+    print(f"{'':<20} {'span ns':>8} {'inc ns':>8}")
+    for on in (False, True):
+        metrics.enable(on)
+        metrics.reset()
+        span_ns = ns_per_call(spans) - baseline
+        inc_ns = ns_per_call(counters) - baseline
+        print(f"{'enabled' if on else 'disabled (no-op)':<20} {span_ns:>8.0f} {inc_ns:>8.0f}")
+    snapshot = metrics.snapshot()
+    assert snapshot["histograms"]["bench_seconds"]["count"] == CALLS
+    assert snapshot["counters"]["bench_total"] == CALLS
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Time to first token against the local stub server, comparing a new OpenAI
+client per request (the old Home.py behavior) with the pooled client a
+chat_provider.Provider keeps for the whole process (built by
+openai_client.build_async_client and warmed by ChatRouter.probe).
+
+Run from the repository root with `python benchmarks/bench_openai_client.py`.
+The stub speaks plain HTTP, so TLS handshakes (the largest saving against the
+real API) are not part of these numbers.
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from openai import AsyncOpenAI
+
+import chat_provider
+import openai_client
+from stub_openai_server import StubConfig, StubServer
+
+REQUESTS = 50
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+async def time_to_first_token(client):
+    start = time.perf_counter()
+    ttft = None
+    async for _ in openai_client.stream_deltas(client, "stub-model", MESSAGES):
+        if ttft is None:
+            ttft = time.perf_counter() - start
+    return ttft
+
+
+async def per_request_client(base_url):
+    samples = []
+    for _ in range(REQUESTS):
+        start = time.perf_counter()
+        client = AsyncOpenAI(api_key="sk-stub", base_url=base_url)
+        construct = time.perf_counter() - start
+        samples.append(construct + await time_to_first_token(client))
+        await client.close()
+    return samples
+
+
+async def pooled_client(base_url):
+    provider = chat_provider.Provider("stub", "sk-stub", base_url)
+    await chat_provider.ChatRouter([provider]).probe()
+    samples = [await time_to_first_token(provider.client()) for _ in range(REQUESTS)]
+    await provider.client().close()
+    return samples
+
+
+def report(label, samples):
+    samples = sorted(s * 1000 for s in samples)
+    p50 = statistics.median(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{label:<22} p50 {p50:7.2f} ms   p99 {p99:7.2f} ms")
+
+
+def main():
+    with StubServer(StubConfig(tokens=20)) as server:
+        report("client per request", asyncio.run(per_request_client(server.base_url)))
+        report("pooled provider client", asyncio.run(pooled_client(server.base_url)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Verify latency of werkzeug password hashes for candidate PASSWORD_HASH_METHOD
+settings, and of an admin-session check that replaces repeat verifications.
+
+Run from the repository root with `python benchmarks/bench_password_hash.py`.
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import password_manager as pm
+
+METHODS = [
+    "scrypt",  # werkzeug default: n=2**15, r=8, p=1
+    "scrypt:16384:8:1",
+    "scrypt:8192:8:1",
+    "pbkdf2:sha256:1000000",
+    "pbkdf2:sha256:600000",
+    "pbkdf2:sha256:100000",
+]
+ROUNDS = 10
+
+
+def median_ms(fn, rounds=ROUNDS):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    print(f"{'method':<24} {'verify ms':>10}")
+    for method in METHODS:
+        password_hash = generate_password_hash("correct horse", method=method)
+        print(f"{method:<24} {median_ms(lambda: check_password_hash(password_hash, 'correct horse')):>10.2f}")
+
+    session_state = {"parent_password_hash": generate_password_hash("correct horse", method=pm.PASSWORD_HASH_METHOD)}
+    state = type("State", (dict,), {"__getattr__": dict.get, "__setattr__": dict.__setitem__})(session_state)
+    pm.start_admin_session(state)
+    print(f"{'admin session check':<24} {median_ms(lambda: pm.authorize_admin(state, ''), 1000):>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Time to first token through chat_provider.ChatRouter against local stub
+servers, with and without hedging, and when the primary provider fails or
+hangs and the router falls back to a second one.
+
+The tail scenario gives 5% of requests a slow first token; hedging after
+HEDGE_AFTER sends a second request that usually answers quickly, which
+cuts the p99 at the cost of the extra requests reported alongside.
+
+Run from the repository root with `python benchmarks/bench_providers.py`.
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import chat_provider
+from stub_openai_server import StubConfig, StubServer
+
+REQUESTS = 200
+HEDGE_AFTER = 0.25
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def measure(router, requests):
+    ttft, failures = [], 0
+    for _ in range(requests):
+        start = time.perf_counter()
+        first = None
+        try:
+            async for _ in router.stream(MESSAGES, "stub-model"):
+                if first is None:
+                    first = time.perf_counter() - start
+        except Exception:
+            failures += 1
+            continue
+        ttft.append(first)
+    return ttft, failures
+
+
+def report(label, router, ttft, failures):
+    requests = sum(p.requests for p in router.providers)
+    print(f"{label:<40} p50 {statistics.median(ttft) * 1000:>7.0f} ms  p99 {percentile(ttft, 0.99) * 1000:>7.0f} ms  "
+          f"upstream requests {requests:>4}  failed replies {failures}")
+    for name, stats in router.stats().items():
+        if stats["requests"]:
+            print(f"{'':<6}{name:<10} wins {stats['wins']:>4}  errors {stats['errors']:>4}  timeouts {stats['timeouts']:>3}  "
+                  f"hedges {stats['hedges']:>3}  ttft p50 {(stats['ttft_p50'] or 0) * 1000:>6.0f} ms  p99 {(stats['ttft_p99'] or 0) * 1000:>6.0f} ms")
+
+
+def router_for(*servers, **options):
+    providers = [chat_provider.Provider(f"stub{i + 1}", "sk-stub", server.base_url, max_retries=0) for i, server in enumerate(servers)]
+    return chat_provider.ChatRouter(providers, **options)
+
+
+async def run():
+    tail = StubConfig(tokens=5, first_token_ms=50, slow_rate=0.05, slow_first_token_ms=1500, seed=1)
+    healthy = StubConfig(tokens=5, first_token_ms=80)
+    failing = StubConfig(tokens=5, error_rate=1.0, error_status=503)
+    hanging = StubConfig(tokens=5, first_token_ms=5000)
+    with StubServer(tail) as tail_server, StubServer(healthy) as healthy_server, \
+            StubServer(failing) as failing_server, StubServer(hanging) as hanging_server:
+        router = router_for(tail_server)
+        report("tail, no hedging", router, *await measure(router, REQUESTS))
+        router = router_for(tail_server, hedge_after=HEDGE_AFTER)
+        report(f"tail, hedge after {HEDGE_AFTER:g}s (same provider)", router, *await measure(router, REQUESTS))
+        router = router_for(tail_server, healthy_server, hedge_after=HEDGE_AFTER)
+        report(f"tail, hedge after {HEDGE_AFTER:g}s (second provider)", router, *await measure(router, REQUESTS))
+        router = router_for(failing_server, healthy_server)
+        report("primary returns 503, fallback", router, *await measure(router, REQUESTS // 5))
+        router = router_for(hanging_server, healthy_server, first_token_timeout=0.5)
+        report("primary hangs, 0.5s first-token timeout", router, *await measure(router, REQUESTS // 10))
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Render calls and bytes pushed to the placeholder per streamed reply, comparing
+the old render-every-delta loop with render_scheduler.RenderScheduler.
+
+Run from the repository root with `python benchmarks/bench_render_scheduler.py`.
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import render_scheduler as rs
+
+REPLY_TOKENS = [100, 500, 2_000]
+TOKEN_INTERVAL_MS = 15
+
+
+class CountingPlaceholder:
+    def __init__(self):
+        self.calls = 0
+        self.bytes = 0
+
+    def markdown(self, body):
+        self.calls += 1
+        self.bytes += len(body.encode("utf-8"))
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def tokens(count, rng):
+    return ["".join(rng.choice("abcdefghij ") for _ in range(rng.randint(2, 6))) for _ in range(count)]
+
+
+def legacy(deltas):
+    placeholder = CountingPlaceholder()
+    full_res = ""
+    for delta in deltas:
+        full_res += delta
+        placeholder.markdown(full_res + "▌")
+    placeholder.markdown(full_res)
+    return placeholder.calls, placeholder.bytes
+
+
+def scheduled(deltas):
+    placeholder = CountingPlaceholder()
+    clock = FakeClock()
+    renderer = rs.RenderScheduler(placeholder, clock=clock)
+    for delta in deltas:
+        clock.now += TOKEN_INTERVAL_MS / 1000.0
+        renderer.append(delta)
+    renderer.close()
+    return placeholder.calls, placeholder.bytes
+
+
+def main():
+    rng = random.Random(7)
+    print(f"{'tokens':>8} {'legacy calls':>13} {'legacy KB':>10} {'batched calls':>14} {'batched KB':>11}")
+    for count in REPLY_TOKENS:
+        deltas = tokens(count, rng)
+        l_calls, l_bytes = legacy(deltas)
+        s_calls, s_bytes = scheduled(deltas)
+        print(f"{count:>8} {l_calls:>13} {l_bytes / 1024:>10.1f} {s_calls:>14} {s_bytes / 1024:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
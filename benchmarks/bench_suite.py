@@ -0,0 +1,453 @@
+"""
+Benchmark suite: a micro-benchmark for every module plus headless
+end-to-end chat scenarios, with results saved as JSON so runs can be
+compared across commits.
+
+The micro-benchmarks time one operation of each module (keyword filtering,
+a memory-mapped blocklist, normalization, settings round-trips on both backends, the time ledger,
+password hashing, transcripts, history rendering, the API context, the
+response cache, the render scheduler, the limit enforcer, metrics spans and
+a full ChatSession turn). The end-to-end scenarios drive Home.py with
+streamlit's AppTest against the local stub server: an idle rerun, a chat
+turn, a turn whose request fails and one whose stream fails part-way, plus
+time to first token through openai_client.stream_deltas.
+
+Everything runs in a temporary directory, so no settings or transcripts
+are left behind. Run from the repository root:
+
+    python benchmarks/bench_suite.py --output results/HEAD.json
+    python benchmarks/bench_suite.py --compare results/HEAD~1.json --filter content_filter
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import string
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import blocklist
+import chat_history
+import chat_provider
+import chat_session
+import content_filter as cf
+import conversation_context as cc
+import limit_enforcer
+import metrics
+import openai_client
+import password_manager as pm
+import render_scheduler as rs
+import response_cache
+import settings_helper
+import text_normalizer as tn
+import time_manager as tm
+import transcript
+from stub_openai_server import StubConfig, StubServer
+
+BATCH_SECONDS = 0.05  # Each timed batch runs the operation at least this long
+REPEATS = 5
+E2E_TURNS = 5
+KEYWORDS = 'violence, "ass", porn*, gambling, drugs, weapon, kill, alcohol, smoking, vape'
+
+MICRO = {}
+
+
+def micro(name):
+    """Registers a micro-benchmark: a setup function that returns the operation to time."""
+    def register(setup):
+        MICRO[name] = setup
+        return setup
+    return register
+
+
+def _words(rng, count):
+    return " ".join("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 9))) for _ in range(count))
+
+
+# --- Micro-benchmarks, one or more per module ---
+
+@micro("content_filter.filter_content[4KB clean]")
+def _filter_clean():
+    text = _words(random.Random(1), 700)[:4096]
+    cf.get_matcher(KEYWORDS)
+    return lambda: cf.filter_content(text, KEYWORDS)
+
+
+@micro("content_filter.filter_content[4KB match at end]")
+def _filter_match():
+    text = _words(random.Random(1), 700)[:4090] + " v1olence"
+    cf.get_matcher(KEYWORDS)
+    return lambda: cf.filter_content(text, KEYWORDS)
+
+
+@micro("content_filter.StreamFilter[500 deltas]")
+def _stream_filter():
+    deltas = _words(random.Random(2), 500).split(" ")
+
+    def run():
+        stream = cf.StreamFilter(KEYWORDS)
+        for delta in deltas:
+            stream.feed(delta + " ")
+        stream.finish()
+    return run
+
+
+@micro("blocklist.search[4KB clean, 20k terms]")
+def _blocklist_search():
+    rng = random.Random(4)
+    blocklist_import = blocklist.BlocklistImport()
+    blocklist_import.read([word for word in _words(rng, 80000).split(" ") if len(word) >= 7][:20000])
+    matcher = blocklist.get_matcher(KEYWORDS, blocklist_import.build())
+    text = _words(random.Random(1), 700)[:4096]
+    return lambda: matcher.search(text)
+
+
+@micro("text_normalizer.normalize[10KB mixed]")
+def _normalize():
+    chars = list(_words(random.Random(3), 1800)[:10240])
+    for i in range(0, len(chars), 9):
+        chars[i] = "é" if i % 2 else "а"
+    text = "".join(chars)
+    return lambda: tn.normalize(text)
+
+
+def _settings_round_trip(backend):
+    settings = settings_helper.get_default_settings()
+    counter = iter(range(10**9))
+
+    def run():
+        settings["time_used_today_seconds"] = next(counter)
+        backend.save("bench", settings)
+        backend.load_versioned("bench")
+    return run
+
+
+@micro("settings_helper.save+load[sqlite]")
+def _settings_sqlite():
+    return _settings_round_trip(settings_helper.SqliteSettingsBackend(os.path.abspath("bench_settings.sqlite3")))
+
+
+@micro("settings_helper.save+load[json]")
+def _settings_json():
+    return _settings_round_trip(settings_helper.JsonSettingsBackend(os.path.abspath(".")))
+
+
+@micro("settings_helper.SettingsSession.flush[1 key]")
+def _settings_flush():
+    state = chat_session.SessionState()
+    session = settings_helper.get_settings_session(state, "bench-flush")
+    counter = iter(range(10**9))
+
+    def run():
+        state["time_used_today_seconds"] = next(counter)
+        session.save()
+        session.flush(state)
+    return run
+
+
+@micro("time_manager.TimeLedger[from_settings+sync+limit_status]")
+def _time_ledger():
+    settings = tm.get_default_time_settings()
+    settings["time_limit_active"] = True
+    settings["time_used_today_seconds"] = 600
+
+    def run():
+        ledger = tm.TimeLedger.from_settings(settings)
+        ledger.sync(True)
+        ledger.limit_status(True, 60)
+        ledger.store(settings)
+    return run
+
+
+@micro("password_manager.hash")
+def _password_hash():
+    return lambda: pm._hash_password("correct horse battery staple")
+
+
+@micro("password_manager.verify")
+def _password_verify():
+    state = chat_session.SessionState(parent_password_hash=pm._hash_password("correct horse battery staple"))
+    return lambda: pm.verify_password(state, "correct horse battery staple")
+
+
+@micro("transcript.TranscriptLog.append")
+def _transcript_append():
+    log = transcript.open_transcript("bench-append", os.path.abspath("bench_transcripts"))
+    message = transcript.Message("assistant", _words(random.Random(4), 80))
+    return lambda: log.append(message)
+
+
+@micro("transcript.open_transcript[5000 messages]+read last 50")
+def _transcript_open():
+    directory = os.path.abspath("bench_transcripts")
+    log = transcript.open_transcript("bench-open", directory)
+    rng = random.Random(5)
+    for i in range(5000):
+        log.append(transcript.Message("user" if i % 2 == 0 else "assistant", _words(rng, 40)))
+    log.close()
+
+    def run():
+        opened = transcript.open_transcript("bench-open", directory)
+        for i in range(len(opened) - 50, len(opened)):
+            opened[i]
+        opened.close()
+    return run
+
+
+@micro("chat_history.message_markdown[50 messages]")
+def _history_markdown():
+    rng = random.Random(6)
+    messages = [transcript.Message("assistant", _words(rng, 60)) for _ in range(50)]
+
+    def run():
+        for message in messages:
+            chat_history.message_markdown(message)
+    return run
+
+
+@micro("conversation_context.ConversationContext[append+api_messages]")
+def _conversation_context():
+    rng = random.Random(7)
+    messages = [transcript.Message("user" if i % 2 == 0 else "assistant", _words(rng, 60)) for i in range(200)]
+    context = cc.ConversationContext(cc.DEFAULT_TOKEN_BUDGET, messages)
+    message = transcript.Message("user", _words(rng, 20))
+
+    def run():
+        context.append(message)
+        context.api_messages()
+    return run
+
+
+@micro("response_cache.make_key+get[memory hit]")
+def _response_cache():
+    cache = response_cache.ResponseCache()
+    api_messages = [{"role": "user", "content": _words(random.Random(8), 30)}]
+    cache.put(response_cache.make_key("gpt", api_messages, KEYWORDS), "cached reply")
+    return lambda: cache.get(response_cache.make_key("gpt", api_messages, KEYWORDS))
+
+
+@micro("render_scheduler.RenderScheduler[500 deltas]")
+def _render_scheduler():
+    class Placeholder:
+        def markdown(self, text):
+            pass
+
+    deltas = [word + " " for word in _words(random.Random(9), 500).split(" ")]
+
+    def run():
+        renderer = rs.RenderScheduler(Placeholder())
+        for delta in deltas:
+            renderer.append(delta)
+        renderer.close()
+    return run
+
+
+@micro("limit_enforcer.call_later+cancel")
+def _limit_enforcer():
+    scheduler = limit_enforcer.get_scheduler()
+    return lambda: scheduler.call_later(3600, lambda: None).cancel()
+
+
+@micro("metrics.span[disabled]")
+def _metrics_span():
+    metrics.enable(False)
+
+    def run():
+        with metrics.span("bench"):
+            pass
+    return run
+
+
+@micro("chat_session.ChatSession[turn from cached reply]")
+def _chat_session_turn():
+    session = chat_session.ChatSession("bench-session", config={}, cache=response_cache.ResponseCache())
+    session.set_banned_keywords(KEYWORDS)
+    reply = _words(random.Random(10), 120)
+
+    def run():
+        turn = session.start_reply("tell me a story")
+        for delta in response_cache.replay_chunks(reply):
+            turn.feed(delta)
+            if turn.stopped:
+                break
+        turn.finish()
+    return run
+
+
+def time_micro(setup):
+    """Returns per-operation seconds: the median and minimum of REPEATS batches."""
+    op = setup()
+    op()  # Warm up caches and lazily built tables
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            op()
+        elapsed = time.perf_counter() - start
+        if elapsed >= BATCH_SECONDS:
+            break
+        number *= 2
+    samples = [elapsed / number]
+    for _ in range(REPEATS - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            op()
+        samples.append((time.perf_counter() - start) / number)
+    return {"unit": "us", "median": statistics.median(samples) * 1e6, "min": min(samples) * 1e6, "number": number}
+
+
+# --- End-to-end scenarios ---
+
+def _app(base_url, uuid):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(REPO_DIR, "Home.py"), default_timeout=60)
+    app.secrets["OPENAI_API_KEY"] = "sk-bench"
+    app.secrets["OPENAI_BASE_URL"] = base_url
+    app.session_state["storage_init"] = {"uuid": uuid}
+    return app
+
+
+def _wall_ms(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {"unit": "ms", "median": statistics.median(samples), "min": min(samples), "number": runs}
+
+
+def run_e2e(turns):
+    results = {}
+    stub_config = StubConfig(tokens=100, first_token_ms=50, token_interval_ms=2, seed=1)
+    with StubServer(stub_config) as stub:
+        app = _app(stub.base_url, "bench-e2e")
+        app.run()
+        results["e2e.Home.py[idle rerun]"] = _wall_ms(app.run, turns)
+        results["e2e.Home.py[chat turn, 100 tokens]"] = _wall_ms(
+            lambda: app.chat_input[0].set_value("tell me about the moon").run(), turns
+        )
+        assert not app.exception, app.exception
+
+        stub_config.error_rate = 1.0
+        stub_config.error_status = 500
+        results["e2e.Home.py[chat turn, API error]"] = _wall_ms(
+            lambda: app.chat_input[0].set_value("and the sun?").run(), turns
+        )
+        assert app.session_state.messages[-1].content == chat_provider.UNAVAILABLE_MESSAGE, "API error was not surfaced"
+
+        stub_config.error_after_tokens = 20
+        results["e2e.Home.py[chat turn, stream error after 20 tokens]"] = _wall_ms(
+            lambda: app.chat_input[0].set_value("and the stars?").run(), turns
+        )
+        stub_config.error_rate = 0.0
+        stub_config.error_after_tokens = None
+
+        results["e2e.openai_client.stream_deltas[ttft]"], results["e2e.openai_client.stream_deltas[100 tokens]"] = \
+            asyncio.run(_stream_latency(stub.base_url, turns))
+    return results
+
+
+async def _stream_latency(base_url, turns):
+    client = openai_client.build_async_client("sk-bench", base_url)
+    ttft, total = [], []
+    try:
+        for _ in range(turns):
+            start = time.perf_counter()
+            first = None
+            async for _ in openai_client.stream_deltas(client, "stub-model", [{"role": "user", "content": "hi"}]):
+                if first is None:
+                    first = time.perf_counter()
+            end = time.perf_counter()
+            ttft.append((first - start) * 1000)
+            total.append((end - start) * 1000)
+    finally:
+        await client.close()
+    summary = lambda samples: {"unit": "ms", "median": statistics.median(samples), "min": min(samples), "number": turns}
+    return summary(ttft), summary(total)
+
+
+# --- Results ---
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    base = (baseline or {}).get("results", {})
+    print(f"{'benchmark':<62} {'median':>10} {'min':>10} {'unit':>4}" + (f" {'change':>8}" if base else ""))
+    for name, row in results.items():
+        line = f"{name:<62} {row['median']:>10.2f} {row['min']:>10.2f} {row['unit']:>4}"
+        if name in base and base[name]["median"]:
+            line += f" {row['median'] / base[name]['median'] - 1:>+8.1%}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro and end-to-end benchmark suite.")
+    parser.add_argument("--filter", default=None,
+                        help='Only run benchmarks whose name contains this ("e2e" runs just the end-to-end scenarios)')
+    parser.add_argument("--skip-e2e", action="store_true", help="Skip the AppTest/stub scenarios")
+    parser.add_argument("--turns", type=int, default=E2E_TURNS, help="Runs per end-to-end scenario")
+    parser.add_argument("--output", default=None, help="Write results as JSON to this path")
+    parser.add_argument("--compare", default=None, help="Earlier JSON results to show the change against")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results = {}
+    run_e2e_scenarios = not args.skip_e2e and (args.filter is None or args.filter == "e2e"
+                                               or args.filter.startswith("e2e."))
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)  # Settings and transcripts the benchmarks create land here
+        try:
+            for name, setup in MICRO.items():
+                if args.filter is None or args.filter in name:
+                    results[name] = time_micro(setup)
+            if run_e2e_scenarios:
+                results.update((name, row) for name, row in run_e2e(args.turns).items()
+                               if args.filter is None or args.filter in name)
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+    print_results(results, baseline)
+    if output:
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {output}")
+
+
+if __name__ == "__main__":
+    main()
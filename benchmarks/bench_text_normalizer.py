@@ -0,0 +1,81 @@
+"""
+Cost of each text_normalizer step, of the staged pipeline and of the fused
+single-pass normalize() on large texts, plus end-to-end filter throughput
+with plain, whole-word and wildcard keywords.
+
+Run from the repository root with `python benchmarks/bench_text_normalizer.py`.
+"""
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import content_filter as cf
+import text_normalizer as tn
+
+TEXT_CHARS = 1_000_000
+ROUNDS = 5
+
+# Characters an evasive text mixes in: fullwidth, accented, Cyrillic/Greek look-alikes, zero-width, leet.
+TRICKY = "ＳｅｘéüñçàаеоѕхαορＡ​‍﻿0134@$"
+
+
+def ascii_text(rng):
+    words = ["".join(rng.choice(string.ascii_letters) for _ in range(rng.randint(2, 9))) for _ in range(2000)]
+    text = []
+    size = 0
+    while size < TEXT_CHARS:
+        word = rng.choice(words)
+        text.append(word)
+        size += len(word) + 1
+    return " ".join(text)[:TEXT_CHARS]
+
+
+def mixed_text(rng):
+    chars = list(ascii_text(rng))
+    for i in range(0, len(chars), 7):
+        chars[i] = rng.choice(TRICKY)
+    return "".join(chars)
+
+
+def mb_per_s(fn, text):
+    fn(text)  # Warm up lazily built tables
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn(text)
+    return ROUNDS * len(text) / (time.perf_counter() - start) / 1e6
+
+
+def main():
+    rng = random.Random(7)
+    texts = {"ascii": ascii_text(rng), "mixed": mixed_text(rng)}
+    for name, text in texts.items():
+        assert tn.normalize(text) == tn.normalize_staged(text), "fused and staged normalization disagree"
+
+    print(f"{'step':<22} {'ascii MB/s':>11} {'mixed MB/s':>11}")
+    for step_name, step in tn.STEPS:
+        print(f"{step_name:<22} {mb_per_s(step, texts['ascii']):>11.1f} {mb_per_s(step, texts['mixed']):>11.1f}")
+    print(f"{'staged (all steps)':<22} {mb_per_s(tn.normalize_staged, texts['ascii']):>11.1f} {mb_per_s(tn.normalize_staged, texts['mixed']):>11.1f}")
+    print(f"{'fused normalize()':<22} {mb_per_s(tn.normalize, texts['ascii']):>11.1f} {mb_per_s(tn.normalize, texts['mixed']):>11.1f}")
+
+    keyword_sets = {
+        "10 plain": ", ".join("".join(rng.choice(string.ascii_lowercase) for _ in range(10)) for _ in range(10)),
+        "1000 plain": ", ".join("".join(rng.choice(string.ascii_lowercase) for _ in range(10)) for _ in range(1000)),
+        "10 word/wildcard": ", ".join(
+            f'"{w}"' if i % 2 else w[:5] + "*"
+            for i, w in enumerate("".join(rng.choice(string.ascii_lowercase) for _ in range(10)) for _ in range(10))
+        ),
+    }
+    print()
+    print(f"{'filter_content':<22} {'ascii MB/s':>11} {'mixed MB/s':>11}")
+    for name, keywords in keyword_sets.items():
+        cf.get_matcher(keywords)
+        row = [mb_per_s(lambda t: cf.filter_content(t, keywords), texts[k]) for k in ("ascii", "mixed")]
+        print(f"{name:<22} {row[0]:>11.1f} {row[1]:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
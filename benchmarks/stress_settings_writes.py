@@ -0,0 +1,131 @@
+"""
+Stress test for concurrent settings writes across processes.
+
+Writer processes increment a shared counter and a per-writer counter for one
+household with compare-and-swap saves, retrying on VersionConflict, while
+reader processes load snapshots without locking. Afterwards the counters
+must add up exactly, with no lost updates, and every snapshot a reader saw
+must have been complete and consistent (counter == version) with no torn
+reads. `--no-cas` runs the same load-modify-save loop without a version
+check to show the lost updates CAS prevents.
+
+Run from the repository root with `python benchmarks/stress_settings_writes.py`.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import settings_helper
+
+UUID = "stress"
+
+
+def make_backend(kind, directory):
+    if kind == "json":
+        return settings_helper.JsonSettingsBackend(directory)
+    return settings_helper.SqliteSettingsBackend(os.path.join(directory, "settings.sqlite3"))
+
+
+def writer(kind, directory, index, updates, use_cas, start, results):
+    backend = make_backend(kind, directory)
+    own_key = f"writer_{index}"
+    conflicts = 0
+    start.wait()
+    for _ in range(updates):
+        while True:
+            settings, version = backend.load_versioned(UUID)
+            settings = settings or {}
+            values = {"counter": settings.get("counter", 0) + 1, own_key: settings.get(own_key, 0) + 1}
+            try:
+                backend.save(UUID, values, version if use_cas else None)
+                break
+            except settings_helper.VersionConflict:
+                conflicts += 1
+    results.put(("writer", conflicts))
+
+
+def reader(kind, directory, start, done, results):
+    backend = make_backend(kind, directory)
+    reads = torn = inconsistent = regressions = 0
+    last_version = 0
+    start.wait()
+    while not done.is_set():
+        try:
+            settings, version = backend.load_versioned(UUID)
+        except (json.JSONDecodeError, ValueError):
+            torn += 1
+            continue
+        reads += 1
+        if settings is None:
+            continue
+        if version < last_version:
+            regressions += 1
+        last_version = version
+        if settings.get("counter") != version:
+            inconsistent += 1
+    results.put(("reader", (reads, torn, inconsistent, regressions)))
+
+
+def run(kind, writers, readers, updates, use_cas):
+    with tempfile.TemporaryDirectory() as directory:
+        make_backend(kind, directory)  # Creates the SQLite schema before the race starts
+        start = multiprocessing.Event()
+        done = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        writer_procs = [
+            multiprocessing.Process(target=writer, args=(kind, directory, i, updates, use_cas, start, results))
+            for i in range(writers)
+        ]
+        reader_procs = [
+            multiprocessing.Process(target=reader, args=(kind, directory, start, done, results))
+            for _ in range(readers)
+        ]
+        for proc in writer_procs + reader_procs:
+            proc.start()
+        began = time.perf_counter()
+        start.set()
+        for proc in writer_procs:
+            proc.join()
+        elapsed = time.perf_counter() - began
+        done.set()
+        for proc in reader_procs:
+            proc.join()
+        collected = [results.get() for _ in range(writers + readers)]
+        final, version = make_backend(kind, directory).load_versioned(UUID)
+
+    conflicts = sum(value for role, value in collected if role == "writer")
+    reads = [value for role, value in collected if role == "reader"]
+    expected = writers * updates
+    lost = expected - final.get("counter", 0)
+    per_writer_ok = all(final.get(f"writer_{i}") == updates for i in range(writers))
+    print(f"{kind:<7} {'cas' if use_cas else 'no-cas':<7} {expected:>6} saves in {elapsed:6.2f}s "
+          f"({expected / elapsed:7.0f}/s)  conflicts {conflicts:>6}  lost {lost:>5}  "
+          f"per-writer {'ok' if per_writer_ok else 'LOST'}  version {version}")
+    print(f"{'':<15} reads {sum(r[0] for r in reads):>7}  torn {sum(r[1] for r in reads)}  "
+          f"inconsistent {sum(r[2] for r in reads)}  version regressions {sum(r[3] for r in reads)}")
+    return lost == 0 and per_writer_ok and not any(r[1] or r[2] or r[3] for r in reads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent settings writer stress test.")
+    parser.add_argument("--backend", choices=["json", "sqlite", "both"], default="both")
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--updates", type=int, default=200, help="Updates per writer")
+    parser.add_argument("--no-cas", action="store_true", help="Save without a version check")
+    args = parser.parse_args()
+    kinds = ["json", "sqlite"] if args.backend == "both" else [args.backend]
+    ok = True
+    for kind in kinds:
+        ok = run(kind, args.writers, args.readers, args.updates, not args.no_cas) and ok
+    sys.exit(0 if ok or args.no_cas else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Minimal local server speaking the OpenAI chat-completions streaming protocol.
+
+Serves `GET /v1/models` and `POST /v1/chat/completions` (streamed as
+Server-Sent Events over a chunked, keep-alive HTTP/1.1 connection, or as a
+single JSON body when `stream` is false). A fraction of requests can be
+made to fail, either up front with an HTTP error (`error_rate`,
+`error_status`) or part-way through the stream with an error event
+(`error_after_tokens`), and a fraction can be given a slow first token
+(`slow_rate`, `slow_first_token_ms`) to model tail latency. Use it from a benchmark with `StubServer(...)` as a
+context manager, or standalone:
+
+    python benchmarks/stub_openai_server.py --port 8765 --tokens 200 --first-token-ms 300
+    python benchmarks/stub_openai_server.py --error-rate 0.1 --error-status 429
+"""
+import argparse
+import json
+import random
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubConfig:
+    def __init__(self, tokens=50, token_text="lorem ", first_token_ms=0.0, token_interval_ms=0.0,
+                 error_rate=0.0, error_status=500, error_after_tokens=None, slow_rate=0.0, slow_first_token_ms=0.0,
+                 seed=None):
+        self.tokens = tokens
+        self.token_text = token_text
+        self.first_token_ms = first_token_ms
+        self.token_interval_ms = token_interval_ms
+        self.error_rate = error_rate  # Fraction of chat requests that fail
+        self.error_status = error_status  # HTTP status of an up-front failure
+        self.error_after_tokens = error_after_tokens  # If set, failures happen mid-stream after this many tokens
+        self.slow_rate = slow_rate  # Fraction of requests whose first token takes slow_first_token_ms instead
+        self.slow_first_token_ms = slow_first_token_ms
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def next_request(self):
+        """Counts a chat request and returns (fails, first_token_ms) for it."""
+        with self._lock:
+            self.requests += 1
+            fails = self.error_rate > 0 and self._random.random() < self.error_rate
+            if fails:
+                self.errors += 1
+            slow = self.slow_rate > 0 and self._random.random() < self.slow_rate
+            return fails, self.slow_first_token_ms if slow else self.first_token_ms
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = StubConfig()
+
+    def setup(self):
+        super().setup()
+        # Small SSE writes would otherwise wait on delayed ACKs.
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "stub-model", "object": "model", "created": 0, "owned_by": "stub"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        config = self.config
+        model = request.get("model", "stub-model")
+        fails, first_token_ms = config.next_request()
+        if fails and config.error_after_tokens is None:
+            error_type = "rate_limit_error" if config.error_status == 429 else "server_error"
+            self._send_json(config.error_status, {"error": {"message": "stub: injected error", "type": error_type}})
+            return
+        if first_token_ms:
+            time.sleep(first_token_ms / 1000.0)
+        if not request.get("stream"):
+            self._send_json(200, {
+                "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": config.token_text * config.tokens}}],
+            })
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for i in range(config.tokens):
+                if fails and i == config.error_after_tokens:
+                    error = {"error": {"message": "stub: injected stream error", "type": "server_error"}}
+                    self._write_chunk(b"data: " + json.dumps(error).encode("utf-8") + b"\n\n")
+                    self._write_chunk(b"")
+                    return
+                if i and config.token_interval_ms:
+                    time.sleep(config.token_interval_ms / 1000.0)
+                self._write_chunk(self._event(model, {"content": config.token_text}, None))
+            self._write_chunk(self._event(model, {}, "stop"))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    @staticmethod
+    def _event(model, delta, finish_reason):
+        payload = {
+            "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n"
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # The default backlog of 5 drops connections when many clients start at once
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return  # A client dropping its connection (e.g. after an injected error) is expected
+        super().handle_error(request, client_address)
+
+
+class StubServer:
+    """Runs the stub on a background thread; `base_url` is ready to pass to an OpenAI client."""
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        handler = type("StubHandler", (_Handler,), {"config": config or StubConfig()})
+        self.httpd = _StubHTTPServer((host, port), handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def config(self):
+        return self.httpd.RequestHandlerClass.config
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--first-token-ms", type=float, default=0.0)
+    parser.add_argument("--token-interval-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of chat requests that fail")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP status for up-front failures")
+    parser.add_argument("--error-after-tokens", type=int, default=None, help="Fail mid-stream after this many tokens instead")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of requests with a slow first token")
+    parser.add_argument("--slow-first-token-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    config = StubConfig(
+        args.tokens, first_token_ms=args.first_token_ms, token_interval_ms=args.token_interval_ms,
+        error_rate=args.error_rate, error_status=args.error_status, error_after_tokens=args.error_after_tokens,
+        slow_rate=args.slow_rate, slow_first_token_ms=args.slow_first_token_ms
+    )
+    server = StubServer(config, args.host, args.port)
+    print(f"Stub OpenAI server listening on {server.base_url}")
+    server.httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,499 @@
+# blocklist.py
+"""
+Imported blocklists: curated keyword lists of any size, read from text
+files line by line, de-duplicated and grouped into categories, then
+compiled once into an on-disk matcher index that every process
+memory-maps instead of parsing.
+
+A list file looks like this:
+
+    # Comments and blank lines are skipped
+    [violence]                 (category for the lines that follow)
+    gore
+    "kill", murder*            (several terms per line, comma-separated as in the sidebar)
+    casino<TAB>gambling        (a tab gives one term its own category)
+
+Terms use the typed keyword syntax: quotes for whole words and `*` for
+wildcards. Terms that normalize to the same thing are kept once per
+category.
+
+Each index is named after its list version, a hash of the sorted terms,
+their categories and the normalization in effect (text_normalizer.SCHEME,
+since the index holds normalized terms). Importing the same list twice reuses the file, and a new
+version never overwrites a file that another process has mapped. A
+household stores the version in `blocklist` and the categories it filters
+in `blocklist_categories` (empty means all). Like `banned_keywords`, both
+can only change while the keywords are unlocked.
+
+    python blocklist.py import lists/*.txt --category general
+    python blocklist.py list
+    python blocklist.py info <version>
+"""
+import argparse
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+import streamlit as st
+import content_filter as cf
+import text_normalizer as tn
+
+BLOCKLIST_DIR = os.environ.get("BLOCKLIST_DIR", "blocklists")
+DEFAULT_CATEGORY = "general"
+INDEX_MAGIC = b"PCBLIDX1"
+INDEX_SUFFIX = ".idx"
+VERSION_CHARS = 16
+_CODEPOINTS = 0x110000  # Trie edges are keyed state * _CODEPOINTS + codepoint while building
+# Resolved (state, character) steps kept per mapped index; text mostly revisits the same few.
+TRANSITION_CACHE_SIZE = 1 << 14
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+_matcher_cache = OrderedDict()
+_matcher_cache_lock = threading.Lock()
+
+
+class BlocklistError(Exception):
+    pass
+
+
+def _dedup_key(keyword):
+    """Normalized form of a term, keeping its whole-word and wildcard markers."""
+    bounded = len(keyword) >= 2 and keyword[0] == keyword[-1] == '"'
+    body = keyword[1:-1] if bounded else keyword
+    return ('"' if bounded else "") + "*".join(tn.normalize(segment) for segment in body.split("*"))
+
+
+class BlocklistImport:
+    """
+    Collects terms from one or more list files, keeping the first spelling
+    of each normalized duplicate within a category. A term listed in two
+    categories is kept in both, so it stays filtered while either is on.
+    Only the unique terms are held in memory, never a whole file.
+    """
+
+    def __init__(self):
+        self.entries = {}  # (category, dedup key) -> (keyword, category)
+        self.terms_read = 0
+        self.duplicates = 0
+        self.skipped = 0  # Terms with nothing left to match after normalization
+
+    def add(self, keyword, category=DEFAULT_CATEGORY):
+        keyword = keyword.strip()
+        if not keyword:
+            return
+        self.terms_read += 1
+        key = _dedup_key(keyword)
+        if not key.strip('"*'):
+            self.skipped += 1
+        elif (category, key) in self.entries:
+            self.duplicates += 1
+        else:
+            self.entries[category, key] = (keyword, category)
+
+    def read(self, lines, category=DEFAULT_CATEGORY):
+        """Adds the terms from an iterable of text lines (an open file, an upload wrapped in a TextIOWrapper...)."""
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("[") and line.endswith("]"):
+                category = line[1:-1].strip() or DEFAULT_CATEGORY
+                continue
+            terms, _, line_category = line.partition("\t")
+            for term in terms.split(","):
+                self.add(term, line_category.strip() or category)
+
+    def read_file(self, path, category=DEFAULT_CATEGORY):
+        with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+            self.read(f, category)
+
+    def sorted_entries(self):
+        return sorted(self.entries.values(), key=lambda entry: (entry[1], entry[0]))
+
+    def version(self):
+        digest = hashlib.sha256(tn.SCHEME.encode("utf-8") + b"\n")
+        for keyword, category in self.sorted_entries():
+            digest.update(f"{category}\t{keyword}\n".encode("utf-8"))
+        return digest.hexdigest()[:VERSION_CHARS]
+
+    def stats(self):
+        return {"terms_read": self.terms_read, "unique": len(self.entries),
+                "duplicates": self.duplicates, "skipped": self.skipped}
+
+    def build(self, directory=None):
+        """Writes the index unless this version already exists. Returns the version."""
+        if not self.entries:
+            raise BlocklistError("the list has no terms")
+        version = self.version()
+        path = index_path(version, directory)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            write_index(path, version, self.sorted_entries())
+        return version
+
+
+def index_path(version, directory=None):
+    if not version or not all(c in "0123456789abcdef" for c in version):
+        raise BlocklistError(f"invalid blocklist version {version!r}")
+    return os.path.join(directory or BLOCKLIST_DIR, version + INDEX_SUFFIX)
+
+
+def _compile(entries):
+    """
+    Builds the Aho-Corasick automaton for (keyword, category) entries as flat
+    arrays: per state a sorted run of edges, a failure link, the pattern
+    ending there and a link to the next state on the failure chain that ends
+    a pattern. Keywords are stored grouped by their anchor pattern.
+    """
+    categories = sorted({category for _, category in entries})
+    category_ids = {category: i for i, category in enumerate(categories)}
+    by_anchor = {}
+    max_keyword_length = 0
+    has_rules = False
+    for keyword, category in entries:
+        anchor, rule = cf.parse_rule(keyword)
+        by_anchor.setdefault(anchor, []).append((keyword, category_ids[category] << 1 | (rule is not None)))
+        max_keyword_length = max(max_keyword_length, len(anchor) + (rule.before + rule.after if rule else 0))
+        has_rules = has_rules or rule is not None
+    anchors = sorted(by_anchor)
+
+    edges = {}
+    output = array("I", [0])  # Pattern index + 1, or 0
+    for index, anchor in enumerate(anchors):
+        state = 0
+        for ch in anchor:
+            key = state * _CODEPOINTS + ord(ch)
+            nxt = edges.get(key)
+            if nxt is None:
+                nxt = edges[key] = len(output)
+                output.append(0)
+            state = nxt
+        output[state] = index + 1
+    states = len(output)
+    edge_start = array("I", [0]) * (states + 1)
+    labels = array("I")
+    targets = array("I")
+    for key in sorted(edges):  # Sorts by state, then codepoint
+        state, codepoint = divmod(key, _CODEPOINTS)
+        edge_start[state + 1] += 1
+        labels.append(codepoint)
+        targets.append(edges[key])
+    for state in range(states):
+        edge_start[state + 1] += edge_start[state]
+
+    fail = array("I", [0]) * states
+    dict_link = array("I", [0]) * states
+    queue = deque(targets[edge_start[0]:edge_start[1]])
+    while queue:
+        state = queue.popleft()
+        for i in range(edge_start[state], edge_start[state + 1]):
+            codepoint, nxt = labels[i], targets[i]
+            queue.append(nxt)
+            f = fail[state]
+            while True:
+                target = edges.get(f * _CODEPOINTS + codepoint)
+                if target is not None or not f:
+                    fail[nxt] = target or 0
+                    break
+                f = fail[f]
+            link = fail[nxt]
+            dict_link[nxt] = link if output[link] else dict_link[link]
+
+    pattern_length = array("I", (len(anchor) for anchor in anchors))
+    keyword_start = array("I", [0])
+    keyword_meta = array("I")
+    keyword_offset = array("I", [0])
+    blob = bytearray()
+    category_counts = dict.fromkeys(categories, 0)
+    for anchor in anchors:
+        for keyword, meta in by_anchor[anchor]:
+            keyword_meta.append(meta)
+            blob += keyword.encode("utf-8")
+            keyword_offset.append(len(blob))
+            category_counts[categories[meta >> 1]] += 1
+        keyword_start.append(len(keyword_meta))
+    meta = {
+        "states": states,
+        "edges": len(labels),
+        "patterns": len(anchors),
+        "keywords": len(keyword_meta),
+        "blob_bytes": len(blob),
+        "categories": category_counts,
+        "max_keyword_length": max_keyword_length,
+        "has_rules": has_rules,
+    }
+    arrays = [edge_start, labels, targets, fail, output, dict_link, pattern_length, keyword_start, keyword_meta, keyword_offset]
+    return meta, arrays, bytes(blob)
+
+
+def write_index(path, version, entries):
+    """Compiles sorted (keyword, category) entries and writes the index file atomically."""
+    meta, arrays, blob = _compile(entries)
+    meta.update({"version": version, "normalizer": tn.SCHEME, "byteorder": sys.byteorder, "itemsize": array("I").itemsize, "created": time.time()})
+    header = json.dumps(meta).encode("utf-8")
+    header += b" " * (-(len(INDEX_MAGIC) + 4 + len(header)) % 4)  # Keep the arrays 4-byte aligned
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".blocklist-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(INDEX_MAGIC)
+            f.write(struct.pack("=I", len(header)))
+            f.write(header)
+            for values in arrays:
+                values.tofile(f)
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class BlocklistIndex:
+    """
+    A compiled blocklist, memory-mapped read-only. Opening it reads only the
+    header; the automaton is walked straight from the mapping, so the pages
+    are shared by every process that opens the same version.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        if bytes(view[:len(INDEX_MAGIC)]) != INDEX_MAGIC:
+            raise BlocklistError(f"{path} is not a blocklist index")
+        offset = len(INDEX_MAGIC) + 4
+        (header_length,) = struct.unpack_from("=I", view, len(INDEX_MAGIC))
+        self.meta = json.loads(bytes(view[offset:offset + header_length]))
+        if self.meta["byteorder"] != sys.byteorder or self.meta["itemsize"] != array("I").itemsize:
+            raise BlocklistError(f"{path} was built on an incompatible platform; import the list again")
+        if self.meta.get("normalizer") != tn.SCHEME:
+            raise BlocklistError(f"{path} was built with {self.meta.get('normalizer')} text normalization, "
+                                 f"not {tn.SCHEME}; import the list again")
+        offset += header_length
+        counts = (self.meta["states"] + 1, self.meta["edges"], self.meta["edges"], self.meta["states"],
+                  self.meta["states"], self.meta["states"], self.meta["patterns"], self.meta["patterns"] + 1,
+                  self.meta["keywords"], self.meta["keywords"] + 1)
+        arrays = []
+        for count in counts:
+            end = offset + count * 4
+            arrays.append(view[offset:end].cast("I"))
+            offset = end
+        (self._edge_start, self._labels, self._targets, self._fail, self._output, self._dict_link,
+         self._pattern_length, self._keyword_start, self._keyword_meta, self._keyword_offset) = arrays
+        self._blob = view[offset:offset + self.meta["blob_bytes"]]
+        self._transitions = {}
+        self._rules = {}
+        self.version = self.meta["version"]
+        self.categories = list(self.meta["categories"])
+        self.max_keyword_length = self.meta["max_keyword_length"]
+        self.has_rules = self.meta["has_rules"]
+
+    def __len__(self):
+        return self.meta["keywords"]
+
+    def keyword(self, index):
+        return str(self._blob[self._keyword_offset[index]:self._keyword_offset[index + 1]], "utf-8")
+
+    def targets(self, pattern, category_ids=None):
+        """[(keyword, rule or None)] for a pattern, limited to the given category ids."""
+        found = []
+        for index in range(self._keyword_start[pattern], self._keyword_start[pattern + 1]):
+            meta = self._keyword_meta[index]
+            if category_ids is not None and meta >> 1 not in category_ids:
+                continue
+            keyword = self.keyword(index)
+            rule = None
+            if meta & 1:
+                rule = self._rules.get(index)
+                if rule is None:
+                    rule = self._rules[index] = cf.parse_rule(keyword)[1]
+            found.append((keyword, rule))
+        return found
+
+    def _step(self, state, codepoint):
+        """Follows failure links until `codepoint` has an edge. Returns (next state, first state ending a pattern)."""
+        edge_start, labels = self._edge_start, self._labels
+        while True:
+            lo, hi = edge_start[state], edge_start[state + 1]
+            i = bisect.bisect_left(labels, codepoint, lo, hi)
+            if i < hi and labels[i] == codepoint:
+                state = self._targets[i]
+                break
+            if not state:
+                break
+            state = self._fail[state]
+        return state, state if self._output[state] else self._dict_link[state]
+
+    def anchor_matches(self, normalized):
+        """Yields (pattern index, start, end) for every anchor occurrence in normalized text."""
+        transitions, output, dict_link, lengths = self._transitions, self._output, self._dict_link, self._pattern_length
+        state = 0
+        for pos, ch in enumerate(normalized):
+            key = state << 21 | ord(ch)
+            step = transitions.get(key)
+            if step is None:
+                step = self._step(state, ord(ch))
+                if len(transitions) >= TRANSITION_CACHE_SIZE:
+                    transitions.clear()
+                transitions[key] = step
+            state, hit = step
+            while hit:
+                pattern = output[hit] - 1
+                yield pattern, pos - lengths[pattern] + 1, pos + 1
+                hit = dict_link[hit]
+
+
+class BlocklistMatcher(cf._Matcher):
+    """Matches a household's enabled categories of a mapped blocklist index."""
+
+    def __init__(self, index, categories=()):
+        self.index = index
+        enabled = [c for c in categories if c in index.categories]
+        self._category_ids = None if not categories else {index.categories.index(c) for c in enabled}
+        self._empty = not len(index) or (categories and not enabled)
+        self.max_keyword_length = index.max_keyword_length
+        self.has_rules = index.has_rules
+
+    def __bool__(self):
+        return not self._empty
+
+    def _anchor_matches(self, normalized):
+        return self.index.anchor_matches(normalized)
+
+    def _targets_for(self, pattern):
+        return self.index.targets(pattern, self._category_ids)
+
+
+def open_index(version, directory=None):
+    """Returns the process-wide mapped index for a list version, opening it on first use."""
+    path = index_path(version, directory)
+    index = _indexes.get(path)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(path)
+            if index is None:
+                index = _indexes[path] = BlocklistIndex(path)
+    return index
+
+
+def get_matcher(banned_keywords, version=None, categories=()):
+    """The typed keywords plus the blocklist's enabled categories as one matcher."""
+    if not version:
+        return cf.get_matcher(banned_keywords)
+    key = (banned_keywords or "", version, tuple(sorted(categories or ())))
+    with _matcher_cache_lock:
+        matcher = _matcher_cache.get(key)
+        if matcher is not None:
+            _matcher_cache.move_to_end(key)
+            return matcher
+    try:
+        index = open_index(version)
+    except (OSError, ValueError, BlocklistError) as e:
+        st.warning(f"Blocklist {version} could not be opened ({e}). Filtering with the typed keywords only.")
+        return cf.get_matcher(banned_keywords)
+    matcher = cf.CombinedMatcher([cf.get_matcher(banned_keywords), BlocklistMatcher(index, key[2])])
+    with _matcher_cache_lock:
+        _matcher_cache[key] = matcher
+        while len(_matcher_cache) > cf.MATCHER_CACHE_SIZE:
+            _matcher_cache.popitem(last=False)
+    return matcher
+
+
+def household_matcher(session_state):
+    return get_matcher(cf.get_banned_keywords(session_state), session_state.get("blocklist"),
+                       session_state.get("blocklist_categories"))
+
+
+def set_household_blocklist(session_state, version, categories=None):
+    """
+    Selects a blocklist version (None to remove it) and the categories to
+    filter (empty for all). Refused while keywords are locked, like
+    content_filter.set_banned_keywords.
+    """
+    if session_state.keywords_locked:
+        return False
+    if version:
+        open_index(version)  # Fails here rather than silently filtering less later
+    session_state.blocklist = version or None
+    session_state.blocklist_categories = sorted(categories or [])
+    return True
+
+
+def household_summary(session_state):
+    """{"version", "terms", "categories": {name: terms}, "enabled": [...]} or None without a blocklist."""
+    version = session_state.get("blocklist")
+    if not version:
+        return None
+    try:
+        index = open_index(version)
+    except (OSError, ValueError, BlocklistError):
+        return {"version": version, "terms": 0, "categories": {}, "enabled": [], "missing": True}
+    return {
+        "version": version,
+        "terms": len(index),
+        "categories": dict(index.meta["categories"]),
+        "enabled": list(session_state.get("blocklist_categories") or []) or list(index.categories),
+    }
+
+
+def import_lines(lines, category=DEFAULT_CATEGORY, directory=None):
+    """Imports one list from text lines and builds its index. Returns (version, import stats)."""
+    blocklist_import = BlocklistImport()
+    blocklist_import.read(lines, category)
+    return blocklist_import.build(directory), blocklist_import.stats()
+
+
+def list_indexes(directory=None):
+    directory = directory or BLOCKLIST_DIR
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name[:-len(INDEX_SUFFIX)] for name in os.listdir(directory) if name.endswith(INDEX_SUFFIX))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import blocklists and inspect their compiled indexes.")
+    parser.add_argument("--dir", default=BLOCKLIST_DIR, help="Index directory (default: BLOCKLIST_DIR)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="Read list files into one blocklist and build its index")
+    import_parser.add_argument("files", nargs="+")
+    import_parser.add_argument("--category", default=DEFAULT_CATEGORY, help="Category for terms outside a [section]")
+    commands.add_parser("list", help="List the built indexes")
+    info_parser = commands.add_parser("info", help="Show an index's size and categories")
+    info_parser.add_argument("version")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        blocklist_import = BlocklistImport()
+        started = time.perf_counter()
+        for path in args.files:
+            blocklist_import.read_file(path, args.category)
+        try:
+            version = blocklist_import.build(args.dir)
+        except BlocklistError as e:
+            parser.error(str(e))
+        stats = blocklist_import.stats()
+        print(f"Blocklist {version}: {stats['unique']} unique terms from {stats['terms_read']} read "
+              f"({stats['duplicates']} duplicates, {stats['skipped']} skipped) in {time.perf_counter() - started:.1f}s")
+        print(f"Index: {index_path(version, args.dir)}")
+    elif args.command == "list":
+        for version in list_indexes(args.dir):
+            index = open_index(version, args.dir)
+            print(f"{version}  {len(index):>8} terms  {', '.join(index.categories)}")
+    else:
+        index = open_index(args.version, args.dir)
+        print(json.dumps({**index.meta, "file_bytes": os.path.getsize(index_path(args.version, args.dir))}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+# chat_history.py
+DEFAULT_WINDOW = 50  # Messages rendered per rerun; 0 renders the whole history
+PAGE_SIZE = 50
+
+
+def visible_start(num_messages, window):
+    """Index of the first message to render for a window of the newest `window` messages."""
+    if not window or window >= num_messages:
+        return 0
+    return num_messages - window
+
+
+def message_markdown(message):
+    """Markdown body shown for a chat message."""
+    if message.is_filtered and message.is_revealed:
+        return f"**Original Content (Revealed):**\n{message.original_content or ''}"
+    return message.content
@@ -0,0 +1,364 @@
+# chat_provider.py
+"""
+Chat providers: the OpenAI-compatible endpoints a reply may come from, in
+order of preference, with deadlines, hedged requests and fallback.
+
+A reply goes to the first provider. If it has not produced a first token
+within HEDGE_AFTER_SECONDS (when set), a hedge request goes to the next
+provider (or the same one if there is no other), and whichever answers
+first wins while the other is cancelled. A provider that fails or misses
+FIRST_TOKEN_TIMEOUT_SECONDS is abandoned for the next one. The whole reply
+must finish within REQUEST_DEADLINE_SECONDS.
+
+Providers are configured in `.streamlit/secrets.toml`:
+
+    [[CHAT_PROVIDERS]]
+    name = "openai"
+    model = "gpt-4o-mini"            # api_key/base_url default to OPENAI_API_KEY/OPENAI_BASE_URL
+
+    [[CHAT_PROVIDERS]]
+    name = "local"
+    base_url = "http://127.0.0.1:11434/v1"
+    model = "llama3.1"
+    api_key = "unused"
+
+Without CHAT_PROVIDERS there is one provider built from OPENAI_API_KEY,
+OPENAI_BASE_URL and OPENAI_MODEL, as before.
+
+The router is asyncio-based. server.py awaits `stream()` directly, while
+Home.py uses `stream_sync()`, which runs it on one background event loop
+shared by every session in the process. Home.py only asks for the router
+(`get_router()`) when the first prompt is sent, so sessions that never
+chat never load the OpenAI SDK.
+"""
+import asyncio
+import collections
+import queue
+import threading
+import time
+import streamlit as st
+import metrics
+import openai_client
+
+FIRST_TOKEN_TIMEOUT_SECONDS = 20.0
+REQUEST_DEADLINE_SECONDS = 120.0
+TTFT_WINDOW = 1000  # Recent time-to-first-token samples kept per provider for p50/p99
+
+TIMEOUT_MESSAGE = "Sorry, the assistant took too long to answer. Please try again."
+UNAVAILABLE_MESSAGE = "Sorry, the assistant isn't available right now. Please try again in a moment."
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class AllProvidersFailed(Exception):
+    def __init__(self, errors):
+        super().__init__("; ".join(f"{name}: {error}" for name, error in errors) or "no chat providers configured")
+        self.errors = errors
+
+
+def user_message(error):
+    """The message shown to the child (and stored in the history) for a failed reply."""
+    if isinstance(error, DeadlineExceeded) or (
+        isinstance(error, AllProvidersFailed) and error.errors and all(isinstance(e, DeadlineExceeded) for _, e in error.errors)
+    ):
+        return TIMEOUT_MESSAGE
+    return UNAVAILABLE_MESSAGE
+
+
+class Provider:
+    """One OpenAI-compatible endpoint and model, with its own clients (one per event loop) and latency stats."""
+
+    def __init__(self, name, api_key, base_url=None, model=None, max_retries=openai_client.MAX_RETRIES):
+        self.name = name
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.max_retries = max_retries
+        self._clients = {}
+        self.ttft = collections.deque(maxlen=TTFT_WINDOW)
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.wins = 0
+
+    def client(self):
+        """The AsyncOpenAI client for the running loop, created on first use inside it."""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = openai_client.build_async_client(self.api_key, self.base_url, self.max_retries)
+            self._clients[loop] = client
+        return client
+
+    def record_ttft(self, seconds):
+        self.ttft.append(seconds)
+        metrics.observe("provider_ttft_seconds", seconds, labels={"provider": self.name})
+
+    def count(self, field):
+        setattr(self, field, getattr(self, field) + 1)
+        if field != "wins":
+            metrics.inc(f"provider_{field}_total", labels={"provider": self.name})
+
+    def percentile(self, q):
+        if not self.ttft:
+            return None
+        ordered = sorted(self.ttft)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def stats(self):
+        return {
+            "model": self.model,
+            "base_url": self.base_url,
+            "requests": self.requests,
+            "wins": self.wins,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "ttft_p50": self.percentile(0.5),
+            "ttft_p99": self.percentile(0.99),
+        }
+
+
+class _Attempt:
+    def __init__(self, provider, task):
+        self.provider = provider
+        self.task = task
+        self.started = time.perf_counter()
+
+
+class ChatRouter:
+    def __init__(self, providers, first_token_timeout=FIRST_TOKEN_TIMEOUT_SECONDS,
+                 deadline=REQUEST_DEADLINE_SECONDS, hedge_after=None):
+        self.providers = providers
+        self.first_token_timeout = first_token_timeout
+        self.deadline = deadline
+        self.hedge_after = hedge_after or None
+        self.probe_results = None  # Set by the latest probe()
+
+    def stats(self):
+        return {provider.name: provider.stats() for provider in self.providers}
+
+    async def _pump(self, attempt, model, messages, events):
+        try:
+            async for delta in openai_client.stream_deltas(attempt.provider.client(), attempt.provider.model or model, messages):
+                await events.put((attempt, "delta", delta))
+            await events.put((attempt, "done", None))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await events.put((attempt, "error", e))
+
+    async def stream(self, messages, model=None):
+        """
+        Yields the reply's deltas from whichever provider answers first.
+        Raises DeadlineExceeded or AllProvidersFailed if none does in time;
+        a provider failing after its first token raises its own error.
+        """
+        events = asyncio.Queue()
+        pending = list(self.providers)
+        attempts = []
+        errors = []
+        started = time.perf_counter()
+        hedged = False
+
+        def launch(provider, hedge=False):
+            attempt = _Attempt(provider, None)
+            attempt.task = asyncio.create_task(self._pump(attempt, model, messages, events))
+            attempts.append(attempt)
+            provider.count("requests")
+            if hedge:
+                provider.count("hedges")
+
+        def cancel(attempt):
+            attempt.task.cancel()
+            attempts.remove(attempt)
+
+        try:
+            if not pending:
+                raise AllProvidersFailed([])
+            launch(pending.pop(0))
+            winner = None
+            # Until the first token: race attempts, hedge, and fall back on errors or slow starts.
+            while winner is None:
+                now = time.perf_counter()
+                wake_at = [started + self.deadline]
+                wake_at.extend(a.started + self.first_token_timeout for a in attempts)
+                if self.hedge_after and not hedged:
+                    wake_at.append(attempts[0].started + self.hedge_after)
+                try:
+                    attempt, kind, value = await asyncio.wait_for(events.get(), max(0.0, min(wake_at) - now))
+                except TimeoutError:
+                    now = time.perf_counter()
+                    if now >= started + self.deadline:
+                        raise DeadlineExceeded(f"no reply within {self.deadline:g}s")
+                    for slow in [a for a in attempts if now >= a.started + self.first_token_timeout]:
+                        slow.provider.count("timeouts")
+                        errors.append((slow.provider.name, DeadlineExceeded(f"no first token within {self.first_token_timeout:g}s")))
+                        cancel(slow)
+                    if self.hedge_after and not hedged and attempts and now >= attempts[0].started + self.hedge_after:
+                        hedged = True
+                        launch(pending.pop(0) if pending else attempts[0].provider, hedge=True)
+                    if not attempts:
+                        if not pending:
+                            raise AllProvidersFailed(errors)
+                        launch(pending.pop(0))
+                    continue
+                if attempt not in attempts:
+                    continue  # Late event from a cancelled attempt
+                if kind == "error":
+                    attempt.provider.count("errors")
+                    errors.append((attempt.provider.name, value))
+                    attempts.remove(attempt)
+                    if not attempts:
+                        if not pending:
+                            raise AllProvidersFailed(errors)
+                        launch(pending.pop(0))
+                    continue
+                winner = attempt
+                winner.provider.count("wins")
+                winner.provider.record_ttft(time.perf_counter() - winner.started)
+                for other in [a for a in attempts if a is not winner]:
+                    cancel(other)
+                if kind == "done":
+                    return
+                yield value
+            # Then stream the winner until it finishes or the deadline passes.
+            while True:
+                remaining = started + self.deadline - time.perf_counter()
+                try:
+                    attempt, kind, value = await asyncio.wait_for(events.get(), max(0.0, remaining))
+                except TimeoutError:
+                    raise DeadlineExceeded(f"reply not finished within {self.deadline:g}s")
+                if attempt is not winner:
+                    continue
+                if kind == "done":
+                    return
+                if kind == "error":
+                    winner.provider.count("errors")
+                    raise value
+                yield value
+        finally:
+            for attempt in attempts:
+                attempt.task.cancel()
+
+    async def probe(self):
+        """Lists models on every provider. Returns {name: (ok, latency_seconds, error_message)}."""
+        results = {}
+        for provider in self.providers:
+            start = time.perf_counter()
+            try:
+                await provider.client().with_options(timeout=openai_client.PROBE_TIMEOUT_SECONDS, max_retries=0).models.list()
+                results[provider.name] = (True, time.perf_counter() - start, None)
+            except Exception as e:
+                results[provider.name] = (False, time.perf_counter() - start, str(e))
+        self.probe_results = results
+        return results
+
+
+def build_router(config):
+    """Builds the router from secrets or a config dict (see the module docstring)."""
+    entries = config.get("CHAT_PROVIDERS") or [{"name": "openai"}]
+    default_model = config.get("OPENAI_MODEL")
+    providers = []
+    for index, entry in enumerate(entries):
+        # With somewhere to fall back to, retrying the same endpoint only delays the fallback.
+        retries = 0 if index < len(entries) - 1 else openai_client.MAX_RETRIES
+        providers.append(Provider(
+            entry.get("name") or f"provider{index + 1}",
+            entry.get("api_key") or config.get("OPENAI_API_KEY"),
+            entry.get("base_url") or config.get("OPENAI_BASE_URL"),
+            entry.get("model") or default_model,
+            entry.get("max_retries", retries),
+        ))
+    return ChatRouter(
+        providers,
+        first_token_timeout=config.get("FIRST_TOKEN_TIMEOUT_SECONDS", FIRST_TOKEN_TIMEOUT_SECONDS),
+        deadline=config.get("REQUEST_DEADLINE_SECONDS", REQUEST_DEADLINE_SECONDS),
+        hedge_after=config.get("HEDGE_AFTER_SECONDS"),
+    )
+
+
+# --- Synchronous bridge for Home.py ---
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop():
+    """The process-wide event loop the Streamlit app's streams run on, started on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="chat-provider-loop", daemon=True).start()
+            _loop = loop
+    return _loop
+
+
+_END = object()
+
+
+class SyncStream:
+    """
+    Iterates a router stream from a synchronous caller. `close()` may be
+    called from any thread (e.g. the time-limit timer) and ends the
+    iteration promptly, cancelling the upstream requests.
+    """
+
+    def __init__(self, router, messages, model=None):
+        self._queue = queue.Queue()
+        self._future = asyncio.run_coroutine_threadsafe(self._drain(router.stream(messages, model)), _background_loop())
+        # Also runs when the task is cancelled before it starts, so the reader never waits forever.
+        self._future.add_done_callback(lambda _: self._queue.put(_END))
+
+    async def _drain(self, deltas):
+        try:
+            async for delta in deltas:
+                self._queue.put(delta)
+        except Exception as e:
+            self._queue.put(e)
+        finally:
+            await deltas.aclose()
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def close(self):
+        self._future.cancel()
+
+
+def stream_sync(router, messages, model=None):
+    return SyncStream(router, messages, model)
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """
+    Returns the process-wide router configured in streamlit secrets, built on
+    first use. Its probe runs in the background instead of delaying the
+    prompt that needed the router; see `probe_results`.
+    """
+    global _router
+    with _router_lock:
+        if _router is None:
+            router = build_router(st.secrets)
+            asyncio.run_coroutine_threadsafe(router.probe(), _background_loop())
+            _router = router
+    return _router
+
+
+def current_router():
+    """The process-wide router if a prompt has needed it yet, else None."""
+    return _router
@@ -0,0 +1,429 @@
+# chat_session.py
+import threading
+import time
+import blocklist
+import chat_provider
+import content_filter as cf
+import conversation_context as cc
+import metrics
+import password_manager as pm
+import response_cache
+import settings_helper
+import time_manager as tm
+import transcript
+
+DEFAULT_MODEL = "gpt-3.5-turbo"
+TIME_LIMIT_MESSAGE = "Time limit reached. Chat disabled."
+CUTOFF_NOTE = "… *(stopped: time limit reached)*"
+DEFAULT_PREFLIGHT_REFUSAL = "Sorry, I can't help with that. Your message contains a word your parent has blocked."
+
+# Prompts stopped before the API call, across every session in the process.
+_preflight_lock = threading.Lock()
+_preflight_counts = {"prompts_checked": 0, "api_calls_avoided": 0, "prompt_tokens_avoided": 0}
+
+
+def _count_preflight(checked, avoided=0, tokens=0):
+    with _preflight_lock:
+        _preflight_counts["prompts_checked"] += checked
+        _preflight_counts["api_calls_avoided"] += avoided
+        _preflight_counts["prompt_tokens_avoided"] += tokens
+
+
+def preflight_stats():
+    """Process-wide pre-flight counters (prompts checked, API calls and estimated prompt tokens avoided)."""
+    with _preflight_lock:
+        return dict(_preflight_counts)
+
+
+class SessionState(dict):
+    """A dict with attribute access, standing in for st.session_state outside Streamlit."""
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key) from None
+
+    def __setattr__(self, key, value):
+        self[key] = value
+
+
+class ChatSession:
+    """
+    One household's chat, independent of any UI: settings, parent password,
+    keyword filtering, time accounting, history and reply bookkeeping. State
+    lives in a mapping with attribute access (st.session_state in Home.py,
+    SessionState in server.py) under the same keys the app always used. The
+    caller supplies the model stream, so the same controller backs
+    Streamlit's synchronous reruns and the asyncio server.
+
+    With admin_sessions=False (the server) a correct password never starts an
+    admin session: one ChatSession serves every client of the household, so a
+    session started by one of them would authorize all the others.
+    """
+
+    def __init__(self, uuid, state=None, config=None, cache=None, admin_sessions=True):
+        self.uuid = uuid
+        self.admin_sessions = admin_sessions
+        self.state = SessionState() if state is None else state
+        self.cache = cache
+        config = config or {}
+        self.settings = settings_helper.get_settings_session(self.state, uuid)
+        if "openai_model" not in self.state:
+            self.state["openai_model"] = config.get("OPENAI_MODEL", DEFAULT_MODEL)
+        if "messages" not in self.state:
+            self.state["messages"] = transcript.open_transcript(uuid)
+        if "conversation_context" not in self.state:
+            self.state["conversation_context"] = cc.ConversationContext(
+                config.get("CONTEXT_TOKEN_BUDGET", cc.DEFAULT_TOKEN_BUDGET),
+                self.state["messages"]
+            )
+        self.ledger = tm.get_time_ledger(self.state)
+        self.preflight = bool(config.get("PREFLIGHT_FILTER_ENABLED", False))
+        self.preflight_refusal = config.get("PREFLIGHT_REFUSAL", DEFAULT_PREFLIGHT_REFUSAL)
+        self.api_calls_avoided = 0
+        # Per-session usage for capacity planning (see stats()); kept whether or not metrics are enabled.
+        self.replies = 0
+        self.filtered_replies = 0
+        self.api_calls = 0
+        self.api_errors = 0
+        self.api_seconds = 0.0
+        self.ttft_seconds = 0.0
+        self.ttft_samples = 0
+
+    @property
+    def messages(self):
+        return self.state["messages"]
+
+    @property
+    def has_password(self):
+        return bool(self.state.get("parent_password_hash"))
+
+    @property
+    def time_limit_reached(self):
+        return self.state.get("time_exceeded_flag", False)
+
+    def status(self):
+        """A JSON-ready summary of the household's controls and usage."""
+        used, _, _ = self.limit_status()
+        locked = pm.is_keywords_locked(self.state) and self.has_password
+        return {
+            "has_password": self.has_password,
+            "admin_session_seconds": int(pm.admin_session_remaining(self.state)),
+            "keywords_locked": locked,
+            "banned_keywords": None if locked else cf.get_banned_keywords(self.state),
+            "blocklist": blocklist.household_summary(self.state),
+            "time_limit_active": self.state.time_limit_active,
+            "time_limit_minutes": self.state.time_limit_minutes,
+            "time_used_seconds": int(used),
+            "time_limit_reached": self.time_limit_reached,
+            "messages": len(self.messages),
+            "api_calls_avoided": self.api_calls_avoided,
+        }
+
+    # --- Runs and persistence ---
+
+    def begin_run(self):
+        """Starts counting settings writes for a new script rerun (or server request)."""
+        self.settings.begin_run()
+        metrics.inc("reruns_total")
+
+    def stats(self):
+        """Per-session counters: reruns, settings writes, replies, filtering and API latency."""
+        settings_stats = self.settings.stats()
+        return {
+            "reruns": settings_stats["runs"],
+            "settings_writes": settings_stats["total_writes"],
+            "settings_conflicts": settings_stats["conflicts"],
+            "replies": self.replies,
+            "filtered_replies": self.filtered_replies,
+            "api_calls": self.api_calls,
+            "api_errors": self.api_errors,
+            "api_calls_avoided": self.api_calls_avoided,
+            "api_seconds_avg": self.api_seconds / self.api_calls if self.api_calls else None,
+            "ttft_seconds_avg": self.ttft_seconds / self.ttft_samples if self.ttft_samples else None,
+        }
+
+    def reload_settings(self):
+        """Picks up settings another process (e.g. the Streamlit app) saved since this session last read them."""
+        return self.settings.refresh(self.state)
+
+    def save(self):
+        self.settings.save()
+
+    def flush(self):
+        self.settings.flush(self.state)
+
+    def commit_time(self):
+        """Folds the running session into today's total and copies the ledger into the state."""
+        self.ledger.checkpoint()
+        self.ledger.store(self.state)
+
+    # --- Time limit ---
+
+    def limit_status(self):
+        """Returns (total_seconds_today, limit_seconds, is_exceeded)."""
+        return self.ledger.limit_status(self.state.time_limit_active, self.state.time_limit_minutes)
+
+    def refresh_time(self):
+        """Rolls the day over, starts/stops the ledger and updates the exceeded flag. Returns limit_status()."""
+        with metrics.span("time_refresh"):
+            return self._refresh_time()
+
+    def _refresh_time(self):
+        if self.ledger.sync(self.state.time_limit_active):
+            self.ledger.store(self.state)
+            self.save()
+        used, limit_seconds, exceeded = self.limit_status()
+        if exceeded != self.time_limit_reached:
+            self.state["time_exceeded_flag"] = exceeded
+            self.commit_time()
+            self.save()
+        return used, limit_seconds, exceeded
+
+    def seconds_until_limit(self):
+        """Seconds left today, or None while no limit is active."""
+        if not self.state.time_limit_active:
+            return None
+        used, limit_seconds, _ = self.limit_status()
+        return max(0.0, limit_seconds - used)
+
+    def check_time_limit(self):
+        """Marks the limit as reached if it has just been crossed. Returns True only on that transition."""
+        _, _, exceeded = self.limit_status()
+        if exceeded and not self.time_limit_reached:
+            self.state["time_exceeded_flag"] = True
+            self.commit_time()
+            self.save()
+            return True
+        return False
+
+    def mark_time_limit_reached(self):
+        self.state["time_exceeded_flag"] = True
+        self.commit_time()
+        self.save()
+
+    def note_time_limit(self):
+        """Appends the 'time limit reached' message once. Returns True if it was added."""
+        if not self.time_limit_reached:
+            return False
+        if self.messages and self.messages[-1].content.startswith(cc.TIME_LIMIT_PREFIX):
+            return False
+        self.add_message("assistant", TIME_LIMIT_MESSAGE)
+        return True
+
+    def update_time_limit(self, active, minutes, reset=False):
+        self.state["time_limit_active"] = active
+        self.state["time_limit_minutes"] = minutes
+        if reset:
+            self.ledger.reset()
+            self.state["time_exceeded_flag"] = False
+        self.ledger.sync(active)
+        self.ledger.store(self.state)
+        self.save()
+
+    # --- Parent password and keywords ---
+
+    def set_initial_password(self, password):
+        if not pm.set_initial_password(self.state, password):
+            return False
+        if self.admin_sessions:
+            pm.start_admin_session(self.state)
+        self.commit_time()
+        self.save()
+        return True
+
+    def authorize_admin(self, password):
+        if not self.admin_sessions:
+            return pm.verify_password(self.state, password)
+        return pm.authorize_admin(self.state, password)
+
+    def change_password(self, new_password, current_password=""):
+        self.commit_time()
+        if pm.change_password(self.state, current_password, new_password):
+            self.save()
+            return True
+        return False
+
+    def unlock_keywords(self, password):
+        if pm.unlock_keywords(self.state, password):
+            self.save()
+            return True
+        return False
+
+    def lock_keywords(self):
+        self.commit_time()
+        pm.lock_keywords(self.state)
+        self.save()
+
+    # The server checks the password on every admin request itself (off the
+    # event loop), then calls these, which do not check it again.
+
+    def set_password(self, new_password):
+        self.commit_time()
+        pm.set_password(self.state, new_password)
+        self.save()
+
+    def open_keywords(self):
+        self.state["keywords_locked"] = False
+
+    def set_banned_keywords(self, keywords):
+        return cf.set_banned_keywords(self.state, keywords)
+
+    def set_blocklist(self, version, categories=None):
+        """Selects an imported blocklist (None removes it); refused while keywords are locked."""
+        return blocklist.set_household_blocklist(self.state, version, categories)
+
+    # --- History ---
+
+    def add_message(self, role, content, is_filtered=False, original_content=None):
+        """Appends a chat message and keeps the API context in step with it."""
+        message = transcript.Message(role, content, original_content, transcript.FILTERED if is_filtered else 0)
+        self.messages.append(message)
+        self.state["conversation_context"].append(message)
+        return message
+
+    def reveal(self, index, password):
+        """Reveals a filtered message's original content if the parent authorizes it."""
+        if not self.authorize_admin(password):
+            return False
+        self.show_original(index)
+        return True
+
+    def show_original(self, index):
+        self.messages.reveal(index)
+        self.state["conversation_context"].update(index, self.messages[index])
+
+    def start_reply(self, prompt):
+        """
+        Records the user's prompt and returns the ReplyTurn that collects the
+        assistant's answer. With the pre-flight filter on, a prompt containing
+        a banned keyword is stored filtered (revealable like a filtered reply)
+        and answered with the refusal without calling the API; the returned
+        turn is then `blocked` and already finished.
+        """
+        if self.preflight:
+            blocked = blocklist.household_matcher(self.state).matches(prompt)
+            if blocked:
+                context = self.state["conversation_context"]
+                tokens = context.window_tokens + cc.count_tokens(prompt) + cc.TOKENS_PER_MESSAGE
+                _count_preflight(1, 1, tokens)
+                metrics.inc("api_calls_avoided_total")
+                self.api_calls_avoided += 1
+                self.add_message("user", cf.FILTERED_MESSAGE, True, prompt)
+                self.add_message("assistant", self.preflight_refusal)
+                return ReplyTurn(self, [], refusal=self.preflight_refusal)
+            _count_preflight(1)
+        self.add_message("user", prompt)
+        return ReplyTurn(self, self.state["conversation_context"].api_messages())
+
+
+class ReplyTurn:
+    """
+    Bookkeeping for one assistant reply: the API request, a cached reply if
+    one exists, the stream filter and the time-limit cutoff. The caller feeds
+    deltas from whatever stream it drives (or from `cached_reply`) and stops
+    once `stopped` is set, then calls `finish()` or `fail()`. A `blocked`
+    turn (prompt stopped by the pre-flight filter) has nothing to stream and
+    its refusal is already recorded.
+    """
+
+    def __init__(self, session, api_messages, refusal=None):
+        self.session = session
+        self.api_messages = api_messages
+        self.refusal = refusal
+        self.model = session.state.openai_model
+        banned_keywords = cf.get_banned_keywords(session.state)
+        self.cache_key = self.cached_reply = None
+        if session.cache is not None and api_messages:
+            self.cache_key = response_cache.make_key(self.model, api_messages, banned_keywords,
+                                                     session.state.get("blocklist"), session.state.get("blocklist_categories"))
+            self.cached_reply = session.cache.get(self.cache_key)
+        self.filter = cf.StreamFilter(banned_keywords, blocklist.household_matcher(session.state))
+        self.seconds_left = session.seconds_until_limit()
+        self.cut_off = False
+        self.started = time.perf_counter()
+        self.first_delta_at = None
+        self.deltas = 0
+
+    @property
+    def blocked(self):
+        return self.refusal is not None
+
+    def feed(self, delta):
+        """Adds a streamed delta and returns the text that is safe to show."""
+        if self.first_delta_at is None:
+            self.first_delta_at = time.perf_counter()
+        self.deltas += 1
+        return self.filter.feed(delta)
+
+    @property
+    def stopped(self):
+        return self.cut_off or self.filter.was_filtered
+
+    def stop_for_time_limit(self):
+        self.cut_off = True
+
+    def finish(self):
+        """Stores the reply and returns (content, was_filtered)."""
+        self.filter.finish()
+        content, was_filtered = self.filter.result()
+        full_text = self.filter.text
+        if self.cut_off and not was_filtered:
+            content += CUTOFF_NOTE
+        if self.cache_key is not None and self.cached_reply is None and not was_filtered and not self.cut_off:
+            self.session.cache.put(self.cache_key, full_text)
+        self.session.add_message("assistant", content, was_filtered, full_text if was_filtered else None)
+        if self.cut_off:
+            self.session.mark_time_limit_reached()
+        self._record(was_filtered)
+        return content, was_filtered
+
+    def _record(self, was_filtered, error=False):
+        """Updates the session's counters and the stream latency histograms for this reply."""
+        session = self.session
+        session.replies += 1
+        metrics.inc("replies_total")
+        if was_filtered:
+            session.filtered_replies += 1
+            metrics.inc("filtered_replies_total")
+        if not self.api_messages:
+            return
+        if self.cached_reply is not None:
+            metrics.inc("cached_replies_total")
+            return
+        total = time.perf_counter() - self.started
+        session.api_calls += 1
+        session.api_seconds += total
+        metrics.inc("api_calls_total")
+        if error:
+            session.api_errors += 1
+            metrics.inc("api_errors_total")
+            return
+        metrics.observe("openai_stream_seconds", total)
+        if self.first_delta_at is not None:
+            ttft = self.first_delta_at - self.started
+            session.ttft_seconds += ttft
+            session.ttft_samples += 1
+            metrics.observe("openai_ttft_seconds", ttft)
+            streaming = total - ttft
+            if self.deltas > 1 and streaming > 0:
+                metrics.observe("openai_chunks_per_second", (self.deltas - 1) / streaming, metrics.RATE_BUCKETS)
+
+    def fail(self, error):
+        """Records a failed reply as a friendly assistant message and returns it; the details stay with the caller."""
+        message = chat_provider.user_message(error)
+        self.session.add_message("assistant", message)
+        self._record(False, error=True)
+        return message
+
+
+def get_chat_session(session_state, uuid, config=None, cache=None):
+    """Returns this browser session's ChatSession, creating it (and loading settings) on first use."""
+    session = session_state.get("chat_session")
+    if session is None or session.uuid != uuid:
+        session = ChatSession(uuid, session_state, config, cache)
+        session_state["chat_session"] = session
+    else:
+        session.begin_run()
+    return session
@@ -1,17 +1,381 @@
+import heapq
+import re
+import threading
 import streamlit as st
+from collections import OrderedDict, deque
+import text_normalizer as tn
+
+FILTERED_MESSAGE = "Content filtered due to banned keywords."
+MATCHER_CACHE_SIZE = 32
+# Below this many keywords a few C-level substring scans beat walking the automaton in Python.
+LINEAR_SCAN_MAX_KEYWORDS = 16
+MAX_WILDCARD_CHARS = 32  # Letters one `*` may stand for
+
+_matcher_cache = OrderedDict()
+_matcher_cache_lock = threading.Lock()  # Streamlit runs each session's script on its own thread
 
 def get_banned_keywords(session_state):
     return session_state.banned_keywords
 
 def set_banned_keywords(session_state, keywords):
     if not session_state.keywords_locked:
+        if keywords != session_state.banned_keywords:
+            invalidate_matcher(session_state.banned_keywords)
         session_state.banned_keywords = keywords
         return True
     return False
 
+def parse_keywords(banned_keywords):
+    """Splits the comma-separated keyword string into a de-duplicated list."""
+    seen = set()
+    keywords = []
+    for kw in (banned_keywords or "").split(','):
+        kw = kw.strip()
+        if kw and kw.lower() not in seen:
+            seen.add(kw.lower())
+            keywords.append(kw)
+    return keywords
+
+
+class _Rule:
+    """
+    A whole-word or wildcard keyword. The automaton finds its longest literal
+    segment (the anchor); the regex then confirms the match around it.
+    """
+
+    __slots__ = ("regex", "before", "after")
+
+    def __init__(self, segments, anchor):
+        gap = r"\w{0,%d}" % MAX_WILDCARD_CHARS
+        self.regex = re.compile(r"(?<!\w)" + gap.join(re.escape(seg) for seg in segments) + r"(?!\w)")
+        # Furthest a match can extend before the anchor's start and after its end
+        self.before = sum(len(seg) for seg in segments[:anchor]) + anchor * MAX_WILDCARD_CHARS
+        self.after = sum(len(seg) for seg in segments[anchor + 1:]) + (len(segments) - anchor - 1) * MAX_WILDCARD_CHARS
+
+
+def parse_rule(keyword):
+    """
+    Returns (anchor, rule) for a keyword: a plain keyword matches anywhere
+    ("ass" also matches "class"), a quoted one ("\"ass\"") only as a whole
+    word, and `*` matches up to MAX_WILDCARD_CHARS letters within a word
+    ("porn*", "*ass"). The anchor is normalized; rule is None for a plain keyword.
+    """
+    bounded = False
+    if len(keyword) >= 2 and keyword[0] == keyword[-1] == '"':
+        keyword = keyword[1:-1]
+        bounded = True
+    segments = [tn.normalize(seg) for seg in keyword.split("*")]
+    if len(segments) > 1:
+        bounded = True
+    anchor = max(range(len(segments)), key=lambda i: len(segments[i]))
+    if not bounded or not segments[anchor]:
+        return segments[anchor], None
+    return segments[anchor], _Rule(segments, anchor)
+
+
+class _Matcher:
+    """
+    Shared matching logic. Subclasses provide `_anchor_matches(normalized)`
+    and `_targets_for(pattern index)` (a list of (keyword, rule or None)),
+    plus `max_keyword_length`, `has_rules` and `__bool__`.
+    """
+
+    max_keyword_length = 0  # Longest match, in normalized characters
+    has_rules = False
+
+    @property
+    def stream_window(self):
+        """Normalized characters a stream must hold back so no match can be missed or confirmed too early."""
+        if self.has_rules:
+            return self.max_keyword_length  # A word-bounded match touching the end waits for the next character
+        return max(self.max_keyword_length - 1, 0)
+
+    def _may_match(self, normalized):
+        """Cheap pre-check; False means `normalized` certainly holds no plain-keyword match."""
+        return True
+
+    def _normalized_matches(self, normalized, start=0, final=True):
+        """
+        Yields (keyword, start, end) in normalized coordinates. Matches that
+        begin before `start` are skipped; with final=False a whole-word match
+        that reaches the end of the text is not reported yet, since the next
+        character may continue the word.
+        """
+        for index, anchor_start, anchor_end in self._anchor_matches(normalized):
+            for keyword, rule in self._targets_for(index):
+                if rule is None:
+                    if anchor_start >= start:
+                        yield keyword, anchor_start, anchor_end
+                    continue
+                lo = max(0, anchor_start - rule.before)
+                hi = min(len(normalized), anchor_end + rule.after + 1)  # One extra character for the lookahead
+                for m in rule.regex.finditer(normalized, lo, hi):
+                    if m.start() <= anchor_start and m.end() >= anchor_end and m.start() >= start \
+                       and (final or m.end() < len(normalized)):
+                        yield keyword, m.start(), m.end()
+                        break
+
+    def iter_matches(self, text):
+        """Yields (keyword, start, end) for every keyword occurrence, with offsets into the original text."""
+        if not self or not text:
+            return
+        normalized = tn.normalize(text)
+        offsets = None
+        for kw, start, end in self._normalized_matches(normalized):
+            if offsets is None:
+                offsets = tn.normalize_with_offsets(text)[1]
+            yield kw, offsets[start], offsets[end - 1] + 1
+
+    def find_all(self, text):
+        return list(self.iter_matches(text))
+
+    def matches(self, text):
+        """True if text contains any keyword; skips mapping the match back to offsets in text."""
+        if not self or not text:
+            return False
+        normalized = tn.normalize(text)
+        return self._may_match(normalized) and next(self._normalized_matches(normalized), None) is not None
+
+    def search(self, text, start=0, final=True):
+        """
+        Returns the first (keyword, start, end) match or None. `start` (an
+        offset into text) and `final` are for streaming: text before `start`
+        is context for whole-word checks only.
+        """
+        if not self or not text:
+            return None
+        normalized = tn.normalize(text)
+        if start == 0 and not self._may_match(normalized):
+            return None
+        normalized_start = tn.normalized_length(text[:start]) if start else 0
+        found = next(self._normalized_matches(normalized, normalized_start, final), None)
+        if found is None:
+            return None
+        kw, match_start, match_end = found
+        offsets = tn.normalize_with_offsets(text)[1]
+        return kw, offsets[match_start], offsets[match_end - 1] + 1
+
+
+class KeywordMatcher(_Matcher):
+    """
+    Aho-Corasick automaton over a keyword list. Built once, then scans any
+    text in a single pass regardless of the number of keywords. Text and
+    keywords go through text_normalizer first, so case, fullwidth and
+    accented forms, look-alike letters, zero-width characters and leetspeak
+    all match the plain keyword. Whole-word and wildcard keywords are found
+    by their literal anchor and confirmed with a regex around it.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = []
+        self._patterns = []  # Normalized anchors fed to the automaton
+        self._targets = []  # Per pattern: [(keyword, rule or None)]
+        pattern_index = {}
+        self.max_keyword_length = 0
+        self.has_rules = False
+        for kw in keywords:
+            anchor, rule = parse_rule(kw)
+            if not anchor:
+                continue
+            if anchor not in pattern_index:
+                pattern_index[anchor] = len(self._patterns)
+                self._patterns.append(anchor)
+                self._targets.append([])
+            self._targets[pattern_index[anchor]].append((kw, rule))
+            self.keywords.append(kw)
+            span = len(anchor) + (rule.before + rule.after if rule else 0)
+            self.max_keyword_length = max(self.max_keyword_length, span)
+            self.has_rules = self.has_rules or rule is not None
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for index, pattern in enumerate(self._patterns):
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                state = nxt
+            self._out[state] = self._out[state] + (index,)
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] = out[nxt] + out[fail[nxt]]
+
+    def __bool__(self):
+        return bool(self.keywords)
+
+    def _targets_for(self, index):
+        return self._targets[index]
+
+    def _may_match(self, normalized):
+        if self.has_rules or len(self._patterns) > LINEAR_SCAN_MAX_KEYWORDS:
+            return True
+        return any(pattern in normalized for pattern in self._patterns)
+
+    def _anchor_matches(self, normalized):
+        """Yields (pattern index, start, end) for every anchor occurrence in normalized text."""
+        if len(self._patterns) <= LINEAR_SCAN_MAX_KEYWORDS:
+            matches = []
+            for index, pattern in enumerate(self._patterns):
+                start = normalized.find(pattern)
+                while start != -1:
+                    matches.append((index, start, start + len(pattern)))
+                    start = normalized.find(pattern, start + 1)
+            matches.sort(key=lambda m: (m[2], -m[1]))
+            yield from matches
+            return
+        goto, fail, out, patterns = self._goto, self._fail, self._out, self._patterns
+        state = 0
+        for pos, ch in enumerate(normalized):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                for index in out[state]:
+                    yield index, pos - len(patterns[index]) + 1, pos + 1
+
+
+class CombinedMatcher(_Matcher):
+    """Several matchers (e.g. the typed keywords and an imported blocklist) searched as one."""
+
+    def __init__(self, matchers):
+        self.matchers = [m for m in matchers if m]
+        self.max_keyword_length = max((m.max_keyword_length for m in self.matchers), default=0)
+        self.has_rules = any(m.has_rules for m in self.matchers)
+
+    def __bool__(self):
+        return bool(self.matchers)
+
+    def _may_match(self, normalized):
+        return any(m._may_match(normalized) for m in self.matchers)
+
+    def _normalized_matches(self, normalized, start=0, final=True):
+        if len(self.matchers) == 1:
+            return self.matchers[0]._normalized_matches(normalized, start, final)
+        return heapq.merge(*(m._normalized_matches(normalized, start, final) for m in self.matchers),
+                           key=lambda match: match[2])
+
+
+def get_matcher(banned_keywords):
+    """Returns the compiled matcher for a keyword string, building it on first use."""
+    banned_keywords = banned_keywords or ""
+    with _matcher_cache_lock:
+        matcher = _matcher_cache.get(banned_keywords)
+        if matcher is not None:
+            _matcher_cache.move_to_end(banned_keywords)
+            return matcher
+    matcher = KeywordMatcher(parse_keywords(banned_keywords))  # Built outside the lock; a racing thread's copy is equal
+    with _matcher_cache_lock:
+        _matcher_cache[banned_keywords] = matcher
+        while len(_matcher_cache) > MATCHER_CACHE_SIZE:
+            _matcher_cache.popitem(last=False)
+    return matcher
+
+def invalidate_matcher(banned_keywords):
+    with _matcher_cache_lock:
+        _matcher_cache.pop(banned_keywords or "", None)
+
+def find_banned_keywords(content, banned_keywords):
+    """Returns a list of (keyword, start, end) for every banned keyword found in content."""
+    return get_matcher(banned_keywords).find_all(content)
+
 def filter_content(content, banned_keywords):
-    banned_list = [kw.strip() for kw in banned_keywords.split(',') if kw.strip()]
-    for kw in banned_list:
-        if kw.lower() in content.lower():
-            return "Content filtered due to banned keywords.", True
-    return content, False
\ No newline at end of file
+    if get_matcher(banned_keywords).matches(content):
+        return FILTERED_MESSAGE, True
+    return content, False
+
+
+class StreamFilter:
+    """
+    Filters a streamed response chunk by chunk. Each chunk is scanned together
+    with a carry-over window as long as the longest match (in normalized
+    characters, so zero-width padding cannot push a keyword out of it) and
+    one character of already released context for whole-word checks. The
+    window is held back from rendering until the next chunk (or finish)
+    proves it safe. Pass `matcher` to filter with something other than the
+    keyword string, such as a household's keywords plus its blocklist.
+    Leet is only folded in words with a letter, so the context also reaches
+    back to the last letter of a word the window cut ("a1234|455"), and a
+    word with no letter yet ("4$$|5ii") is held back whole.
+    """
+
+    def __init__(self, banned_keywords, matcher=None):
+        self.matcher = matcher if matcher is not None else get_matcher(banned_keywords)
+        self.window = self.matcher.stream_window
+        self.parts = []
+        self.safe_length = 0
+        self.match = None
+        self._carry = ""
+        self._context = ""
+
+    @property
+    def text(self):
+        """Everything received so far, unfiltered."""
+        return "".join(self.parts)
+
+    def _scan(self, buffer, final):
+        found = self.matcher.search(self._context + buffer, len(self._context), final)
+        if found is None:
+            return False
+        keyword, start, end = found
+        offset = self.safe_length - len(self._context)
+        self.match = (keyword, offset + start, offset + end)
+        self._carry = ""
+        return True
+
+    def feed(self, chunk):
+        """Adds a chunk and returns the newly released text that is safe to render."""
+        if self.match is not None or not chunk:
+            return ""
+        self.parts.append(chunk)
+        buffer = self._carry + chunk
+        if self._scan(buffer, final=False):
+            return ""
+        keep_from = min(tn.suffix_start(buffer, self.window), tn.letterless_word_start(buffer))
+        released = buffer[:keep_from]
+        self._carry = buffer[keep_from:]
+        if released:
+            context = self._context + released
+            keep_from = tn.word_context_start(context)
+            if self.matcher.has_rules:
+                rule_start = tn.suffix_start(context, 1)
+                if tn.normalized_length(context[rule_start:]):
+                    keep_from = min(keep_from, rule_start)
+            self._context = context[keep_from:]
+        self.safe_length += len(released)
+        return released
+
+    def finish(self):
+        """Releases the held-back window once the stream has ended without a match."""
+        if self.match is not None:
+            return ""
+        if self._carry and self.matcher.has_rules and self._scan(self._carry, final=True):
+            return ""
+        released, self._carry = self._carry, ""
+        self.safe_length += len(released)
+        return released
+
+    @property
+    def was_filtered(self):
+        return self.match is not None
+
+    def result(self):
+        """Returns (filtered_content, was_filtered) like filter_content."""
+        if self.match is not None:
+            return FILTERED_MESSAGE, True
+        return self.text, False
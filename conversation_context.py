@@ -0,0 +1,101 @@
+# conversation_context.py
+import transcript
+
+TIME_LIMIT_PREFIX = "Time limit reached"
+DEFAULT_TOKEN_BUDGET = 3000
+TOKENS_PER_MESSAGE = 4  # Role and separator overhead the chat format adds per message
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken is optional; fall back to a character estimate
+    _encoding = None
+
+
+def count_tokens(text):
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def to_api_message(message):
+    """Returns the {"role", "content"} dict sent to the API for a chat message, or None to leave it out."""
+    role, content = message.role, message.content or ""
+    if role == "assistant" and (content.startswith(TIME_LIMIT_PREFIX) or content == transcript.UNREADABLE_CONTENT):
+        return None
+    if message.is_filtered:  # Filtered replies, and prompts stopped by the pre-flight filter
+        if not message.is_revealed:
+            return None
+        content = message.original_content or content
+    if role and isinstance(content, str) and content:
+        return {"role": role, "content": content}
+    return None
+
+
+class ConversationContext:
+    """
+    API-ready view of the chat history, kept in step with
+    st.session_state.messages instead of being rebuilt for every prompt.
+    Token counts are computed once per message, and the oldest turns slide
+    out of the window once the total exceeds `token_budget`, so every request
+    has a bounded size that is known before it is sent.
+    """
+
+    def __init__(self, token_budget=DEFAULT_TOKEN_BUDGET, messages=()):
+        self.token_budget = token_budget
+        self._base = 0  # Messages older than the window when the context was created are not tracked
+        self._entries = []  # (api_message or None, tokens), parallel to messages[_base:]
+        self._start = 0
+        self.window_tokens = 0
+        self._load_tail(messages)
+
+    def _load_tail(self, messages):
+        # Walk back from the newest message only as far as the budget reaches, so a
+        # lazily loaded transcript is not read in full to restore a session.
+        tail, tokens, index = [], 0, len(messages)
+        while index > 0 and tokens <= self.token_budget:
+            index -= 1
+            api_message = to_api_message(messages[index])
+            tokens += count_tokens(api_message["content"]) + TOKENS_PER_MESSAGE if api_message else 0
+            tail.append(messages[index])
+        self._base = index
+        for message in reversed(tail):
+            self.append(message)
+
+    def __len__(self):
+        return self._base + len(self._entries)
+
+    def append(self, message):
+        api_message = to_api_message(message)
+        tokens = count_tokens(api_message["content"]) + TOKENS_PER_MESSAGE if api_message else 0
+        self._entries.append((api_message, tokens))
+        self.window_tokens += tokens
+        self._trim()
+
+    def update(self, index, message):
+        """Re-derives the entry for a message whose flags changed (e.g. after a parent reveal)."""
+        index -= self._base
+        if index < 0:
+            return
+        api_message = to_api_message(message)
+        tokens = count_tokens(api_message["content"]) + TOKENS_PER_MESSAGE if api_message else 0
+        _, old_tokens = self._entries[index]
+        self._entries[index] = (api_message, tokens)
+        if index >= self._start:
+            self.window_tokens += tokens - old_tokens
+            self._trim()
+
+    def _trim(self):
+        # Always keep the newest message, even if it alone exceeds the budget.
+        last = len(self._entries) - 1
+        while self.window_tokens > self.token_budget and self._start < last:
+            self.window_tokens -= self._entries[self._start][1]
+            self._start += 1
+
+    @property
+    def trimmed_count(self):
+        """Number of older messages that no longer fit in the token budget."""
+        return self._base + self._start
+
+    def api_messages(self):
+        return [api_message for api_message, _ in self._entries[self._start:] if api_message]
@@ -0,0 +1,105 @@
+# limit_enforcer.py
+import heapq
+import itertools
+import threading
+import time
+import streamlit as st
+
+
+class Deadline:
+    """Handle for a scheduled callback. `fired` is set once the callback has run."""
+
+    __slots__ = ("when", "callback", "fired", "cancelled", "_scheduler", "_queued")
+
+    def __init__(self, when, callback, scheduler=None):
+        self.when = when
+        self.callback = callback
+        self.fired = False
+        self.cancelled = False
+        self._scheduler = scheduler
+        self._queued = False  # In the scheduler's heap; changed only under its lock
+
+    def cancel(self):
+        if self._scheduler is None:
+            self.cancelled = True
+        else:
+            self._scheduler._cancel(self)
+
+
+class DeadlineScheduler:
+    """
+    One daemon thread per process that runs callbacks at monotonic deadlines.
+    Sessions register a deadline only while they have something to enforce
+    (an in-flight stream that may cross the time limit), so the cost is a
+    heap entry per active stream rather than per-session polling. Cancelled
+    entries are dropped once they make up half the heap, so streams that end
+    early do not leave it growing until their deadlines pass.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._heap = []
+        self._cancelled = 0  # Cancelled entries still in the heap
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="limit-enforcer", daemon=True)
+        self._thread.start()
+
+    def call_at(self, when, callback):
+        deadline = Deadline(when, callback, self)
+        with self._condition:
+            heapq.heappush(self._heap, (when, next(self._counter), deadline))
+            deadline._queued = True
+            self._condition.notify()
+        return deadline
+
+    def call_later(self, delay_seconds, callback):
+        return self.call_at(self._clock() + max(0.0, delay_seconds), callback)
+
+    def _cancel(self, deadline):
+        with self._condition:
+            if deadline.cancelled:
+                return
+            deadline.cancelled = True
+            if not deadline._queued:
+                return
+            self._cancelled += 1
+            if self._cancelled * 2 > len(self._heap):
+                for _, _, entry in self._heap:
+                    if entry.cancelled:
+                        entry._queued = False
+                self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._heap:
+                    self._condition.wait()
+                when, _, deadline = self._heap[0]
+                delay = when - self._clock()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                deadline._queued = False
+                if deadline.cancelled:
+                    self._cancelled -= 1
+            if deadline.cancelled:
+                continue
+            deadline.fired = True
+            try:
+                deadline.callback()
+            except Exception:
+                pass  # A failing callback (e.g. closing an already closed stream) must not kill the thread
+
+    def pending(self):
+        with self._condition:
+            return len(self._heap) - self._cancelled
+
+
+@st.cache_resource(show_spinner=False)
+def get_scheduler():
+    """Returns the process-wide scheduler shared by every session."""
+    return DeadlineScheduler()
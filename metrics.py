@@ -0,0 +1,291 @@
+# metrics.py
+"""
+Timing spans, counters and histograms for the app's hot paths, exported in
+the Prometheus text format. Everything is off unless METRICS_ENABLED is set
+(environment or secrets); while off, span() returns a shared no-op object
+and inc()/observe() return immediately.
+
+    with metrics.span("settings_load"):
+        ...
+    timer = metrics.span("rerun")   # or start now and stop() later
+    timer.stop()
+"""
+import bisect
+import os
+import tempfile
+import threading
+import time
+
+PREFIX = "parental_controls_"
+# Seconds, from a dictionary lookup to a long streamed reply.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATE_BUCKETS = (1, 5, 10, 20, 40, 80, 160, 320, 640)
+DEFAULT_FILE_INTERVAL_SECONDS = 15
+
+HELP = {
+    "rerun_seconds": "Home.py script run, start to finish or st.rerun()",
+    "settings_load_seconds": "Settings backend read",
+    "settings_save_seconds": "Settings backend write",
+    "time_refresh_seconds": "Time ledger sync and limit check",
+    "password_hash_seconds": "Parent password hashing",
+    "password_verify_seconds": "Parent password verification",
+    "history_render_seconds": "Rendering the visible chat history",
+    "openai_ttft_seconds": "Time from sending a request to the first streamed token",
+    "openai_stream_seconds": "Time from sending a request to the end of the reply",
+    "openai_chunks_per_second": "Streamed chunks (roughly tokens) per second after the first",
+    "reruns_total": "Script runs",
+    "settings_writes_total": "Settings writes that reached the backend",
+    "replies_total": "Assistant replies finished",
+    "cached_replies_total": "Replies served from the response cache",
+    "filtered_replies_total": "Replies replaced by the keyword filter",
+    "api_calls_total": "Streaming chat completions requested",
+    "api_errors_total": "Chat completions that failed",
+    "api_calls_avoided_total": "Prompts refused by the pre-flight filter without an API call",
+    "provider_ttft_seconds": "Time to first token per chat provider",
+    "provider_requests_total": "Requests sent per chat provider",
+    "provider_errors_total": "Failed requests per chat provider",
+    "provider_timeouts_total": "Requests abandoned for missing the first-token deadline, per chat provider",
+    "provider_hedges_total": "Hedge requests fired per chat provider",
+}
+
+_enabled = os.environ.get("METRICS_ENABLED", "").lower() in ("1", "true", "yes")
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_configured = False
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (None when empty)."""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class _Span:
+    __slots__ = ("name", "started", "stopped")
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.stopped = False
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stop(self):
+        """Records the elapsed time once; later calls do nothing."""
+        if not self.stopped:
+            self.stopped = True
+            observe(self.name + "_seconds", time.perf_counter() - self.started)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def stop(self):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def enabled():
+    return _enabled
+
+
+def enable(on=True):
+    global _enabled
+    _enabled = bool(on)
+
+
+def span(name):
+    """Times a block (as a context manager) or from now until stop(); records `{name}_seconds`."""
+    if not _enabled:
+        return _NOOP_SPAN
+    return _Span(name)
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items()))) if labels else (name, ())
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, labels=None):
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+
+def inc(name, amount=1, labels=None):
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def _series(key, extra=()):
+    name, labels = key
+    pairs = labels + extra
+    if not pairs:
+        return name
+    return name + "{" + ",".join(f'{label}="{value}"' for label, value in pairs) + "}"
+
+
+def snapshot():
+    """Returns {"counters": {...}, "histograms": {series: {"count", "sum", "p50", "p99"}}}."""
+    with _lock:
+        return {
+            "counters": {_series(key): value for key, value in _counters.items()},
+            "histograms": {
+                _series(key): {"count": h.count, "sum": h.sum, "p50": h.quantile(0.5), "p99": h.quantile(0.99)}
+                for key, h in _histograms.items()
+            },
+        }
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+def render_prometheus():
+    """All counters and histograms in the Prometheus text exposition format."""
+    lines = []
+    described = set()
+
+    def describe(name, kind):
+        if name not in described:
+            described.add(name)
+            if name in HELP:
+                lines.append(f"# HELP {PREFIX}{name} {HELP[name]}")
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+    with _lock:
+        for key in sorted(_counters):
+            describe(key[0], "counter")
+            lines.append(f"{PREFIX}{_series(key)} {_counters[key]}")
+        for key in sorted(_histograms):
+            histogram = _histograms[key]
+            name, labels = key
+            describe(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                cumulative += count
+                lines.append(f"{PREFIX}{_series((name + '_bucket', labels), (('le', _format_bound(bound)),))} {cumulative}")
+            lines.append(f"{PREFIX}{_series((name + '_sum', labels))} {histogram.sum}")
+            lines.append(f"{PREFIX}{_series((name + '_count', labels))} {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path):
+    """Writes the metrics for a node_exporter textfile collector, replacing the file atomically."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".metrics-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(render_prometheus())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def start_http_server(port, host="127.0.0.1"):
+    """Serves /metrics from a daemon thread. Returns the server."""
+    import http.server  # Only needed with METRICS_PORT
+
+    class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def _write_periodically(path, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            write_prometheus(path)
+        except OSError:
+            pass  # Try again next interval; a missing directory should not take the app down
+
+
+def configure(config):
+    """
+    Applies METRICS_ENABLED, METRICS_FILE (+ METRICS_FILE_INTERVAL_SECONDS)
+    and METRICS_PORT from secrets or a config dict. Only the first call in a
+    process has any effect, so Home.py can call it on every rerun.
+    """
+    global _configured
+    if _configured:
+        return
+    with _lock:
+        if _configured:
+            return
+        _configured = True
+    if config.get("METRICS_ENABLED", False):
+        enable()
+    if not _enabled:
+        return
+    if config.get("METRICS_FILE"):
+        interval = config.get("METRICS_FILE_INTERVAL_SECONDS", DEFAULT_FILE_INTERVAL_SECONDS)
+        threading.Thread(
+            target=_write_periodically, args=(config["METRICS_FILE"], interval), name="metrics-file", daemon=True
+        ).start()
+    if config.get("METRICS_PORT"):
+        start_http_server(int(config["METRICS_PORT"]))
@@ -0,0 +1,74 @@
+# openai_client.py
+import json
+
+# httpx and openai take most of a cold start's import time, so they are imported
+# by the functions that build a client rather than with this module.
+
+# Connection pool shared by every session in the process.
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE_CONNECTIONS = 20
+KEEPALIVE_EXPIRY_SECONDS = 60.0
+
+# Per-request timeouts; `read` bounds the gap between streamed chunks.
+CONNECT_TIMEOUT_SECONDS = 5.0
+READ_TIMEOUT_SECONDS = 30.0
+WRITE_TIMEOUT_SECONDS = 10.0
+POOL_TIMEOUT_SECONDS = 5.0
+MAX_RETRIES = 2
+
+# Startup probe (chat_provider.ChatRouter.probe): lists models so DNS, TCP and TLS
+# setup happen before the first prompt rather than in front of its first token.
+PROBE_TIMEOUT_SECONDS = 5.0
+
+
+def _limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+
+def _timeout():
+    import httpx
+    return httpx.Timeout(
+        connect=CONNECT_TIMEOUT_SECONDS,
+        read=READ_TIMEOUT_SECONDS,
+        write=WRITE_TIMEOUT_SECONDS,
+        pool=POOL_TIMEOUT_SECONDS,
+    )
+
+
+def build_async_client(api_key, base_url=None, max_retries=MAX_RETRIES):
+    """
+    Creates an AsyncOpenAI client with an explicitly sized keep-alive pool,
+    timeouts and retry policy. Create it inside the loop that will use it.
+    """
+    import httpx
+    from openai import AsyncOpenAI
+    http_client = httpx.AsyncClient(limits=_limits(), timeout=_timeout())
+    return AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=max_retries)
+
+
+async def stream_deltas(client, model, messages):
+    """
+    Yields the content deltas of a streamed chat completion. Reads the raw
+    Server-Sent Events through `with_streaming_response` and decodes each
+    chunk with json.loads, skipping the SDK's per-chunk model construction,
+    which dominates CPU time when one process streams many replies at once.
+    """
+    async with client.chat.completions.with_streaming_response.create(model=model, messages=messages, stream=True) as response:
+        async for line in response.iter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            if chunk.get("error"):
+                from openai import APIError
+                raise APIError(chunk["error"].get("message", "stream error"), response.http_request, body=chunk["error"])
+            choices = chunk.get("choices")
+            if choices and choices[0].get("delta", {}).get("content"):
+                yield choices[0]["delta"]["content"]
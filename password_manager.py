@@ -1,30 +1,112 @@
-from werkzeug.security import generate_password_hash, check_password_hash
+import os
+import secrets
+import threading
+import time
 import streamlit as st
+import metrics
+
+# werkzeug method string, e.g. "scrypt" (werkzeug's default), "scrypt:16384:8:1" or "pbkdf2:sha256:600000".
+# Existing hashes keep verifying with the parameters they were created with.
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+ADMIN_SESSION_TTL_SECONDS = int(os.environ.get("ADMIN_SESSION_TTL_SECONDS", "300"))
+
+# Process-wide admin sessions: token -> (expires_at_monotonic, password_hash it was issued for).
+_admin_sessions = {}
+_admin_sessions_lock = threading.Lock()
+
+# werkzeug is imported by the first hash or check, so a child's session that never
+# reaches an admin action does not load it.
+def _hash_password(password):
+    from werkzeug.security import generate_password_hash
+    with metrics.span("password_hash"):
+        return generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+
+def _check_password(password_hash, password):
+    from werkzeug.security import check_password_hash
+    with metrics.span("password_verify"):
+        return check_password_hash(password_hash, password)
 
 def set_initial_password(session_state, password):
     if password:
-        session_state.parent_password_hash = generate_password_hash(password)
+        session_state.parent_password_hash = _hash_password(password)
         session_state.keywords_locked = True
         return True
     return False
 
 def change_password(session_state, current_password, new_password):
-    if check_password_hash(session_state.parent_password_hash, current_password):
-        session_state.parent_password_hash = generate_password_hash(new_password)
+    if has_admin_session(session_state) or _check_password(session_state.parent_password_hash, current_password):
+        set_password(session_state, new_password)
+        start_admin_session(session_state)
         return True
     return False
 
+def set_password(session_state, new_password):
+    """Replaces the password without checking the current one; the caller has authorized it."""
+    session_state.parent_password_hash = _hash_password(new_password)
+    end_admin_session(session_state)
+
 def verify_password(session_state, password):
-    return check_password_hash(session_state.parent_password_hash, password)
+    return _check_password(session_state.parent_password_hash, password)
+
+def start_admin_session(session_state, ttl_seconds=None):
+    """Issues an in-memory admin token for this browser session, valid for ttl_seconds."""
+    ttl = ADMIN_SESSION_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+    token = secrets.token_urlsafe(16)
+    with _admin_sessions_lock:
+        now = time.monotonic()
+        for stale in [t for t, (expires_at, _) in _admin_sessions.items() if expires_at <= now]:
+            del _admin_sessions[stale]
+        _admin_sessions[token] = (now + ttl, session_state.get("parent_password_hash"))
+    session_state.admin_token = token
+    return token
+
+def admin_session_remaining(session_state):
+    """Seconds left in this browser session's admin session, or 0 if there is none."""
+    token = session_state.get("admin_token")
+    if not token:
+        return 0
+    with _admin_sessions_lock:
+        entry = _admin_sessions.get(token)
+    if entry is None:
+        return 0
+    expires_at, password_hash = entry
+    remaining = expires_at - time.monotonic()
+    if remaining <= 0 or password_hash != session_state.get("parent_password_hash"):
+        return 0
+    return remaining
+
+def has_admin_session(session_state):
+    return admin_session_remaining(session_state) > 0
+
+def end_admin_session(session_state):
+    """Locks the admin session (explicit logout)."""
+    token = session_state.get("admin_token")
+    if token:
+        with _admin_sessions_lock:
+            _admin_sessions.pop(token, None)
+    session_state.admin_token = None
+
+def authorize_admin(session_state, password):
+    """
+    True if an admin session is active, or if the password verifies (which
+    starts one). Admin actions use this so one slow hash check covers a
+    run of back-to-back actions.
+    """
+    if has_admin_session(session_state):
+        return True
+    if verify_password(session_state, password):
+        start_admin_session(session_state)
+        return True
+    return False
 
 def is_keywords_locked(session_state):
     return session_state.keywords_locked
 
 def unlock_keywords(session_state, password):
-    if verify_password(session_state, password):
+    if authorize_admin(session_state, password):
         session_state.keywords_locked = False
         return True
     return False
 
 def lock_keywords(session_state):
-    session_state.keywords_locked = True
\ No newline at end of file
+    session_state.keywords_locked = True
@@ -0,0 +1,63 @@
+# render_scheduler.py
+import time
+
+DEFAULT_INTERVAL_MS = 100
+DEFAULT_MIN_CHARS = 200
+CURSOR = "▌"
+
+
+class RenderScheduler:
+    """
+    Batches streamed text before pushing it to a Streamlit placeholder.
+    Streamlit re-sends the whole element on every update, so rendering each
+    delta is quadratic in reply length. Chunks are buffered in a list and the
+    placeholder is only updated once `interval_ms` have passed or `min_chars`
+    new characters have arrived since the last flush. `close()` always
+    renders the final text.
+    """
+
+    def __init__(self, placeholder, interval_ms=DEFAULT_INTERVAL_MS, min_chars=DEFAULT_MIN_CHARS, clock=time.monotonic):
+        self.placeholder = placeholder
+        self.interval = interval_ms / 1000.0
+        self.min_chars = min_chars
+        self.clock = clock
+        self.parts = []
+        self.length = 0
+        self.pending_chars = 0
+        self.last_flush = clock()
+        self.render_calls = 0
+        self.bytes_pushed = 0
+
+    @property
+    def text(self):
+        return "".join(self.parts)
+
+    def append(self, chunk):
+        if not chunk:
+            return
+        self.parts.append(chunk)
+        self.length += len(chunk)
+        self.pending_chars += len(chunk)
+        if self.pending_chars >= self.min_chars or self.clock() - self.last_flush >= self.interval:
+            self.flush()
+
+    def flush(self, final_text=None):
+        """Renders the buffered text (with a cursor) or, if given, the final text."""
+        if final_text is None:
+            if not self.pending_chars:
+                return
+            body = self.text + CURSOR
+        else:
+            body = final_text
+        self.placeholder.markdown(body)
+        self.render_calls += 1
+        self.bytes_pushed += len(body.encode("utf-8"))
+        self.pending_chars = 0
+        self.last_flush = self.clock()
+
+    def close(self, final_text=None):
+        """Always performs the final render; defaults to the accumulated text without cursor."""
+        self.flush(self.text if final_text is None else final_text)
+
+    def stats(self):
+        return {"render_calls": self.render_calls, "bytes_pushed": self.bytes_pushed, "chars": self.length}
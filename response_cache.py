@@ -0,0 +1,154 @@
+# response_cache.py
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import streamlit as st
+import content_filter as cf
+
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_DISK_MAX_ENTRIES = 50000
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+REPLAY_CHUNK_CHARS = 16
+
+
+def normalize_text(text):
+    return " ".join(text.split()).casefold()
+
+
+def make_key(model, api_messages, banned_keywords, blocklist=None, blocklist_categories=()):
+    """Hashes the model, the whitespace/case-normalized context, the banned keyword set and the blocklist selection."""
+    payload = {
+        "model": model,
+        "messages": [[m["role"], normalize_text(m["content"])] for m in api_messages],
+        "banned": sorted({kw.lower() for kw in cf.parse_keywords(banned_keywords)}),
+    }
+    if blocklist:
+        payload["blocklist"] = [blocklist, sorted(blocklist_categories or ())]
+    return hashlib.sha256(json.dumps(payload, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+def replay_chunks(text, size=REPLAY_CHUNK_CHARS):
+    """Splits a cached reply into deltas so it goes through the same streaming path as a live one."""
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+
+class ResponseCache:
+    """
+    Two-tier cache of completed assistant replies. The in-memory tier is an
+    LRU bounded by `max_entries`; the optional on-disk tier is a SQLite table
+    shared by every session (and process) using the same file, bounded by
+    `disk_max_entries`. Entries in both tiers expire after `ttl_seconds`.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 disk_path=None, disk_max_entries=DEFAULT_DISK_MAX_ENTRIES, clock=time.time):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_max_entries = disk_max_entries
+        self.clock = clock
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if disk_path:
+            self._conn = sqlite3.connect(disk_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " last_used REAL NOT NULL"
+                ")"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def get(self, key):
+        now = self.clock()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._memory[key]
+            if self._conn is not None:
+                row = self._conn.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None and row[1] > now:
+                    self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                    self._remember(key, row[1], row[0])
+                    self.disk_hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        expires_at = self.clock() + self.ttl_seconds
+        with self._lock:
+            self._remember(key, expires_at, value)
+            self.stores += 1
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                    (key, value, expires_at, self.clock())
+                )
+                if self.stores % 100 == 0:
+                    self._prune_disk()
+
+    def _remember(self, key, expires_at, value):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _prune_disk(self):
+        self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (self.clock(),))
+        self._conn.execute(
+            "DELETE FROM responses WHERE key IN ("
+            " SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?"
+            ")",
+            (self.disk_max_entries,)
+        )
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "lookups": lookups,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "memory_entries": len(self._memory),
+        }
+
+
+def build_cache(secrets):
+    """Creates the cache from streamlit secrets, or returns None if RESPONSE_CACHE_ENABLED is not set."""
+    if not secrets.get("RESPONSE_CACHE_ENABLED", False):
+        return None
+    disk_path = secrets.get("RESPONSE_CACHE_PATH", "response_cache.sqlite3")
+    return ResponseCache(
+        max_entries=secrets.get("RESPONSE_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES),
+        ttl_seconds=secrets.get("RESPONSE_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS),
+        disk_path=disk_path or None,
+        disk_max_entries=secrets.get("RESPONSE_CACHE_DISK_MAX_ENTRIES", DEFAULT_DISK_MAX_ENTRIES),
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_cache():
+    """Returns the process-wide cache configured in streamlit secrets (None when disabled)."""
+    return build_cache(st.secrets)
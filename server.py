@@ -0,0 +1,396 @@
+# server.py
+"""
+Headless asyncio server for the parental-controls chat, an alternative to
+`streamlit run Home.py` for serving many concurrent chats from one process.
+Every household gets one ChatSession (the same controller Home.py uses), and
+replies stream from AsyncOpenAI to the client as Server-Sent Events.
+
+    python server.py --port 8600
+
+Configuration is read from `.streamlit/secrets.toml` like the Streamlit app
+(OPENAI_API_KEY may also come from the environment).
+
+Endpoints, all under /api/sessions/{uuid}:
+    GET                     status (time used, limit, lock state)
+    GET  stats              per-session counters (reruns/requests, writes, replies, API latency)
+    GET  messages           history page (?start=&limit=)
+    POST chat               {"prompt"} -> text/event-stream of `delta` events, then `done` or `error`
+                            (`done` has "blocked": true and the filtered prompt's "prompt_index"
+                            when the pre-flight filter refused the prompt)
+    POST password           {"new_password", "password"}: set the initial password or change it
+    POST keywords           {"keywords", "password", "lock"}
+    POST blocklist          {"password", "text" (a list file's contents, imported and indexed) or
+                            "version" (an imported list, null to remove), "category", "categories", "lock"}
+    POST time-limit         {"password", "active", "minutes", "reset"}
+    POST reveal             {"password", "index"}
+
+The admin endpoints (password, keywords, blocklist, time-limit, reveal) check "password" on
+every request once a parent password is set; the server keeps no parent admin session.
+
+GET /metrics returns the Prometheus text export (empty unless METRICS_ENABLED is set), and
+GET /api/providers each chat provider's request counts and time-to-first-token p50/p99.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+from collections import OrderedDict
+import streamlit as st
+import tornado.iostream
+import tornado.web
+import blocklist
+import chat_history
+import chat_provider
+import chat_session
+import metrics
+import response_cache
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8600
+MAX_SESSIONS = 1000  # Households kept in memory; the least recently used one is flushed and dropped
+
+
+def load_config():
+    """Reads the streamlit secrets file, falling back to the environment for OPENAI_API_KEY."""
+    try:
+        config = dict(st.secrets)
+    except FileNotFoundError:
+        config = {}
+    if "OPENAI_API_KEY" not in config and os.environ.get("OPENAI_API_KEY"):
+        config["OPENAI_API_KEY"] = os.environ["OPENAI_API_KEY"]
+    return config
+
+
+class SessionRegistry:
+    """
+    One ChatSession per household, shared by every connection for it. A
+    per-household lock serializes replies so two tabs cannot interleave turns
+    in the same conversation; different households stream concurrently.
+    """
+
+    def __init__(self, config, cache=None, max_sessions=MAX_SESSIONS):
+        self.config = config
+        self.cache = cache
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._turn_locks = {}
+
+    def get(self, uuid):
+        session = self._sessions.get(uuid)
+        if session is None:
+            session = chat_session.ChatSession(uuid, config=self.config, cache=self.cache, admin_sessions=False)
+            self._sessions[uuid] = session
+            self._turn_locks[uuid] = asyncio.Lock()
+            self._evict()
+        else:
+            self._sessions.move_to_end(uuid)
+            session.begin_run()
+            # The parent may have changed the password or keywords in the Streamlit app meanwhile
+            session.reload_settings()
+        return session
+
+    def turn_lock(self, uuid):
+        return self._turn_locks[uuid]
+
+    def _evict(self):
+        while len(self._sessions) > self.max_sessions:
+            uuid, session = next(iter(self._sessions.items()))
+            if self._turn_locks[uuid].locked():
+                break  # Never drop a household mid-reply
+            self._sessions.popitem(last=False)
+            del self._turn_locks[uuid]
+            session.commit_time()
+            session.save()
+            session.flush()
+            session.messages.close()
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4")
+        self.write(metrics.render_prometheus())
+
+
+class ProvidersHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.write(self.application.router.stats())
+
+
+class SessionHandler(tornado.web.RequestHandler):
+    def prepare(self):
+        self.chat = None
+
+    def get_chat(self, uuid):
+        self.chat = self.application.sessions.get(uuid)
+        self.chat.refresh_time()
+        return self.chat
+
+    def on_finish(self):
+        if self.chat is not None:
+            self.chat.flush()
+
+    def json_body(self):
+        try:
+            body = json.loads(self.request.body or b"{}")
+        except ValueError:
+            raise tornado.web.HTTPError(400, "Request body is not valid JSON")
+        if not isinstance(body, dict):
+            raise tornado.web.HTTPError(400, "Request body must be a JSON object")
+        return body
+
+    async def authorize(self, chat, password):
+        """
+        Checks the parent password off the event loop, since the hash is
+        deliberately slow. Every admin request must carry the password: the
+        household's ChatSession is shared by all its clients, so it keeps no
+        admin session that could authorize one client for another.
+        """
+        if not chat.has_password:
+            raise tornado.web.HTTPError(403, "Set a parent password first")
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(None, chat.authorize_admin, password or ""):
+            raise tornado.web.HTTPError(403, "Incorrect password")
+
+    def write_error(self, status_code, **kwargs):
+        exc = kwargs.get("exc_info", (None, None, None))[1]
+        message = getattr(exc, "log_message", None) or self._reason
+        self.finish({"error": message})
+
+
+class StatusHandler(SessionHandler):
+    def get(self, uuid):
+        self.write(self.get_chat(uuid).status())
+
+
+class StatsHandler(SessionHandler):
+    def get(self, uuid):
+        self.write(self.get_chat(uuid).stats())
+
+
+class MessagesHandler(SessionHandler):
+    def get(self, uuid):
+        chat = self.get_chat(uuid)
+        messages = chat.messages
+        limit = int(self.get_query_argument("limit", str(chat_history.DEFAULT_WINDOW)))
+        default_start = chat_history.visible_start(len(messages), limit)
+        start = max(0, int(self.get_query_argument("start", str(default_start))))
+        page = []
+        for index in range(start, min(len(messages), start + limit if limit else len(messages))):
+            message = messages[index]
+            page.append({
+                "index": index,
+                "role": message.role,
+                "content": chat_history.message_markdown(message),
+                "filtered": message.is_filtered,
+                "revealed": message.is_revealed,
+                "ts": message.ts,
+            })
+        self.write({"total": len(messages), "start": start, "messages": page})
+
+
+class ChatHandler(SessionHandler):
+    async def post(self, uuid):
+        chat = self.get_chat(uuid)
+        prompt = self.json_body().get("prompt")
+        if not isinstance(prompt, str) or not prompt.strip():
+            raise tornado.web.HTTPError(400, "prompt is required")
+        if chat.time_limit_reached:
+            chat.note_time_limit()
+            raise tornado.web.HTTPError(403, chat_session.TIME_LIMIT_MESSAGE)
+        self.set_header("Content-Type", "text/event-stream")
+        self.set_header("Cache-Control", "no-cache")
+        self.set_header("X-Accel-Buffering", "no")
+        async with self.application.sessions.turn_lock(uuid):
+            turn = chat.start_reply(prompt)
+            if turn.blocked:
+                await self.send_event("done", {
+                    "content": turn.refusal,
+                    "filtered": False,
+                    "blocked": True,
+                    "prompt_index": len(chat.messages) - 2,  # The filtered prompt, revealable via POST reveal
+                    "cut_off": False,
+                    "index": len(chat.messages) - 1,
+                })
+                return
+            try:
+                await self._stream(turn)
+            except tornado.iostream.StreamClosedError:
+                turn.finish()  # The client went away; keep what arrived so the transcript stays complete
+                return
+            except Exception as e:
+                await self.send_event("error", {"message": turn.fail(e)})
+                return
+            content, was_filtered = turn.finish()
+            await self.send_event("done", {
+                "content": content,
+                "filtered": was_filtered,
+                "cut_off": turn.cut_off,
+                "index": len(chat.messages) - 1,
+            })
+
+    async def _stream(self, turn):
+        if not turn.api_messages:
+            return
+        if turn.cached_reply is not None:
+            for delta in response_cache.replay_chunks(turn.cached_reply):
+                if not await self._feed(turn, delta):
+                    break
+            return
+        deltas = self.application.router.stream(turn.api_messages, turn.model)
+        try:
+            # The reply may only run until the household's time limit is reached (no deadline without a limit)
+            async with asyncio.timeout(turn.seconds_left):
+                async for delta in deltas:
+                    if not await self._feed(turn, delta):
+                        break
+        except TimeoutError:
+            turn.stop_for_time_limit()
+        finally:
+            await deltas.aclose()  # Closes the upstream response, so a filtered or cut-off reply stops streaming
+
+    async def _feed(self, turn, delta):
+        released = turn.feed(delta)
+        if turn.stopped:
+            return False
+        if released:
+            await self.send_event("delta", {"text": released})
+        return True
+
+    async def send_event(self, event, payload):
+        self.write(f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n")
+        await self.flush()
+
+
+class PasswordHandler(SessionHandler):
+    async def post(self, uuid):
+        chat = self.get_chat(uuid)
+        body = self.json_body()
+        new_password = body.get("new_password")
+        if not new_password:
+            raise tornado.web.HTTPError(400, "new_password is required")
+        if not chat.has_password:
+            chat.set_initial_password(new_password)
+        else:
+            await self.authorize(chat, body.get("password"))
+            chat.set_password(new_password)
+        self.write(chat.status())
+
+
+class KeywordsHandler(SessionHandler):
+    async def post(self, uuid):
+        chat = self.get_chat(uuid)
+        body = self.json_body()
+        if chat.has_password:
+            await self.authorize(chat, body.get("password"))
+            chat.open_keywords()
+        if "keywords" in body:
+            chat.set_banned_keywords(body["keywords"] or "")
+        if chat.has_password and body.get("lock", True):
+            chat.lock_keywords()
+        chat.save()
+        self.write(chat.status())
+
+
+class BlocklistHandler(SessionHandler):
+    async def post(self, uuid):
+        chat = self.get_chat(uuid)
+        body = self.json_body()
+        if chat.has_password:
+            await self.authorize(chat, body.get("password"))
+            chat.open_keywords()
+        version = body.get("version")
+        categories = body.get("categories")
+        if categories is not None and not (isinstance(categories, list) and all(isinstance(c, str) for c in categories)):
+            raise tornado.web.HTTPError(400, "categories must be a list of strings")
+        if body.get("text"):
+            lines = io.StringIO(body["text"])
+            category = body.get("category") or blocklist.DEFAULT_CATEGORY
+            try:
+                # Compiling a large list takes seconds; keep the other chats streaming meanwhile.
+                version, _ = await asyncio.get_running_loop().run_in_executor(None, blocklist.import_lines, lines, category)
+            except blocklist.BlocklistError as e:
+                raise tornado.web.HTTPError(400, str(e))
+        try:
+            chat.set_blocklist(version, categories)
+        except (OSError, blocklist.BlocklistError) as e:
+            raise tornado.web.HTTPError(400, f"Unknown blocklist: {e}")
+        if chat.has_password and body.get("lock", True):
+            chat.lock_keywords()
+        chat.save()
+        self.write(chat.status())
+
+
+class TimeLimitHandler(SessionHandler):
+    async def post(self, uuid):
+        chat = self.get_chat(uuid)
+        body = self.json_body()
+        await self.authorize(chat, body.get("password"))
+        minutes = body.get("minutes", chat.state.time_limit_minutes)
+        if not isinstance(minutes, int) or minutes < 5:
+            raise tornado.web.HTTPError(400, "minutes must be an integer of at least 5")
+        chat.update_time_limit(bool(body.get("active", chat.state.time_limit_active)), minutes, reset=bool(body.get("reset")))
+        self.write(chat.status())
+
+
+class RevealHandler(SessionHandler):
+    async def post(self, uuid):
+        chat = self.get_chat(uuid)
+        body = self.json_body()
+        index = body.get("index")
+        if not isinstance(index, int) or not 0 <= index < len(chat.messages):
+            raise tornado.web.HTTPError(400, "index is out of range")
+        if not chat.messages[index].is_filtered:
+            raise tornado.web.HTTPError(400, "Message was not filtered")
+        await self.authorize(chat, body.get("password"))
+        chat.show_original(index)
+        self.write({"index": index, "content": chat_history.message_markdown(chat.messages[index])})
+
+
+def make_app(config, router, cache=None):
+    prefix = r"/api/sessions/([0-9A-Za-z-]{1,64})"
+    app = tornado.web.Application([
+        (prefix, StatusHandler),
+        (prefix + "/stats", StatsHandler),
+        (prefix + "/messages", MessagesHandler),
+        (prefix + "/chat", ChatHandler),
+        (prefix + "/password", PasswordHandler),
+        (prefix + "/keywords", KeywordsHandler),
+        (prefix + "/blocklist", BlocklistHandler),
+        (prefix + "/time-limit", TimeLimitHandler),
+        (prefix + "/reveal", RevealHandler),
+        (r"/metrics", MetricsHandler),
+        (r"/api/providers", ProvidersHandler),
+    ])
+    app.sessions = SessionRegistry(config, cache)
+    app.router = router
+    return app
+
+
+async def serve(host, port):
+    config = load_config()
+    metrics.configure(config)
+    if "OPENAI_API_KEY" not in config and not config.get("CHAT_PROVIDERS"):
+        raise SystemExit("OPENAI_API_KEY not found in .streamlit/secrets.toml or the environment")
+    router = chat_provider.build_router(config)
+    for name, (ok, latency, error) in (await router.probe()).items():
+        print(f"Provider {name}: " + (f"ok ({latency * 1000:.0f} ms)" if ok else f"not responding ({error})"))
+    app = make_app(config, router, response_cache.build_cache(config))
+    app.listen(port, host)
+    print(f"Serving on http://{host}:{port}/api/sessions/")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
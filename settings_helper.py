@@ -1,48 +1,425 @@
+import glob
 import json
 import os
+import sqlite3
+import tempfile
+import threading
 import streamlit as st
+import metrics
 import time_manager
-from streamlit_local_storage import LocalStorage
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only serialized within one process
+    fcntl = None
+
+PERSISTED_KEYS = [
+    "parent_password_hash", "banned_keywords", "keywords_locked",
+    "time_limit_active", "time_limit_minutes", "time_used_today_seconds",
+    "date_for_time_used", "active_session_start_time_iso", "time_exceeded_flag",
+    "time_history", "blocklist", "blocklist_categories"
+]
+
+# "sqlite" (default) or "json" for the legacy one-file-per-UUID layout.
+SETTINGS_BACKEND = os.environ.get("SETTINGS_BACKEND", "sqlite")
+SETTINGS_DB_PATH = os.environ.get("SETTINGS_DB_PATH", "app_settings.sqlite3")
+
+# Stored next to the settings and bumped on every save; never returned as a setting.
+VERSION_KEY = "_version"
+MAX_SAVE_ATTEMPTS = 5
+
+
+class VersionConflict(Exception):
+    """Raised by a backend save whose expected_version no longer matches the stored one."""
+
+    def __init__(self, uuid, expected, actual):
+        super().__init__(f"settings for {uuid} are at version {actual}, expected {expected}")
+        self.expected = expected
+        self.actual = actual
+
+
+class JsonSettingsBackend:
+    """
+    Original layout: one `app_settings_{uuid}.json` file per household.
+    Writers take an advisory lock on a sidecar `.lock` file, write the whole
+    document to a temporary file, fsync it and rename it over the old one,
+    so readers never take a lock and always see a complete snapshot.
+    """
+
+    name = "json"
+
+    def __init__(self, directory="."):
+        self.directory = directory
+        self._thread_lock = threading.Lock()
+
+    def path_for(self, uuid):
+        return os.path.join(self.directory, f"app_settings_{uuid}.json")
+
+    def _read(self, settings_file):
+        if not os.path.exists(settings_file):
+            return None
+        with open(settings_file, 'r') as f:
+            return json.load(f)
+
+    def load_versioned(self, uuid):
+        """Returns (settings dict or None, version); version 0 means never saved with versioning."""
+        settings = self._read(self.path_for(uuid))
+        if settings is None:
+            return None, 0
+        version = settings.pop(VERSION_KEY, 0)
+        return settings, version
+
+    def load(self, uuid):
+        """Returns the stored settings dict, or None if nothing is stored."""
+        return self.load_versioned(uuid)[0]
+
+    def load_version(self, uuid):
+        return self.load_versioned(uuid)[1]
+
+    def save(self, uuid, values, expected_version=None):
+        """
+        Merges `values` into the stored settings and returns the new version.
+        With `expected_version`, raises VersionConflict instead of writing if
+        another writer saved first (compare-and-swap).
+        """
+        settings_file = self.path_for(uuid)
+        with self._thread_lock, open(settings_file + ".lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            settings = self._read(settings_file) or {}
+            version = settings.pop(VERSION_KEY, 0)
+            if expected_version is not None and expected_version != version:
+                raise VersionConflict(uuid, expected_version, version)
+            settings.update(values)
+            settings[VERSION_KEY] = version + 1
+            self._write_atomic(settings_file, settings)
+            return version + 1
+
+    def _write_atomic(self, settings_file, settings):
+        directory = os.path.dirname(settings_file) or "."
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(settings_file) + ".", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(settings, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, settings_file)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if hasattr(os, "O_DIRECTORY"):
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)  # Make the rename itself durable
+            finally:
+                os.close(dir_fd)
+
+
+class SqliteSettingsBackend:
+    """
+    All households in one SQLite database in WAL mode, one row per (uuid, key)
+    so a save only upserts the keys it is given. A single connection is shared
+    by every session in the process and serialized with a lock.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path=SETTINGS_DB_PATH, legacy_backend=None):
+        self.path = path
+        self.legacy_backend = legacy_backend
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS settings ("
+            " uuid TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT,"
+            " PRIMARY KEY (uuid, key)"
+            ") WITHOUT ROWID"
+        )
+
+    def _load_stored(self, uuid):
+        """(settings, version) from one consistent read, or None if the database has nothing for uuid."""
+        with self._lock:
+            rows = self._conn.execute("SELECT key, value FROM settings WHERE uuid = ?", (uuid,)).fetchall()
+        if not rows:
+            return None
+        settings = {key: json.loads(value) for key, value in rows}
+        version = settings.pop(VERSION_KEY, 0)
+        return settings, version
+
+    def load_versioned(self, uuid):
+        """Returns (settings dict or None, version) from one consistent read."""
+        return self._load_stored(uuid) or self._migrate_legacy(uuid) or (None, 0)
+
+    def load(self, uuid):
+        return self.load_versioned(uuid)[0]
+
+    def load_version(self, uuid):
+        """The stored version alone (one indexed row), for checking whether a cached copy is stale."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM settings WHERE uuid = ? AND key = ?", (uuid, VERSION_KEY)
+            ).fetchone()
+        return json.loads(row[0]) if row else 0
+
+    def save(self, uuid, values, expected_version=None):
+        """Upserts `values` and returns the new version; see JsonSettingsBackend.save for expected_version."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT value FROM settings WHERE uuid = ? AND key = ?", (uuid, VERSION_KEY)
+                ).fetchone()
+                version = json.loads(row[0]) if row else 0
+                if expected_version is not None and expected_version != version:
+                    raise VersionConflict(uuid, expected_version, version)
+                rows = [(uuid, key, json.dumps(value)) for key, value in values.items()]
+                rows.append((uuid, VERSION_KEY, json.dumps(version + 1)))
+                self._conn.executemany(
+                    "INSERT INTO settings (uuid, key, value) VALUES (?, ?, ?) "
+                    "ON CONFLICT (uuid, key) DO UPDATE SET value = excluded.value",
+                    rows
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return version + 1
+
+    def _migrate_legacy(self, uuid):
+        """
+        Imports a household's JSON file the first time it is looked up and
+        returns (settings, version), or None if there is no file. When two
+        processes migrate the same household at once, the one that finds the
+        file gone or the rows already written re-reads them from the database.
+        """
+        if self.legacy_backend is None:
+            return None
+        try:
+            settings = self.legacy_backend.load(uuid)
+        except FileNotFoundError:
+            settings = None
+        if settings is None:
+            return self._load_stored(uuid)
+        try:
+            version = self.save(uuid, {key: settings.get(key) for key in PERSISTED_KEYS if key in settings},
+                                expected_version=0)
+        except VersionConflict:
+            return self._load_stored(uuid)
+        legacy_file = self.legacy_backend.path_for(uuid)
+        try:
+            os.replace(legacy_file, legacy_file + ".migrated")
+        except FileNotFoundError:
+            pass  # Renamed by a process that migrated it at the same time
+        return settings, version
+
+    def migrate_all(self):
+        """Imports every legacy JSON file in the legacy backend's directory. Returns the count."""
+        migrated = 0
+        pattern = os.path.join(self.legacy_backend.directory, "app_settings_*.json")
+        for settings_file in glob.glob(pattern):
+            uuid = os.path.basename(settings_file)[len("app_settings_"):-len(".json")]
+            with self._lock:
+                exists = self._conn.execute("SELECT 1 FROM settings WHERE uuid = ? LIMIT 1", (uuid,)).fetchone()
+            if not exists and self._migrate_legacy(uuid) is not None:
+                migrated += 1
+        return migrated
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """Returns the process-wide settings backend, falling back to JSON files if SQLite is unavailable."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                json_backend = JsonSettingsBackend()
+                if SETTINGS_BACKEND == "json":
+                    _backend = json_backend
+                else:
+                    try:
+                        _backend = SqliteSettingsBackend(SETTINGS_DB_PATH, legacy_backend=json_backend)
+                    except sqlite3.Error as e:
+                        st.warning(f"Settings database unavailable ({e}). Falling back to JSON files.")
+                        _backend = json_backend
+    return _backend
 
 def get_default_settings():
     defaults = {
         "parent_password_hash": None,
         "banned_keywords": "",
         "keywords_locked": False,
+        "blocklist": None,
+        "blocklist_categories": [],
     }
     time_defaults = time_manager.get_default_time_settings()
     defaults.update(time_defaults)
     return defaults
 
-def load_settings(uuid):
-    SETTINGS_FILE = f"app_settings_{uuid}.json"
+def load_settings_versioned(uuid):
+    """Returns (settings with defaults filled in, stored version)."""
     defaults = get_default_settings()
-    if os.path.exists(SETTINGS_FILE):
-        try:
-            with open(SETTINGS_FILE, 'r') as f:
-                settings = json.load(f)
-            for key, default_value in defaults.items():
-                settings.setdefault(key, default_value)
-            time_manager.ensure_time_settings_keys(settings)
-            if settings.get("parent_password_hash") and "keywords_locked" not in settings:
-                settings["keywords_locked"] = True
-            elif not settings.get("parent_password_hash"):
-                settings["keywords_locked"] = False
-            return settings
-        except (json.JSONDecodeError, IOError) as e:
-            st.error(f"Error loading settings file ({SETTINGS_FILE}): {e}. Using defaults.")
-    return defaults
+    backend = get_backend()
+    try:
+        with metrics.span("settings_load"):
+            settings, version = backend.load_versioned(uuid)
+    except (json.JSONDecodeError, IOError, sqlite3.Error) as e:
+        st.error(f"Error loading settings ({backend.name}, {uuid}): {e}. Using defaults.")
+        return defaults, None
+    if settings is None:
+        return defaults, version
+    for key, default_value in defaults.items():
+        settings.setdefault(key, default_value)
+    time_manager.ensure_time_settings_keys(settings)
+    if settings.get("parent_password_hash") and "keywords_locked" not in settings:
+        settings["keywords_locked"] = True
+    elif not settings.get("parent_password_hash"):
+        settings["keywords_locked"] = False
+    return settings, version
+
+def load_settings(uuid):
+    return load_settings_versioned(uuid)[0]
+
+def load_settings_version(uuid):
+    """The stored version, or None if it cannot be read."""
+    backend = get_backend()
+    try:
+        return backend.load_version(uuid)
+    except (json.JSONDecodeError, IOError, sqlite3.Error):
+        return None
 
-def save_settings(settings, uuid):
-    SETTINGS_FILE = f"app_settings_{uuid}.json"
-    persisted_keys = [
-        "parent_password_hash", "banned_keywords", "keywords_locked",
-        "time_limit_active", "time_limit_minutes", "time_used_today_seconds",
-        "date_for_time_used", "active_session_start_time_iso", "time_exceeded_flag"
-    ]
-    settings_to_save = {key: settings.get(key) for key in persisted_keys}
+def save_settings(settings, uuid, keys=None, expected_version=None):
+    """
+    Persists the given keys (all persisted keys by default) of a settings
+    mapping and returns the new version, or None if the write failed. Raises
+    VersionConflict if expected_version is given and is no longer current.
+    """
+    keys = PERSISTED_KEYS if keys is None else keys
+    settings_to_save = {key: settings.get(key) for key in keys}
+    backend = get_backend()
     try:
-        with open(SETTINGS_FILE, 'w') as f:
-            json.dump(settings_to_save, f, indent=4)
-    except IOError as e:
-        st.error(f"Error saving settings file ({SETTINGS_FILE}): {e}")
\ No newline at end of file
+        with metrics.span("settings_save"):
+            return backend.save(uuid, settings_to_save, expected_version)
+    except (IOError, sqlite3.Error) as e:
+        st.error(f"Error saving settings ({backend.name}, {uuid}): {e}")
+        return None
+
+
+class SettingsSession:
+    """
+    Coalesces settings writes for one browser session. `save()` only marks the
+    session as needing a write; `flush()` (called once at the end of a script
+    run and before `st.rerun()`) persists just the keys whose values differ
+    from what was last stored, and skips the write entirely if none do.
+
+    Writes are compare-and-swap on the stored version. If another tab or
+    process saved in between, the session takes that writer's values for the
+    keys it did not change itself and retries with its own changes on top.
+    """
+
+    def __init__(self, uuid, settings, version=0):
+        self.uuid = uuid
+        self._stored = {key: settings.get(key) for key in PERSISTED_KEYS}
+        self.version = version
+        self._pending = False
+        self.runs = 0
+        self.writes_this_run = 0
+        self.writes_last_run = 0
+        self.total_writes = 0
+        self.skipped_writes = 0
+        self.conflicts = 0
+
+    def begin_run(self):
+        self.runs += 1
+        self.writes_last_run = self.writes_this_run
+        self.writes_this_run = 0
+
+    def save(self):
+        self._pending = True
+
+    def dirty_keys(self, settings):
+        return [key for key in PERSISTED_KEYS if settings.get(key) != self._stored.get(key)]
+
+    def _rebase(self, settings, own_keys):
+        """Adopts the stored snapshot for every key this session has not changed."""
+        stored, self.version = load_settings_versioned(self.uuid)
+        for key in PERSISTED_KEYS:
+            if key not in own_keys:
+                settings[key] = stored.get(key)
+                self._stored[key] = stored.get(key)
+
+    def refresh(self, settings):
+        """
+        Adopts what another tab or process stored since this session last read
+        or wrote, keeping the session's own unsaved changes. For long-lived
+        sessions (the server's) that would otherwise never see them. Returns
+        True if anything was reloaded.
+        """
+        version = load_settings_version(self.uuid)
+        if version is None or version == self.version:
+            return False
+        self._rebase(settings, self.dirty_keys(settings))
+        return True
+
+    def flush(self, settings, force=False):
+        if not (self._pending or force):
+            return
+        self._pending = False
+        keys = self.dirty_keys(settings)
+        if not keys:
+            self.skipped_writes += 1
+            return
+        for _ in range(MAX_SAVE_ATTEMPTS):
+            try:
+                version = save_settings(settings, self.uuid, keys, self.version)
+                break
+            except VersionConflict:
+                self.conflicts += 1
+                self._rebase(settings, keys)
+        else:
+            st.error(f"Settings for {self.uuid} kept changing during save; your changes were not stored.")
+            return
+        if version is None:
+            return
+        self.version = version
+        for key in keys:
+            self._stored[key] = settings.get(key)
+        self.writes_this_run += 1
+        self.total_writes += 1
+        metrics.inc("settings_writes_total")
+
+    def stats(self):
+        return {
+            "runs": self.runs,
+            "writes_last_run": self.writes_last_run,
+            "total_writes": self.total_writes,
+            "skipped_writes": self.skipped_writes,
+            "conflicts": self.conflicts,
+        }
+
+def get_settings_session(session_state, uuid):
+    """Returns this browser session's SettingsSession, loading settings into session_state on first use."""
+    session = session_state.get("settings_session")
+    if session is None or session.uuid != uuid:
+        initial_settings, version = load_settings_versioned(uuid)
+        for key, value in initial_settings.items():
+            if key not in session_state:
+                session_state[key] = value
+        session = SettingsSession(uuid, initial_settings, version)
+        session_state["settings_session"] = session
+    session.begin_run()
+    return session
+
+
+if __name__ == "__main__":
+    backend = get_backend()
+    if isinstance(backend, SqliteSettingsBackend):
+        print(f"Migrated {backend.migrate_all()} JSON settings file(s) into {backend.path}.")
+    else:
+        print("SETTINGS_BACKEND is 'json'; nothing to migrate.")
@@ -0,0 +1,75 @@
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time_manager as tm
+
+
+class FakeClocks:
+    def __init__(self, wall):
+        self.wall = wall
+        self.mono = 1000.0
+
+    def clock(self):
+        return self.mono
+
+    def wall_clock(self):
+        return self.wall
+
+    def advance(self, seconds):
+        self.mono += seconds
+        self.wall += seconds
+
+
+def saved_settings(day, used_seconds, started):
+    return {
+        "time_limit_active": True,
+        "time_limit_minutes": 30,
+        "time_used_today_seconds": used_seconds,
+        "date_for_time_used": day.isoformat(),
+        "active_session_start_time_iso": started.isoformat(),
+        "time_history": [0] * tm.HISTORY_DAYS,
+    }
+
+
+def test_session_left_open_on_an_earlier_day_is_not_charged():
+    yesterday = datetime.date(2026, 3, 9)
+    started = datetime.datetime.combine(yesterday, datetime.time(11, 23))
+    now = datetime.datetime.combine(yesterday + datetime.timedelta(days=1), datetime.time(1, 23))
+    clocks = FakeClocks(now.timestamp())
+    ledger = tm.TimeLedger.from_settings(saved_settings(yesterday, 600, started),
+                                         clock=clocks.clock, wall_clock=clocks.wall_clock)
+
+    used, limit_seconds, exceeded = ledger.limit_status(True, 30)
+    assert used == 0 and not exceeded
+    assert ledger.day == now.date()
+    assert ledger.history[yesterday.weekday()] == 600
+    assert ledger.to_settings()["active_session_start_time_iso"] == now.isoformat()
+
+    clocks.advance(120)
+    assert ledger.used_today() == 120
+
+
+def test_session_left_open_days_ago_clears_the_days_between():
+    saved_day = datetime.date(2026, 3, 6)
+    now = datetime.datetime.combine(saved_day + datetime.timedelta(days=3), datetime.time(8, 0))
+    clocks = FakeClocks(now.timestamp())
+    ledger = tm.TimeLedger.from_settings(saved_settings(saved_day, 900, datetime.datetime.combine(saved_day, datetime.time(20))),
+                                         clock=clocks.clock, wall_clock=clocks.wall_clock)
+
+    history = dict(ledger.weekly_history())
+    assert history[saved_day] == 900
+    assert history[saved_day + datetime.timedelta(days=1)] == 0
+    assert history[now.date()] == 0
+
+
+def test_session_open_since_earlier_today_keeps_running():
+    today = datetime.date(2026, 3, 10)
+    started = datetime.datetime.combine(today, datetime.time(9, 0))
+    clocks = FakeClocks(started.timestamp() + 300)
+    ledger = tm.TimeLedger.from_settings(saved_settings(today, 60, started),
+                                         clock=clocks.clock, wall_clock=clocks.wall_clock)
+
+    assert ledger.used_today() == 360
@@ -0,0 +1,204 @@
+# text_normalizer.py
+import os
+import re
+import unicodedata
+
+# Format characters that render as nothing but split a keyword for a naive matcher.
+INVISIBLE_CHARS = (
+    "\u00ad\u034f\u061c\u115f\u1160\u17b4\u17b5\u180b\u180c\u180d\u180e\u180f"
+    "\u200b\u200c\u200d\u200e\u200f\u202a\u202b\u202c\u202d\u202e"
+    "\u2060\u2061\u2062\u2063\u2064\u2066\u2067\u2068\u2069\u206a\u206b\u206c\u206d\u206e\u206f"
+    "\u3164\ufeff\uffa0"
+)
+
+# Latin look-alikes from other scripts, applied after case folding.
+CONFUSABLES = {
+    # Cyrillic
+    "а": "a", "в": "b", "е": "e", "є": "e", "һ": "h", "і": "i", "ї": "i", "ј": "j", "к": "k",
+    "ӏ": "l", "о": "o", "р": "p", "ԛ": "q", "ѕ": "s", "с": "c", "т": "t", "у": "y", "ү": "y",
+    "х": "x", "ԁ": "d", "ԝ": "w", "ɡ": "g",
+    # Greek
+    "α": "a", "β": "b", "ε": "e", "η": "n", "ι": "i", "κ": "k", "ν": "v", "ο": "o", "ρ": "p",
+    "τ": "t", "υ": "u", "χ": "x", "ω": "w", "ς": "s",
+    # Latin variants NFKC keeps
+    "ı": "i", "ȷ": "j", "ł": "l", "ø": "o", "đ": "d", "ħ": "h", "ŧ": "t", "ƀ": "b",
+}
+
+# Digit and symbol substitutions.
+LEET = {"0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "8": "b", "@": "a", "$": "s"}
+
+# "mixed" folds leetspeak only in words that also contain a letter ("k1ll", "$ex"), so numbers
+# such as "455" or "51075" are left alone; "all" folds every digit and symbol; "off" none.
+LEET_FOLDING = os.environ.get("LEET_FOLDING", "mixed")
+# Identifies the folding in effect; compiled blocklist indexes record it (their anchors are normalized).
+SCHEME = f"leet={LEET_FOLDING}"
+
+_CONFUSABLES_TABLE = str.maketrans(CONFUSABLES)
+_LEET_TABLE = str.maketrans(LEET)
+_LEET_SYMBOLS = re.escape("".join(ch for ch in LEET if not ch.isalnum()))
+# A whole word (letters, digits and the leet symbols) without a letter in it: a number, "$5"...
+_NUMBER = re.compile(rf"(?<![\w{_LEET_SYMBOLS}])[\d_{_LEET_SYMBOLS}]+(?![\w{_LEET_SYMBOLS}])")
+# On raw text, where invisible characters still sit inside words: a letter followed by nothing
+# but digits and leet symbols up to the end, and a word at the end with no letter (yet).
+_INVISIBLE = re.escape(INVISIBLE_CHARS)
+_LETTER_TAIL = re.compile(rf"[^\W\d_][\d_{_LEET_SYMBOLS}{_INVISIBLE}]*\Z")
+_LETTERLESS_TAIL = re.compile(rf"(?<![\w{_LEET_SYMBOLS}{_INVISIBLE}])[\d_{_LEET_SYMBOLS}{_INVISIBLE}]+\Z")
+
+
+def _is_invisible(ch):
+    return ch in INVISIBLE_CHARS or unicodedata.category(ch) == "Cf"
+
+
+class _LazyTable(dict):
+    """A str.translate table that computes each code point's mapping the first time it is seen."""
+
+    def __init__(self, fold):
+        super().__init__()
+        self._fold = fold
+
+    def __missing__(self, codepoint):
+        value = self._fold(chr(codepoint))
+        self[codepoint] = value
+        return value
+
+
+_INVISIBLE_TABLE = _LazyTable(lambda ch: None if _is_invisible(ch) else ch)
+_COMBINING_TABLE = _LazyTable(lambda ch: None if unicodedata.combining(ch) else ch)
+
+
+# --- Individual steps, in pipeline order (whole-text versions, used for benchmarking and reference) ---
+
+def strip_invisible(text):
+    return text.translate(_INVISIBLE_TABLE)
+
+
+def nfkc(text):
+    if text.isascii():
+        return text
+    return unicodedata.normalize("NFKC", text)
+
+
+def strip_accents(text):
+    if text.isascii():
+        return text
+    return unicodedata.normalize("NFD", text).translate(_COMBINING_TABLE)
+
+
+def casefold(text):
+    return text.casefold()
+
+
+def fold_confusables(text):
+    return text.translate(_CONFUSABLES_TABLE)
+
+
+def fold_leet(text):
+    """Maps leetspeak to letters as LEET_FOLDING says. Always one character for one, so offsets are kept."""
+    if LEET_FOLDING == "off" or not any(ch in text for ch in LEET):
+        return text
+    folded = text.translate(_LEET_TABLE)
+    if LEET_FOLDING == "all":
+        return folded
+    # Put the words with no letter back as they were; replies have far fewer numbers than words.
+    pieces = []
+    end = 0
+    for match in _NUMBER.finditer(text):
+        pieces.append(folded[end:match.start()])
+        pieces.append(match.group())
+        end = match.end()
+    if not pieces:
+        return folded
+    pieces.append(folded[end:])
+    return "".join(pieces)
+
+
+# In "mixed" mode whether a word's leet is folded depends on the whole word, so text
+# scanned in pieces (StreamFilter) must not cut a word where that decision is lost.
+
+def word_context_start(text):
+    """Index from which the end of already scanned text must stay as context: a cut word's last letter on."""
+    if LEET_FOLDING != "mixed":
+        return len(text)
+    match = _LETTER_TAIL.search(text)
+    return len(text) if match is None else match.start()
+
+
+def letterless_word_start(text):
+    """Index of a word at the end of text that has no letter yet (a later letter would fold it), else len(text)."""
+    if LEET_FOLDING != "mixed":
+        return len(text)
+    match = _LETTERLESS_TAIL.search(text)
+    return len(text) if match is None else match.start()
+
+
+STEPS = [
+    ("strip_invisible", strip_invisible),
+    ("nfkc", nfkc),
+    ("strip_accents", strip_accents),
+    ("casefold", casefold),
+    ("confusables", fold_confusables),
+    ("leet", fold_leet),
+]
+
+
+def normalize_staged(text):
+    """Runs every step in turn; normalize() computes the same result in one pass."""
+    for _, step in STEPS:
+        text = step(text)
+    return text
+
+
+# --- Fused normalization ---
+
+def _fold_char(ch):
+    """Every step but leet, which looks at the whole word around a character."""
+    if _is_invisible(ch):
+        return ""
+    for name, step in STEPS:
+        if name != "leet":
+            ch = step(ch)
+    return ch
+
+
+_FOLD_TABLE = _LazyTable(_fold_char)
+
+
+def normalize(text):
+    """
+    Folds text for keyword matching: invisible characters removed, NFKC,
+    accents stripped, case folded, look-alike letters and leetspeak mapped to
+    Latin. Every step but leet is per character, so they run as a single
+    str.translate over a table filled in as new characters appear; leet
+    folding then maps characters one for one within words.
+    """
+    return fold_leet(text.translate(_FOLD_TABLE))
+
+
+def normalize_with_offsets(text):
+    """Returns (normalized, offsets) where offsets[i] is the index in text that produced normalized[i]."""
+    table = _FOLD_TABLE
+    pieces = []
+    offsets = []
+    for index, ch in enumerate(text):
+        piece = table[ord(ch)]
+        if piece:
+            pieces.append(piece)
+            offsets.extend([index] * len(piece))
+    return fold_leet("".join(pieces)), offsets
+
+
+def normalized_length(text):
+    return len(text.translate(_FOLD_TABLE))
+
+
+def suffix_start(text, length):
+    """Index of the shortest suffix of text that normalizes to at least `length` characters (0 if none does)."""
+    if length <= 0:
+        return len(text)
+    table = _FOLD_TABLE
+    total = 0
+    for index in range(len(text) - 1, -1, -1):
+        total += len(table[ord(text[index])])
+        if total >= length:
+            return index
+    return 0
@@ -1,5 +1,8 @@
 # time_manager.py
 import datetime
+import time
+
+HISTORY_DAYS = 7
 
 def get_default_time_settings():
     """Returns a dictionary of default time-related settings."""
@@ -9,7 +12,8 @@ def get_default_time_settings():
         "time_used_today_seconds": 0,
         "date_for_time_used": datetime.date.today().isoformat(),
         "active_session_start_time_iso": None, # Store as ISO string for JSON
-        "time_exceeded_flag": False
+        "time_exceeded_flag": False,
+        "time_history": [0] * HISTORY_DAYS # Seconds used per weekday (Monday first) over the last week
     }
 
 def ensure_time_settings_keys(settings):
@@ -41,87 +45,182 @@ def ensure_time_settings_keys(settings):
             except (TypeError, ValueError):
                  settings["active_session_start_time_iso"] = None 
                  updated = True
+
+    history = settings.get("time_history")
+    if not isinstance(history, list) or len(history) != HISTORY_DAYS:
+        settings["time_history"] = [0] * HISTORY_DAYS
+        updated = True
     return updated
 
-def commit_session_time(time_used_today_seconds, active_session_start_time_iso):
+
+class TimeLedger:
     """
-    Calculates duration of the current active session and adds it to today's used time.
-    Returns updated time_used_today_seconds and a new active_session_start_time_iso (now).
+    Usage accounting for one browser session, driven by start/stop events on
+    the monotonic clock. The wall clock is read once, when the ledger is
+    created, to anchor monotonic readings to dates, so later clock jumps or
+    DST changes do not corrupt usage. "Used today" is a running total plus the
+    open session and needs no timestamp parsing. Day rollovers are detected by
+    comparing against a precomputed monotonic midnight, and a session that
+    spans midnight is split between the two days.
+
+    The persisted form is the same settings keys the app always used
+    (time_used_today_seconds, date_for_time_used and the ISO start of the open
+    session) plus `time_history`, seven per-weekday totals for the last week.
+    Existing settings therefore load without migration. An open session saved
+    on an earlier day is not charged: the saved day is closed with its
+    committed total and the session restarts when the ledger is created.
     """
-    new_active_session_start_time_iso = datetime.datetime.now().isoformat()
-    if active_session_start_time_iso:
-        try:
-            start_time_dt = datetime.datetime.fromisoformat(active_session_start_time_iso)
-            session_duration = (datetime.datetime.now() - start_time_dt).total_seconds()
-            time_used_today_seconds += session_duration
-        except (TypeError, ValueError):
-            pass 
-    return time_used_today_seconds, new_active_session_start_time_iso
-
-
-def manage_daily_reset_and_state(
-    time_limit_active,
-    time_used_today_seconds,
-    date_for_time_used,
-    active_session_start_time_iso
-):
-    now_dt = datetime.datetime.now()
-    today_str = now_dt.date().isoformat()
-    
-    updated_values = {
-        "time_used_today_seconds": time_used_today_seconds,
-        "date_for_time_used": date_for_time_used,
-        "active_session_start_time_iso": active_session_start_time_iso,
-        "time_exceeded_flag": False 
-    }
-    settings_changed_by_reset = False
-
-    if date_for_time_used != today_str:
-        if active_session_start_time_iso: 
-            committed_time, _ = commit_session_time(time_used_today_seconds, active_session_start_time_iso)
-            updated_values["time_used_today_seconds"] = committed_time
-        
-        updated_values["time_used_today_seconds"] = 0 
-        updated_values["date_for_time_used"] = today_str
-        updated_values["active_session_start_time_iso"] = now_dt.isoformat() if time_limit_active else None
-        settings_changed_by_reset = True
-    
-    if time_limit_active and updated_values["active_session_start_time_iso"] is None:
-        updated_values["active_session_start_time_iso"] = now_dt.isoformat()
-        settings_changed_by_reset = True 
-    elif not time_limit_active and updated_values["active_session_start_time_iso"] is not None:
-        committed_time, _ = commit_session_time(updated_values["time_used_today_seconds"], updated_values["active_session_start_time_iso"])
-        updated_values["time_used_today_seconds"] = committed_time
-        updated_values["active_session_start_time_iso"] = None
-        settings_changed_by_reset = True
-
-    updated_values["settings_were_updated_by_reset"] = settings_changed_by_reset
-    return updated_values
-
-
-def calculate_current_usage_and_limit_status(
-    time_limit_active,
-    time_used_today_seconds, 
-    active_session_start_time_iso, 
-    time_limit_minutes
-):
-    current_session_duration = 0
-    if time_limit_active and active_session_start_time_iso:
+
+    def __init__(self, day, used_seconds=0, history=None, running_since_iso=None,
+                 clock=time.monotonic, wall_clock=time.time):
+        self._clock = clock
+        self._anchor_mono = clock()
+        self._anchor_wall = wall_clock()
+        self.day = day
+        self.used_seconds = float(used_seconds or 0)
+        self.history = list(history) if history and len(history) == HISTORY_DAYS else [0] * HISTORY_DAYS
+        self._running_since = None
+        if running_since_iso:
+            try:
+                started_wall = datetime.datetime.fromisoformat(running_since_iso).timestamp()
+                self._running_since = self._mono_from_wall(min(started_wall, self._anchor_wall))
+            except (TypeError, ValueError):
+                pass
+        self._next_midnight = self._mono_from_wall(self._midnight_after(day))
+        if self._running_since is not None and self._anchor_mono >= self._next_midnight:
+            # A session saved on an earlier day was never stopped (the app was closed mid-session),
+            # so how long it really ran is unknown: that day keeps its committed total and the
+            # session restarts now, as it did before the ledger.
+            self._running_since = None
+            self._roll_over(self._anchor_mono)
+            self._running_since = self._anchor_mono
+
+    @classmethod
+    def from_settings(cls, settings, **clocks):
         try:
-            start_time_dt = datetime.datetime.fromisoformat(active_session_start_time_iso)
-            current_session_duration = (datetime.datetime.now() - start_time_dt).total_seconds()
+            day = datetime.date.fromisoformat(settings.get("date_for_time_used"))
         except (TypeError, ValueError):
-            pass
+            day = datetime.date.today()
+        running_since = settings.get("active_session_start_time_iso") if settings.get("time_limit_active") else None
+        return cls(day, settings.get("time_used_today_seconds"), settings.get("time_history"), running_since, **clocks)
 
-    total_live_seconds_today = time_used_today_seconds + current_session_duration
-    limit_seconds = time_limit_minutes * 60
-    is_exceeded = time_limit_active and (total_live_seconds_today >= limit_seconds)
-    
-    return total_live_seconds_today, limit_seconds, is_exceeded
+    def _mono_from_wall(self, wall):
+        return self._anchor_mono + (wall - self._anchor_wall)
 
-def reset_timer_logic(time_limit_active_state):
-    return {
-        "time_used_today_seconds": 0,
-        "active_session_start_time_iso": datetime.datetime.now().isoformat() if time_limit_active_state else None,
-        "time_exceeded_flag": False
-    }
\ No newline at end of file
+    def _wall_from_mono(self, mono):
+        return self._anchor_wall + (mono - self._anchor_mono)
+
+    @staticmethod
+    def _midnight_after(day):
+        return datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time()).timestamp()
+
+    def _roll_over(self, now):
+        """Closes out every day whose midnight has passed. Returns True if the day changed."""
+        rolled = False
+        while now >= self._next_midnight:
+            if self._running_since is not None:
+                self.used_seconds += self._next_midnight - self._running_since
+                self._running_since = self._next_midnight
+            self.history[self.day.weekday()] = int(self.used_seconds)
+            self.day += datetime.timedelta(days=1)
+            self.used_seconds = 0.0
+            self.history[self.day.weekday()] = 0
+            self._next_midnight = self._mono_from_wall(self._midnight_after(self.day))
+            rolled = True
+        return rolled
+
+    @property
+    def running(self):
+        return self._running_since is not None
+
+    def start(self):
+        now = self._clock()
+        self._roll_over(now)
+        if self._running_since is None:
+            self._running_since = now
+
+    def stop(self):
+        now = self._clock()
+        self._roll_over(now)
+        if self._running_since is not None:
+            self.used_seconds += now - self._running_since
+            self._running_since = None
+
+    def checkpoint(self):
+        """Folds the open session into today's total (the ledger equivalent of committing session time)."""
+        now = self._clock()
+        self._roll_over(now)
+        if self._running_since is not None:
+            self.used_seconds += now - self._running_since
+            self._running_since = now
+
+    def reset(self):
+        now = self._clock()
+        self._roll_over(now)
+        self.used_seconds = 0.0
+        if self._running_since is not None:
+            self._running_since = now
+
+    def sync(self, time_limit_active):
+        """
+        Rolls the day over if needed and starts or stops the session to match
+        the limit toggle. Returns True if persisted state changed.
+        """
+        changed = self._roll_over(self._clock())
+        if time_limit_active and not self.running:
+            self.start()
+            changed = True
+        elif not time_limit_active and self.running:
+            self.stop()
+            changed = True
+        return changed
+
+    def used_today(self):
+        now = self._clock()
+        self._roll_over(now)
+        if self._running_since is None:
+            return self.used_seconds
+        return self.used_seconds + (now - self._running_since)
+
+    def limit_status(self, time_limit_active, time_limit_minutes):
+        """Returns (total_seconds_today, limit_seconds, is_exceeded)."""
+        used = self.used_today()
+        limit_seconds = time_limit_minutes * 60
+        return used, limit_seconds, bool(time_limit_active) and used >= limit_seconds
+
+    def weekly_history(self):
+        """Returns [(date, seconds)] for the last HISTORY_DAYS days, oldest first, today included live."""
+        used = self.used_today()
+        result = []
+        for offset in range(HISTORY_DAYS - 1, -1, -1):
+            day = self.day - datetime.timedelta(days=offset)
+            result.append((day, int(used) if offset == 0 else self.history[day.weekday()]))
+        return result
+
+    def to_settings(self):
+        self._roll_over(self._clock())
+        history = list(self.history)
+        history[self.day.weekday()] = int(self.used_seconds)
+        running_since_iso = None
+        if self._running_since is not None:
+            running_since_iso = datetime.datetime.fromtimestamp(self._wall_from_mono(self._running_since)).isoformat()
+        return {
+            "time_used_today_seconds": self.used_seconds,
+            "date_for_time_used": self.day.isoformat(),
+            "active_session_start_time_iso": running_since_iso,
+            "time_history": history
+        }
+
+    def store(self, settings):
+        """Copies the ledger's persisted form into a settings mapping (e.g. st.session_state)."""
+        for key, value in self.to_settings().items():
+            settings[key] = value
+
+
+def get_time_ledger(session_state):
+    """Returns this browser session's ledger, creating it from the loaded settings on first use."""
+    ledger = session_state.get("time_ledger")
+    if ledger is None:
+        ledger = TimeLedger.from_settings(session_state)
+        session_state["time_ledger"] = ledger
+    return ledger
@@ -0,0 +1,199 @@
+# transcript.py
+import json
+import mmap
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+TRANSCRIPT_DIR = os.environ.get("TRANSCRIPT_DIR", "transcripts")
+DECODED_CACHE_SIZE = 256
+
+# Bits of Message.flags
+FILTERED = 1
+REVEALED = 2
+
+_REVEAL_PREFIX = b'{"op":"reveal"'
+# Shown in place of a line that cannot be decoded, e.g. one glued to a torn write
+# by an older version; kept out of the API context.
+UNREADABLE_CONTENT = "*(This message could not be read.)*"
+
+
+class Message:
+    """A chat message. Boolean state is packed into `flags` to keep per-message memory small."""
+
+    __slots__ = ("role", "content", "original_content", "flags", "ts")
+
+    def __init__(self, role, content, original_content=None, flags=0, ts=None):
+        self.role = role
+        self.content = content
+        self.original_content = original_content
+        self.flags = flags
+        self.ts = time.time() if ts is None else ts
+
+    @property
+    def is_filtered(self):
+        return bool(self.flags & FILTERED)
+
+    @property
+    def is_revealed(self):
+        return bool(self.flags & REVEALED)
+
+    def to_record(self):
+        record = {"ts": round(self.ts, 3), "role": self.role, "content": self.content, "flags": self.flags}
+        if self.original_content is not None:
+            record["original_content"] = self.original_content
+        return record
+
+    @classmethod
+    def from_record(cls, record):
+        return cls(record["role"], record["content"], record.get("original_content"), record.get("flags", 0), record.get("ts", 0.0))
+
+    @classmethod
+    def from_dict(cls, message):
+        """Converts the legacy five-key message dict."""
+        flags = (FILTERED if message.get("is_filtered") else 0) | (REVEALED if message.get("is_revealed") else 0)
+        return cls(message["role"], message["content"], message.get("original_content"), flags)
+
+
+class TranscriptLog:
+    """
+    A household's chat history as an append-only JSONL file. Each message is
+    one line; a later reveal is recorded as a small `{"op":"reveal",...}` line
+    naming the message by the byte offset of its line (list positions differ
+    between tabs appending to the same file) instead of rewriting the
+    message. Opening the log only memory-maps the
+    file and indexes line offsets, so a long history costs 8 bytes per message
+    until individual messages are read (and then only a bounded LRU of them
+    stays decoded). Supports len(), indexing and append() like the plain list
+    Home.py used before.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._offsets = array("Q")
+        self._revealed = set()  # Byte offsets of revealed messages' lines
+        self._decoded = OrderedDict()
+        self._size = 0
+        self._mm = None
+        self._mapped_size = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(path):
+            self._index()
+
+    def _remap(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._mapped_size = 0
+        if self._size:
+            with open(self.path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), self._size, access=mmap.ACCESS_READ)
+            self._mapped_size = self._size
+
+    def _index(self):
+        self._size = os.path.getsize(self.path)
+        self._remap()
+        mm, start = self._mm, 0
+        while mm is not None and start < self._size:
+            end = mm.find(b"\n", start)
+            if end == -1:
+                break  # Ignore a torn final line from an interrupted write
+            if mm[start:start + len(_REVEAL_PREFIX)] == _REVEAL_PREFIX:
+                event = json.loads(mm[start:end])
+                if "offset" in event:
+                    self._revealed.add(event["offset"])
+                elif event["index"] < len(self._offsets):
+                    self._revealed.add(self._offsets[event["index"]])  # Written before reveals were keyed by offset
+            elif end > start:
+                self._offsets.append(start)
+            start = end + 1
+        self._size = start
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("transcript index out of range")
+        with self._lock:
+            message = self._decoded.get(index)
+            if message is not None:
+                self._decoded.move_to_end(index)
+                return message
+            start = self._offsets[index]
+            if start >= self._mapped_size:
+                self._remap()
+            end = self._mm.find(b"\n", start)
+            try:
+                message = Message.from_record(json.loads(self._mm[start:end]))
+            except (ValueError, KeyError, TypeError):
+                message = Message("assistant", UNREADABLE_CONTENT, ts=0.0)
+            if start in self._revealed:
+                message.flags |= REVEALED
+            self._remember(index, message)
+            return message
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def _remember(self, index, message):
+        self._decoded[index] = message
+        while len(self._decoded) > DECODED_CACHE_SIZE:
+            self._decoded.popitem(last=False)
+
+    def _write_line(self, record):
+        line = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        # Unbuffered O_APPEND write: the position afterwards is the end of our line,
+        # even if another tab for the same household appended in between.
+        with open(self.path, "a+b", buffering=0) as f:
+            if f.seek(0, os.SEEK_END):
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    # Terminate a line torn by an interrupted write rather than gluing our record to it
+                    line = b"\n" + line
+            f.write(line)
+            end = f.tell()
+        self._size = max(self._size, end)
+        return end - len(line.lstrip(b"\n"))
+
+    def append(self, message):
+        with self._lock:
+            start = self._write_line(message.to_record())
+            self._offsets.append(start)
+            self._remember(len(self._offsets) - 1, message)
+
+    def reveal(self, index):
+        """Marks a filtered message as revealed, persisting the change as an appended event."""
+        if index < 0:
+            index += len(self)
+        message = self[index]
+        with self._lock:
+            offset = self._offsets[index]
+            if offset not in self._revealed:
+                self._write_line({"op": "reveal", "offset": offset, "ts": round(time.time(), 3)})
+                self._revealed.add(offset)
+            message.flags |= REVEALED
+
+    def close(self):
+        with self._lock:
+            if self._mm is not None:
+                self._mm.close()
+                self._mm = None
+
+
+def transcript_path(uuid, directory=None):
+    return os.path.join(directory or TRANSCRIPT_DIR, f"{uuid}.jsonl")
+
+
+def open_transcript(uuid, directory=None):
+    return TranscriptLog(transcript_path(uuid, directory))